@@ -0,0 +1,444 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from anomaly_detector import EwmaDetector
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+# ========== ПРАВИЛА ОПОВЕЩЕНИЙ ==========
+# Правило - словарь; набор по умолчанию заменяется JSON-файлом (ALERT_RULES_FILE).
+#   name             - имя правила, оно же alert_type в таблице alerts
+#   kind             - priority | burst | spike | anomaly
+#   title            - заголовок оповещения для клиентов
+#   group_by         - поля проблемы, по которым ведутся отдельные счетчики
+#                      и подавление повторов (например, ["location"])
+#   min_priority     - учитываются проблемы с priority >= min_priority
+#   ignore           - {"поле": [значения]}: такие проблемы правило не видит
+#   suppress_seconds - повтор по той же группе не раньше чем через N секунд
+#   notify           - true: оповещение уходит и в чаты администраторов (Telegram)
+#
+# priority: каждая подходящая проблема
+# burst:    не меньше threshold проблем группы за window_seconds
+# spike:    за window_seconds не меньше min_count проблем группы и в factor раз
+#           больше, чем в среднем за такое же окно в предыдущие baseline_seconds
+# anomaly:  статистически значимый рост: EWMA среднего и дисперсии числа
+#           проблем группы за интервал bucket_seconds (anomaly_detector.py),
+#           срабатывает при z-score >= z_threshold и не меньше min_count
+#           проблем в интервале; новые группы молчат первые warmup_buckets
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {
+        "name": "critical_problem", "kind": "priority", "title": "🚨 КРИТИЧЕСКАЯ ПРОБЛЕМА",
+        "group_by": ["category", "location"], "min_priority": 2, "suppress_seconds": 1800,
+        "notify": True
+    },
+    {
+        "name": "location_burst", "kind": "burst", "title": "📍 МНОГО ОБРАЩЕНИЙ ПО АДРЕСУ",
+        "group_by": ["location"], "threshold": 5, "window_seconds": 600, "min_priority": 1,
+        "ignore": {"location": ["Екатеринбург"]}, "suppress_seconds": 1800
+    },
+    {
+        "name": "category_spike", "kind": "spike", "title": "📈 РЕЗКИЙ РОСТ ПО КАТЕГОРИИ",
+        "group_by": ["category"], "window_seconds": 3600, "baseline_seconds": 86400,
+        "factor": 3.0, "min_count": 10, "ignore": {"category": ["Другое"]}, "suppress_seconds": 3600
+    },
+    {
+        "name": "volume_anomaly", "kind": "anomaly", "title": "📊 АНОМАЛЬНО МНОГО ОБРАЩЕНИЙ",
+        "group_by": ["category", "location"], "bucket_seconds": 900, "half_life_seconds": 3 * 86400,
+        "warmup_buckets": 96, "z_threshold": 4.0, "min_count": 5,
+        "ignore": {"category": ["Другое"]}, "suppress_seconds": 3600, "notify": True
+    },
+]
+
+RULE_KINDS = {
+    "priority": (),
+    "burst": ("threshold", "window_seconds"),
+    "spike": ("window_seconds", "baseline_seconds", "factor", "min_count"),
+    "anomaly": ("bucket_seconds", "z_threshold", "min_count"),
+}
+
+# Начальное среднее детектора аномалий - по дневным агрегатам за столько дней
+ANOMALY_SEED_DAYS = 28
+# Колонка problems_daily для порога min_priority правила
+DAILY_PRIORITY_COLUMNS = {0: "problems", 1: "prio1", 2: "prio2", 3: "prio3"}
+
+
+def load_rules(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Правила из JSON-файла (список словарей) или DEFAULT_RULES; ошибка - ValueError"""
+    if not path:
+        return [dict(rule) for rule in DEFAULT_RULES]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        rules = json.load(f)
+    if not isinstance(rules, list):
+        raise ValueError(f"{path}: ожидается список правил")
+
+    names = set()
+    for rule in rules:
+        kind = rule.get("kind")
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Правило {rule.get('name')}: неизвестный kind {kind}")
+        missing = [key for key in ("name", *RULE_KINDS[kind]) if key not in rule]
+        if missing:
+            raise ValueError(f"Правило {rule.get('name')}: нет полей {', '.join(missing)}")
+        if rule["name"] in names:
+            raise ValueError(f"Правило {rule['name']} описано дважды")
+        names.add(rule["name"])
+    return rules
+
+
+# ========== СКОЛЬЗЯЩИЕ ОКНА ==========
+class SlidingWindowCounter:
+    """
+    Число событий по ключам за последние window секунд.
+
+    Окно разбито на slots корзин: память - не больше slots чисел на ключ,
+    точность границы окна - одна корзина. Ключи без событий в окне
+    удаляются в prune().
+    """
+
+    def __init__(self, window: float, slots: int = 60):
+        self.window = window
+        self.slots = slots
+        self.slot_seconds = window / slots
+        self.buckets: Dict[tuple, Deque[List[int]]] = {}
+        self.totals: Dict[tuple, int] = {}
+
+    def _expire(self, key: tuple, slot: int):
+        buckets = self.buckets[key]
+        while buckets and buckets[0][0] <= slot - self.slots:
+            self.totals[key] -= buckets.popleft()[1]
+
+    def add(self, key: tuple, at: float) -> int:
+        """Учитывает событие в момент at; возвращает число событий ключа в окне"""
+        slot = int(at // self.slot_seconds)
+        buckets = self.buckets.get(key)
+        if buckets is None:
+            buckets = self.buckets[key] = deque()
+            self.totals[key] = 0
+
+        self._expire(key, slot)
+        # Событие из прошлого (часы воркеров) - в последнюю корзину
+        if buckets and buckets[-1][0] >= slot:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([slot, 1])
+        self.totals[key] += 1
+        return self.totals[key]
+
+    def prune(self, at: float):
+        slot = int(at // self.slot_seconds)
+        for key in list(self.buckets):
+            self._expire(key, slot)
+            if not self.buckets[key]:
+                del self.buckets[key]
+                del self.totals[key]
+
+
+class SuppressionCache:
+    """Ключи недавно отправленных оповещений: ttl на каждый ключ, не больше max_entries"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, float]" = OrderedDict()
+
+    def allow(self, key: str, ttl: float, now: float) -> bool:
+        """False, если по ключу уже было оповещение меньше ttl назад; иначе занимает ключ"""
+        expires_at = self.entries.get(key)
+        if expires_at is not None and expires_at > now:
+            return False
+
+        self.entries[key] = now + ttl
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return True
+
+    def prune(self, now: float):
+        for key in [key for key, expires_at in self.entries.items() if expires_at <= now]:
+            del self.entries[key]
+
+
+# ========== ДВИЖОК ОПОВЕЩЕНИЙ ==========
+class AlertEngine:
+    """
+    Оценка правил на потоке записанных проблем.
+
+    observe() вызывается сразу после COMMIT и работает только с памятью:
+    обновляет скользящие окна и решает, какие правила сработали. Отправка
+    (claim общей шины, рассылка клиентам, запись в таблицу alerts) идет
+    отдельными задачами и прием не задерживает.
+
+    Окна заполняются из БД при старте, так что перезапуск не обнуляет
+    счетчики всплесков. С несколькими воркерами каждый видит все проблемы
+    (через общую шину), а claim оставляет одно оповещение на всех.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]], database: Database,
+                 broadcast: Callable[[Dict[str, Any], Optional[Dict[str, Any]]], Awaitable],
+                 claim: Optional[Callable[[str, float], Awaitable[bool]]] = None,
+                 notify: Optional[Callable[[Dict[str, Any]], Awaitable]] = None,
+                 prune_interval: float = 60.0):
+        self.rules = rules
+        self.database = database
+        self.broadcast = broadcast
+        self.claim = claim
+        self.notify = notify
+        self.prune_interval = prune_interval
+
+        self.windows: Dict[str, SlidingWindowCounter] = {}
+        self.baselines: Dict[str, SlidingWindowCounter] = {}
+        self.detectors: Dict[str, EwmaDetector] = {}
+        for rule in rules:
+            if rule["kind"] in ("burst", "spike"):
+                self.windows[rule["name"]] = SlidingWindowCounter(rule["window_seconds"])
+            if rule["kind"] == "spike":
+                self.baselines[rule["name"]] = SlidingWindowCounter(rule["baseline_seconds"], slots=48)
+            if rule["kind"] == "anomaly":
+                self.detectors[rule["name"]] = EwmaDetector(
+                    bucket_seconds=rule["bucket_seconds"],
+                    half_life_seconds=rule.get("half_life_seconds", 3 * 86400),
+                    warmup_buckets=rule.get("warmup_buckets", 96)
+                )
+
+        self.suppressed = SuppressionCache()
+        self.last_prune = time.time()
+        self.tasks: Set[asyncio.Task] = set()
+        self.stats = {"evaluated": 0, "fired": 0, "suppressed": 0, "persisted": 0, "errors": 0}
+
+    # ---------- жизненный цикл ----------
+    async def start(self):
+        """Заполняет окна проблемами за самое длинное окно правил, детекторы - по агрегатам"""
+        for rule in self.rules:
+            if rule["kind"] == "anomaly":
+                await self._seed_detector(rule)
+
+        longest = max([rule.get("baseline_seconds") or rule.get("window_seconds") or 0 for rule in self.rules] or [0])
+        if not longest:
+            return
+
+        rows = await self.database.fetchall('''
+            SELECT created_at, category, location, priority
+            FROM problems
+            WHERE created_at > datetime('now', ?)
+            ORDER BY created_at
+        ''', (f'-{int(longest)} seconds',))
+
+        for created_at, category, location, priority in rows:
+            problem = {"category": category, "location": location, "priority": priority}
+            self._evaluate(problem, self._timestamp(created_at), fire=False)
+        logger.info(f"🚨 Оповещения: {len(self.rules)} правил, окна заполнены {len(rows)} проблемами")
+
+    async def _seed_detector(self, rule: Dict[str, Any]):
+        """Среднее за интервал по problems_daily - без прохода по problems"""
+        fields = list(rule.get("group_by", ()))
+        if not set(fields) <= {"category", "location"}:
+            return
+
+        column = DAILY_PRIORITY_COLUMNS.get(rule.get("min_priority", 0), "problems")
+        select = ", ".join(fields + [f"SUM({column})"])
+        group_by = f"GROUP BY {', '.join(fields)}" if fields else ""
+        rows = await self.database.fetchall(f'''
+            SELECT {select}
+            FROM problems_daily
+            WHERE day >= date('now', ?) AND day < date('now')
+            {group_by}
+        ''', (f'-{ANOMALY_SEED_DAYS} days',))
+
+        detector = self.detectors[rule["name"]]
+        buckets = ANOMALY_SEED_DAYS * 86400 / rule["bucket_seconds"]
+        now = time.time()
+        ignore = rule.get("ignore") or {}
+        for row in rows:
+            values = dict(zip(fields, row))
+            if any(values.get(field) in skip for field, skip in ignore.items()):
+                continue
+            detector.seed(tuple(value or "" for value in row[:-1]), (row[-1] or 0) / buckets, now)
+        logger.info(f"📊 Детектор {rule['name']}: начальное среднее для {len(rows)} групп")
+
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+    @staticmethod
+    def _timestamp(created_at: Optional[str]) -> float:
+        # created_at в БД ставится datetime('now') - это UTC
+        try:
+            return datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+        except (TypeError, ValueError):
+            return time.time()
+
+    # ---------- оценка ----------
+    def observe(self, problems: List[Dict[str, Any]]):
+        now = time.time()
+        for problem in problems:
+            self._evaluate(problem, now, fire=True)
+
+        if now - self.last_prune > self.prune_interval:
+            self.last_prune = now
+            for counter in (*self.windows.values(), *self.baselines.values()):
+                counter.prune(now)
+            self.suppressed.prune(now)
+
+    def _evaluate(self, problem: Dict[str, Any], now: float, fire: bool):
+        self.stats["evaluated"] += fire
+        priority = problem.get("priority") or 0
+
+        for rule in self.rules:
+            if priority < rule.get("min_priority", 0):
+                continue
+            if any(problem.get(field) in values for field, values in (rule.get("ignore") or {}).items()):
+                continue
+
+            group = tuple(problem.get(field) or "" for field in rule.get("group_by", ()))
+            kind = rule["kind"]
+            details = None
+
+            if kind == "burst":
+                count = self.windows[rule["name"]].add(group, now)
+                details = {"count": count}
+                triggered = count >= rule["threshold"]
+            elif kind == "spike":
+                count = self.windows[rule["name"]].add(group, now)
+                baseline = self.baselines[rule["name"]].add(group, now)
+                # Среднее за окно по базовому периоду без самого окна
+                periods = max(1.0, (rule["baseline_seconds"] - rule["window_seconds"]) / rule["window_seconds"])
+                average = (baseline - count) / periods
+                details = {"count": count, "expected": round(average, 2)}
+                triggered = count >= rule["min_count"] and count >= rule["factor"] * max(average, 1.0)
+            elif kind == "anomaly":
+                # История детектора - из агрегатов (start), повторно её не проигрываем
+                if not fire:
+                    continue
+                detector = self.detectors[rule["name"]]
+                count, expected, z = detector.observe(group, now)
+                details = {"count": count, "expected": round(expected, 2), "z": round(z, 1)}
+                triggered = count >= rule["min_count"] and z >= rule["z_threshold"] and detector.is_warm(group)
+            else:
+                triggered = True
+
+            if triggered and fire:
+                self._fire(rule, group, problem, details, now)
+
+    def anomaly_scores(self, rule_name: Optional[str] = None, filters: Optional[Dict[str, str]] = None,
+                       min_z: Optional[float] = None, limit: int = 50) -> Dict[str, Any]:
+        """Текущие z-score групп детектора (по убыванию) для API"""
+        rule = next((rule for rule in self.rules
+                     if rule["kind"] == "anomaly" and rule_name in (None, rule["name"])), None)
+        if rule is None:
+            raise ValueError(f"Нет правила anomaly {rule_name or ''}".strip())
+
+        detector = self.detectors[rule["name"]]
+        fields = list(rule.get("group_by", ()))
+        positions = [(fields.index(field), value) for field, value in (filters or {}).items()
+                     if value and field in fields]
+        keys = [key for key in list(detector.keys) if all(key[i] == value for i, value in positions)]
+
+        scores = [{**dict(zip(fields, score.pop("key"))), **score}
+                  for score in detector.scores(time.time(), keys, limit, min_z)]
+
+        return {
+            "rule": rule["name"],
+            "bucket_minutes": rule["bucket_seconds"] / 60,
+            "z_threshold": rule["z_threshold"],
+            "keys_tracked": len(detector.keys),
+            "scores": scores
+        }
+
+    def _fire(self, rule: Dict[str, Any], group: tuple, problem: Dict[str, Any],
+              details: Optional[Dict[str, Any]], now: float):
+        key = f"alert:{rule['name']}:" + "|".join(group)
+        if not self.suppressed.allow(key, rule.get("suppress_seconds", 1800), now):
+            self.stats["suppressed"] += 1
+            return
+
+        task = asyncio.create_task(self._deliver(rule, key, group, problem, details))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    # ---------- отправка ----------
+    async def _deliver(self, rule: Dict[str, Any], key: str, group: tuple,
+                       problem: Dict[str, Any], details: Optional[Dict[str, Any]]):
+        try:
+            # Общее на все воркеры подавление: отправит тот, кто первым занял ключ
+            if self.claim and not await self.claim(key, rule.get("suppress_seconds", 1800)):
+                self.stats["suppressed"] += 1
+                return
+
+            alert = self.create_alert_message(rule, group, problem, details)
+            topic = {field: value for field, value in zip(rule.get("group_by", ()), group)}
+            topic["priority"] = problem.get("priority") or 0
+
+            await self.broadcast({
+                "type": "alert",
+                "data": alert,
+                "timestamp": datetime.now().isoformat()
+            }, topic)
+            self.stats["fired"] += 1
+            logger.warning(f"🚨 Оповещение {rule['name']}: {' / '.join(group)}")
+
+            await self.database.write(self._insert_alert, problem.get("id"), rule["name"], alert)
+            self.stats["persisted"] += 1
+
+            # Очередь в Telegram: только постановка, отправка идет в фоне
+            if self.notify and rule.get("notify"):
+                await self.notify(alert)
+
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"❌ Ошибка отправки оповещения {rule['name']}: {e}")
+
+    @staticmethod
+    def _insert_alert(conn, problem_id, alert_type: str, alert: Dict[str, Any]):
+        conn.execute(
+            "INSERT INTO alerts (problem_id, alert_type, message, sent_at) VALUES (?, ?, ?, datetime('now'))",
+            (str(problem_id) if problem_id is not None else None, alert_type, json.dumps(alert, ensure_ascii=False))
+        )
+        conn.commit()
+
+    @staticmethod
+    def create_alert_message(rule: Dict[str, Any], group: tuple, problem: Dict[str, Any],
+                             details: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Сообщение оповещения (формат, который ждут клиенты)"""
+        text = (problem.get('text') or '')[:100] + '...'
+        category = problem.get('category', 'Неизвестно')
+        location = problem.get('location', 'Не указано')
+
+        details = details or {}
+        if details:
+            # Оповещение о группе: поля вне group_by у проблем группы разные
+            fields = dict(zip(rule.get("group_by", ()), group))
+            category = fields.get("category", "Разные категории")
+            location = fields.get("location", "Разные адреса")
+            minutes = int((rule.get("window_seconds") or rule["bucket_seconds"]) // 60)
+            summary = f"{details['count']} обращений за {minutes} мин"
+            if "expected" in details:
+                summary += f" при обычных {details['expected']:.1f}"
+            if "z" in details:
+                summary += f" (z = {details['z']:.1f})"
+            text = f"{summary}. Последнее: {text}"
+
+        return {
+            "id": problem.get('id', 'unknown'),
+            "rule": rule["name"],
+            "title": rule.get("title", "🚨 ОПОВЕЩЕНИЕ"),
+            "category": category,
+            "location": location,
+            "priority": problem.get('priority', 0),
+            "count": details.get("count"),
+            "expected": details.get("expected"),
+            "z": details.get("z"),
+            "text": text,
+            "time": datetime.now().strftime('%H:%M'),
+            "actions": [
+                {"label": "Посмотреть на карте", "action": "show_on_map"},
+                {"label": "Отметить как обработанную", "action": "mark_resolved"}
+            ]
+        }
@@ -0,0 +1,116 @@
+import heapq
+import math
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# ========== ПОТОКОВЫЙ ДЕТЕКТОР АНОМАЛИЙ ==========
+# Поток проблем режется на интервалы по bucket_seconds; для каждого ключа
+# (например, категория × локация) хранится EWMA среднего и дисперсии числа
+# проблем за интервал. z-score текущего, еще не закрытого интервала
+# считается на каждой новой проблеме, поэтому всплеск виден сразу, а не в
+# конце интервала. Память на ключ - пять чисел, без истории и без запросов к БД.
+
+
+class EwmaDetector:
+    """
+    EWMA среднего и дисперсии по ключам с периодом полураспада half_life_seconds.
+
+    Пропущенные интервалы без проблем учитываются как нули по закрытой
+    формуле - O(1) при любом перерыве. Ключей не больше max_keys: давно не
+    обновлявшиеся вытесняются первыми.
+    """
+
+    # Слоты состояния ключа
+    BUCKET, COUNT, MEAN, VAR, SEEN = range(5)
+
+    def __init__(self, bucket_seconds: float = 900.0, half_life_seconds: float = 3 * 86400.0,
+                 warmup_buckets: int = 96, min_variance: float = 1.0, max_keys: int = 50000):
+        self.bucket_seconds = bucket_seconds
+        self.alpha = 1 - 0.5 ** (bucket_seconds / half_life_seconds)
+        self.warmup_buckets = warmup_buckets
+        # Нижняя граница дисперсии: редкие ключи (в среднем 0.1 проблемы)
+        # не должны давать z = 40 на одной-двух проблемах
+        self.min_variance = min_variance
+        self.max_keys = max_keys
+        self.keys: "OrderedDict[tuple, List[float]]" = OrderedDict()
+
+    # ---------- обновление ----------
+    def _roll(self, state: List[float], bucket: int) -> List[float]:
+        """Закрывает интервалы до bucket: текущий счетчик и пропуски (нули)"""
+        if bucket <= state[self.BUCKET]:
+            return state
+
+        alpha = self.alpha
+        count, mean, var = state[self.COUNT], state[self.MEAN], state[self.VAR]
+
+        # Закрытый интервал
+        diff = count - mean
+        mean += alpha * diff
+        var = (1 - alpha) * (var + alpha * diff * diff)
+
+        # k интервалов без проблем: mean_k = m·d^k, var_k = d^k·(var + m²·(1 - d^k)), d = 1 - α
+        skipped = bucket - state[self.BUCKET] - 1
+        if skipped > 0:
+            decay = (1 - alpha) ** min(skipped, 100000)
+            var = decay * (var + mean * mean * (1 - decay))
+            mean *= decay
+
+        return [bucket, 0, mean, var, state[self.SEEN] + bucket - state[self.BUCKET]]
+
+    def observe(self, key: tuple, at: float) -> Tuple[int, float, float]:
+        """Учитывает проблему; возвращает (проблем в текущем интервале, ожидаемо, z-score)"""
+        bucket = int(at // self.bucket_seconds)
+        state = self.keys.get(key)
+        if state is None:
+            state = [bucket, 0, 0.0, 0.0, 0]
+        else:
+            state = self._roll(state, bucket)
+            self.keys.move_to_end(key)
+
+        state[self.COUNT] += 1
+        self.keys[key] = state
+        if len(self.keys) > self.max_keys:
+            self.keys.popitem(last=False)
+
+        return int(state[self.COUNT]), state[self.MEAN], self._z(state)
+
+    def seed(self, key: tuple, mean: float, at: float):
+        """Начальное среднее по агрегатам БД (дисперсия - как у Пуассона)"""
+        self.keys[key] = [int(at // self.bucket_seconds), 0, mean, mean, self.warmup_buckets]
+        if len(self.keys) > self.max_keys:
+            self.keys.popitem(last=False)
+
+    # ---------- чтение ----------
+    def _z(self, state: List[float]) -> float:
+        std = math.sqrt(max(state[self.VAR], state[self.MEAN], self.min_variance))
+        return (state[self.COUNT] - state[self.MEAN]) / std
+
+    def is_warm(self, key: tuple) -> bool:
+        state = self.keys.get(key)
+        return state is not None and state[self.SEEN] >= self.warmup_buckets
+
+    def scores(self, at: float, keys: Optional[Iterable[tuple]] = None, limit: Optional[int] = None,
+               min_z: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Ключи с наибольшим z-score на момент at, по убыванию (состояние не меняется)"""
+        bucket = int(at // self.bucket_seconds)
+        candidates = []
+        for key in (keys if keys is not None else list(self.keys)):
+            state = self.keys.get(key)
+            if state is None:
+                continue
+            state = self._roll(state, bucket)
+            z = self._z(state)
+            if min_z is None or z >= min_z:
+                candidates.append((z, key, state))
+
+        top = heapq.nlargest(limit, candidates, key=itemgetter(0)) if limit else \
+            sorted(candidates, key=itemgetter(0), reverse=True)
+        return [{
+            "key": key,
+            "count": int(state[self.COUNT]),
+            "expected": round(state[self.MEAN], 3),
+            "std": round(math.sqrt(max(state[self.VAR], 0.0)), 3),
+            "z": round(z, 2),
+            "warm": state[self.SEEN] >= self.warmup_buckets
+        } for z, key, state in top]
@@ -1,10 +1,11 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Body, Request, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, HTMLResponse
+from fastapi.responses import FileResponse, JSONResponse, HTMLResponse, Response
 from pydantic import BaseModel
 from typing import Optional, Dict, List, Any
 import json
 import os
+import secrets
 import subprocess
 import sys
 from datetime import datetime, timedelta
@@ -16,6 +17,20 @@ import asyncio
 import logging
 from pathlib import Path
 
+from problems_repository import (normalize_problem, normalize_problems, fetch_problems_by_ids, problem_filters,
+                                 encode_cursor, decode_cursor, ProblemCountCache)
+from dashboard_snapshot import DashboardSnapshot
+from database import Database
+from migrations import init_schema
+from rollups import parse_timeframe, window_totals, window_by_category, timeseries, trend_series, TTLCache
+from write_queue import GroupCommitWriter, QueueFullError
+from ws_fanout import FanoutManager, encode_message
+from event_bus import EventBus, StatsDeltaDebouncer, PROBLEMS_COMMITTED
+from pubsub import create_pubsub
+from live_counters import LiveCounters
+from alert_engine import AlertEngine, load_rules
+from telegram_notifier import TelegramNotifier
+
 # Парсер
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -28,10 +43,79 @@ if not DB_PATH:
 
 print(f"📁 Путь к БД: {DB_PATH}")
 
+# Читающих соединений в пуле БД (писатель всегда один)
+DB_READERS = int(os.environ.get('DB_READERS', '4'))
+
+# Сколько секунд живет закэшированный total ленты проблем
+PROBLEM_COUNT_TTL = float(os.environ.get('PROBLEM_COUNT_TTL', '60'))
+
+# Исходящая очередь WebSocket-клиента, таймаут отправки и число
+# переполнений, после которого медленный клиент отключается
+WS_SEND_QUEUE_SIZE = int(os.environ.get('WS_SEND_QUEUE_SIZE', '100'))
+WS_SEND_TIMEOUT = float(os.environ.get('WS_SEND_TIMEOUT', '5'))
+WS_MAX_OVERFLOWS = int(os.environ.get('WS_MAX_OVERFLOWS', '3'))
+
+# permessage-deflate для WebSocket (снимок дашборда сжимается в несколько раз)
+WS_PER_MESSAGE_DEFLATE = os.environ.get('WS_PER_MESSAGE_DEFLATE', '1') not in ('0', 'false', 'no')
+
+# Общая шина для нескольких воркеров uvicorn: local (один процесс),
+# sqlite[:///путь] или redis://host:port/db - см. pubsub.py
+PUBSUB_URL = os.environ.get('PUBSUB_URL', 'local')
+
+# JSON-файл с правилами оповещений (по умолчанию - alert_engine.DEFAULT_RULES)
+ALERT_RULES_FILE = os.environ.get('ALERT_RULES_FILE')
+
+# Дельты статистики клиентам - не чаще раза в N мс
+STATS_DELTA_INTERVAL_MS = float(os.environ.get('STATS_DELTA_INTERVAL_MS', '250'))
+
+# Сколько секунд живет закэшированный ответ /api/trends
+TRENDS_CACHE_TTL = float(os.environ.get('TRENDS_CACHE_TTL', '60'))
+
+# Сверка живых счетчиков (get_stats, /health) с агрегатами в БД, секунд
+LIVE_COUNTERS_RESYNC = float(os.environ.get('LIVE_COUNTERS_RESYNC', '300'))
+
+# Полный пересчет снимка дашборда (между пересчетами он обновляется по мере приема)
+DASHBOARD_REFRESH_INTERVAL = float(os.environ.get('DASHBOARD_REFRESH_INTERVAL', '300'))
+
+# Групповая запись: пачка до N строк или окно в несколько миллисекунд
+WRITE_QUEUE_MAX_BATCH = int(os.environ.get('WRITE_QUEUE_MAX_BATCH', '500'))
+WRITE_QUEUE_MAX_DELAY_MS = float(os.environ.get('WRITE_QUEUE_MAX_DELAY_MS', '5'))
+# Сколько строк может ждать записи; сверх этого прием отвечает 429
+WRITE_QUEUE_CAPACITY = int(os.environ.get('WRITE_QUEUE_CAPACITY', '5000'))
+
 parser_path = os.path.join(PROJECT_ROOT, 'scripts', 'parser.py')
 
+# RUN_PARSER=0 - не запускать парсер (нагрузочные тесты, отладка)
+RUN_PARSER = os.environ.get('RUN_PARSER', '1') not in ('0', 'false', 'no')
+
+
+def acquire_parser_lock() -> bool:
+    """
+    Парсер нужен один на все воркеры uvicorn: его запускает тот процесс,
+    который первым взял блокировку файла (держится до конца процесса)
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return True
+
+    global parser_lock_file
+    os.makedirs(os.path.join(PROJECT_ROOT, 'data'), exist_ok=True)
+    parser_lock_file = open(os.path.join(PROJECT_ROOT, 'data', 'parser.lock'), 'w')
+    try:
+        fcntl.flock(parser_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        parser_lock_file.close()
+        return False
+
+
 # Проверяем существует ли файл
-if os.path.exists(parser_path):
+if not RUN_PARSER:
+    print("ℹ️ Парсер отключен (RUN_PARSER=0)")
+elif os.path.exists(parser_path) and not acquire_parser_lock():
+    print("ℹ️ Парсер уже запущен другим воркером")
+elif os.path.exists(parser_path):
     print(f"✅ Парсер найден: {parser_path}")
     # Запускаем парсер в фоне
     try:
@@ -47,110 +131,37 @@ else:
 # Загружаем переменные окружения
 load_dotenv()
 
+# Оповещения в Telegram: без TELEGRAM_TOKEN выключены. TELEGRAM_API_URL -
+# свой сервер Bot API (например, scripts/fake_telegram_server.py),
+# TELEGRAM_ALERT_CHATS - chat_id через запятую, подписываются при старте
+TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL')
+TELEGRAM_ALERT_CHATS = [int(chat_id) for chat_id in os.environ.get('TELEGRAM_ALERT_CHATS', '').split(',')
+                        if chat_id.strip()]
+# Не чаще раза в N секунд в один чат (накопившееся уходит сводкой) и
+# не больше N сообщений в секунду на бота - лимиты Telegram
+TELEGRAM_CHAT_INTERVAL = float(os.environ.get('TELEGRAM_CHAT_INTERVAL', '3'))
+TELEGRAM_GLOBAL_RATE = float(os.environ.get('TELEGRAM_GLOBAL_RATE', '25'))
+# Общий секрет бота и бэкенда: без него подписки чатов менять нельзя
+TELEGRAM_API_TOKEN = os.environ.get('TELEGRAM_API_TOKEN')
+
 # ========== НАСТРОЙКА ЛОГИРОВАНИЯ ==========
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-# ========== МЕНЕДЖЕР WEBSOCKET СОЕДИНЕНИЙ ==========
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"✅ WebSocket подключен. Всего подключений: {len(self.active_connections)}")
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        logger.info(f"🔌 WebSocket отключен. Осталось подключений: {len(self.active_connections)}")
-
-    async def broadcast(self, message: dict):
-        """Отправка сообщения всем подключенным клиентам"""
-        if not self.active_connections:
-            return
-
-        message_json = json.dumps(message, ensure_ascii=False)
-        disconnected = []
-
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message_json)
-            except Exception as e:
-                logger.warning(f"Ошибка отправки WebSocket: {e}")
-                disconnected.append(connection)
-
-        # Удаляем отключенные соединения
-        for connection in disconnected:
-            self.disconnect(connection)
-
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
-        """Отправка сообщения конкретному клиенту"""
-        try:
-            await websocket.send_json(message)
-        except Exception as e:
-            logger.warning(f"Ошибка отправки персонального сообщения: {e}")
-
-
-manager = ConnectionManager()
-
-
-# ========== СИСТЕМА ОПОВЕЩЕНИЙ ==========
-class AlertSystem:
-    def __init__(self):
-        self.critical_threshold = 2
-        self.last_alert_time = {}
-        logger.info("🚨 Система оповещений инициализирована")
-
-    async def check_and_alert(self, problem_data: Dict[str, Any]):
-        """Проверка и отправка оповещения о критической проблеме"""
-        try:
-            priority = problem_data.get('priority', 0)
-            category = problem_data.get('category', 'unknown')
-            location = problem_data.get('location', 'unknown')
-
-            if priority >= self.critical_threshold:
-                problem_key = f"{category}_{location}"
-                last_time = self.last_alert_time.get(problem_key)
-
-                if not last_time or (datetime.now() - last_time).seconds > 1800:
-                    alert_message = await self.create_alert_message(problem_data)
-
-                    await manager.broadcast({
-                        "type": "alert",
-                        "data": alert_message,
-                        "timestamp": datetime.now().isoformat()
-                    })
-
-                    logger.warning(f"🚨 Отправлено оповещение: {category} - {location}")
-                    self.last_alert_time[problem_key] = datetime.now()
-                    return True
-
-        except Exception as e:
-            logger.error(f"❌ Ошибка в системе оповещений: {e}")
+# ========== ОБЩАЯ ШИНА ВОРКЕРОВ ==========
+bus = create_pubsub(PUBSUB_URL, os.path.join(os.path.dirname(DB_PATH) or '.', 'pubsub.db'))
 
-        return False
-
-    async def create_alert_message(self, problem_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Создание сообщения для оповещения"""
-        return {
-            "id": problem_data.get('id', 'unknown'),
-            "title": "🚨 КРИТИЧЕСКАЯ ПРОБЛЕМА",
-            "category": problem_data.get('category', 'Неизвестно'),
-            "location": problem_data.get('location', 'Не указано'),
-            "priority": problem_data.get('priority', 0),
-            "text": problem_data.get('text', '')[:100] + '...',
-            "time": datetime.now().strftime('%H:%M'),
-            "actions": [
-                {"label": "Посмотреть на карте", "action": "show_on_map"},
-                {"label": "Отметить как обработанную", "action": "mark_resolved"}
-            ]
-        }
 
+# ========== МЕНЕДЖЕР WEBSOCKET СОЕДИНЕНИЙ ==========
+manager = FanoutManager(
+    queue_size=WS_SEND_QUEUE_SIZE,
+    send_timeout=WS_SEND_TIMEOUT,
+    max_overflows=WS_MAX_OVERFLOWS,
+    bus=bus
+)
 
-alert_system = AlertSystem()
 
 # ========== ДОБАВЛЯЕМ ПУТЬ ДЛЯ ИМПОРТА ==========
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -182,47 +193,9 @@ def init_database():
         os.makedirs(os.path.join(PROJECT_ROOT, 'data'), exist_ok=True)
 
         conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS problems (
-                id TEXT PRIMARY KEY,
-                text TEXT NOT NULL,
-                category TEXT,
-                location TEXT,
-                source_type TEXT DEFAULT 'system',
-                sentiment TEXT DEFAULT 'neutral',
-                priority INTEGER DEFAULT 0,
-                status TEXT DEFAULT 'new',
-                metadata TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS websocket_sessions (
-                session_id TEXT PRIMARY KEY,
-                user_agent TEXT,
-                connected_at TIMESTAMP,
-                last_active TIMESTAMP,
-                ip_address TEXT
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS alerts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                problem_id TEXT,
-                alert_type TEXT,
-                message TEXT,
-                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                acknowledged BOOLEAN DEFAULT FALSE
-            )
-        ''')
-
-        conn.commit()
+        version = init_schema(conn)
         conn.close()
-        logger.info("✅ База данных инициализирована")
+        logger.info(f"✅ База данных инициализирована (версия схемы {version})")
 
     except Exception as e:
         logger.error(f"❌ Ошибка инициализации БД: {e}")
@@ -233,6 +206,16 @@ def init_database():
 async def lifespan(app: FastAPI):
     logger.info("🚀 Инициализация Municipal AI Assistant с WebSocket...")
     init_database()
+    db.open()
+
+    # Очередь записи: прием не ждет fsync и не блокирует event loop
+    await write_queue.start()
+    await dashboard.start()
+    await counters.start()
+    await alert_engine.start()
+    await bus.start()
+    await telegram.start(TELEGRAM_ALERT_CHATS)
+    await manager.start()
 
     # Фоновая задача для рассылки обновлений
     asyncio.create_task(broadcast_updates_periodically())
@@ -243,35 +226,37 @@ async def lifespan(app: FastAPI):
 
     yield
 
+    await write_queue.stop()
+    await manager.stop()
+    await telegram.stop()
+    await bus.stop()
+    await alert_engine.stop()
+    await counters.stop()
+    await dashboard.stop()
+    db.close()
     logger.info("🔴 Бэкенд остановлен")
 
 
 # ========== ФОНОВАЯ ЗАДАЧА ==========
 async def broadcast_updates_periodically():
-    """Периодическая рассылка обновлений через WebSocket"""
+    """
+    Периодическая сверка счетчиков за последний час: новые проблемы приходят
+    клиентам дельтами сразу после записи, а это сообщение сдвигает окно
+    "за час" и исправляет накопившееся расхождение. Цифры - из живых
+    счетчиков, без запросов к БД; каждый воркер шлет их только своим клиентам
+    """
     while True:
         try:
             await asyncio.sleep(30)
 
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                SELECT COUNT(*) as total, 
-                       SUM(CASE WHEN priority >= 2 THEN 1 ELSE 0 END) as critical
-                FROM problems 
-                WHERE created_at > datetime('now', '-1 hour')
-            ''')
-
-            stats = cursor.fetchone()
-            conn.close()
+            stats = counters.last_hour()
 
-            if stats and (stats[0] or 0) > 0:
-                await manager.broadcast({
+            if stats["total"] > 0:
+                await manager.broadcast_local({
                     "type": "stats_update",
                     "data": {
-                        "total_last_hour": stats[0] or 0,
-                        "critical_last_hour": stats[1] or 0,
+                        "total_last_hour": stats["total"],
+                        "critical_last_hour": stats["critical"],
                         "timestamp": datetime.now().isoformat()
                     }
                 })
@@ -322,23 +307,38 @@ async def websocket_endpoint(websocket: WebSocket):
                     "timestamp": datetime.now().isoformat()
                 }, websocket)
 
-            elif data.get("type") == "get_stats":
-                conn = sqlite3.connect(DB_PATH)
-                cursor = conn.cursor()
-
-                cursor.execute('SELECT COUNT(*) FROM problems')
-                total = cursor.fetchone()[0]
-
-                cursor.execute('SELECT COUNT(*) FROM problems WHERE priority >= 2')
-                critical = cursor.fetchone()[0]
-
-                conn.close()
+            elif data.get("type") in ("subscribe", "unsubscribe"):
+                # Фильтр событий: категории, локации (районы), порог приоритета.
+                # unsubscribe - снова все события
+                try:
+                    request = data if data["type"] == "subscribe" else {}
+                    subscription = manager.subscribe(websocket, request)
+                    await manager.send_personal_message({
+                        "type": "subscribed",
+                        "filter": subscription
+                    }, websocket)
+                except ValueError as e:
+                    await manager.send_personal_message({
+                        "type": "error",
+                        "message": str(e)
+                    }, websocket)
+
+            elif data.get("type") == "get_dashboard":
+                # Снимок уже сериализован - вставляем байты как есть
+                if dashboard.payload is None:
+                    await dashboard.refresh()
+                manager.send_encoded(
+                    websocket, "dashboard",
+                    '{"type":"dashboard","data":' + dashboard.payload.decode('utf-8') + '}'
+                )
 
+            elif data.get("type") == "get_stats":
+                # Из живых счетчиков - без запросов к БД
                 await manager.send_personal_message({
                     "type": "current_stats",
                     "data": {
-                        "total": total or 0,
-                        "critical": critical or 0,
+                        "total": counters.total,
+                        "critical": counters.critical,
                         "updated": datetime.now().isoformat()
                     }
                 }, websocket)
@@ -360,9 +360,15 @@ async def root():
         "system": "Обработка новостей и AI-анализ",
         "endpoints": {
             "system_report": "/api/system_report (POST) - для системных данных",
+            "system_report_batch": "/api/system_report/batch (POST) - пакетная загрузка",
             "get_problems": "/api/problems (GET) - все проблемы",
             "get_stats": "/api/stats (GET) - статистика",
+            "get_stats_timeseries": "/api/stats/timeseries (GET) - ряд по часам/дням",
+            "get_trends": "/api/trends (GET) - тренды по категориям и локациям",
             "get_clusters": "/api/clusters (GET) - кластеры проблем",
+            "get_alerts": "/api/alerts (GET) - последние оповещения",
+            "get_anomalies": "/api/anomalies (GET) - z-score потока по категориям и локациям",
+            "telegram_subscriptions": "/api/telegram/subscriptions (GET, POST, DELETE) - чаты для оповещений",
             "websocket": "/ws - real-time обновления",
             "health": "/health - проверка работы"
         }
@@ -375,47 +381,197 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "websocket_connections": len(manager.active_connections),
+        "websocket_fanout": manager.snapshot(),
+        "pubsub": {"backend": bus.name, **bus.stats},
+        "counters": counters.snapshot(),
+        "alerts": alert_engine.stats,
+        "telegram": telegram.snapshot(),
         "database": "connected" if os.path.exists(DB_PATH) else "not_found",
-        "ai_module": "loaded" if AI_MODULE_LOADED else "stub"
+        "ai_module": "loaded" if AI_MODULE_LOADED else "stub",
+        "write_queue": {**write_queue.stats, "depth": write_queue.depth, "capacity": write_queue.capacity}
     }
 
 
+# ========== ЖИВЫЕ ОБНОВЛЕНИЯ ПОСЛЕ ЗАПИСИ ==========
+# Очередь записи после COMMIT вызывает on_problems_ingested. Записанные
+# проблемы уходят в общую шину - по ней кэши обновляет каждый воркер, - и
+# в локальную шину событий: её подписчики рассылают проблемы, дельты
+# статистики и оповещения клиентам всех воркеров (через manager.broadcast)
+# через миллисекунды после записи, без опроса API
+PROBLEMS_CHANNEL = "problems"
+events = EventBus()
+
+
+async def on_problems_ingested(problems: List[Dict[str, Any]]):
+    # Сначала рассылка проблем, затем кэши и правила: оповещение не
+    # обгоняет problem_created, на который ссылается
+    events.publish(PROBLEMS_COMMITTED, problems)
+    await bus.publish(PROBLEMS_CHANNEL, encode_message(problems))
+
+
+def update_caches(payload: str):
+    """
+    Новые проблемы любого воркера - в счетчики и снимок дашборда этого и в
+    окна правил оповещений (их видят все воркеры, отправит один)
+    """
+    problems = json.loads(payload)
+    problem_counts.add_problems(problems)
+    counters.add_problems(problems)
+    dashboard.add_problems(problems)
+    alert_engine.observe(problems)
+
+
+bus.subscribe(PROBLEMS_CHANNEL, update_caches)
+
+
+async def push_problems_created(problems: List[Dict[str, Any]]):
+    """Каждая новая проблема - сообщение problem_created"""
+    timestamp = datetime.now().isoformat()
+    for problem in problems:
+        await manager.broadcast({
+            "type": "problem_created",
+            "data": {
+                "id": problem.get("id"),
+                "text": problem.get("text", ""),
+                "category": problem.get("category"),
+                "location": problem.get("location"),
+                "sentiment": problem.get("sentiment"),
+                "priority": problem.get("priority", 0)
+            },
+            "timestamp": timestamp
+        }, topic=problem)
+
+
+async def push_stats_delta(delta: Dict[str, Any]):
+    await manager.broadcast({
+        "type": "stats_delta",
+        "data": delta,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+stats_deltas = StatsDeltaDebouncer(push_stats_delta, interval=STATS_DELTA_INTERVAL_MS / 1000)
+
+events.subscribe(PROBLEMS_COMMITTED, push_problems_created)
+events.subscribe(PROBLEMS_COMMITTED, stats_deltas.add)
+
+
 # ========== СИСТЕМНЫЙ ЭНДПОИНТ ==========
+db = Database(DB_PATH, readers=DB_READERS)
+
+# Счетчики для total в /api/problems
+problem_counts = ProblemCountCache(ttl=PROBLEM_COUNT_TTL)
+
+# Ответы /api/trends: агрегаты меняются медленно, одинаковые графики
+# запрашивают многие клиенты
+trends_cache = TTLCache(ttl=TRENDS_CACHE_TTL)
+
+# Готовый ответ /api/dashboard
+dashboard = DashboardSnapshot(db, refresh_interval=DASHBOARD_REFRESH_INTERVAL)
+
+counters = LiveCounters(db, resync_interval=LIVE_COUNTERS_RESYNC)
+
+# ========== СИСТЕМА ОПОВЕЩЕНИЙ ==========
+# Правила оцениваются на потоке записанных проблем (см. update_caches);
+# правила с notify дополнительно уходят в Telegram через очередь отправки
+telegram = TelegramNotifier(db, TELEGRAM_TOKEN, api_url=TELEGRAM_API_URL, chat_interval=TELEGRAM_CHAT_INTERVAL,
+                            global_rate=TELEGRAM_GLOBAL_RATE, claim=bus.claim)
+alert_engine = AlertEngine(load_rules(ALERT_RULES_FILE), db, broadcast=manager.broadcast, claim=bus.claim,
+                           notify=telegram.enqueue)
+
+write_queue = GroupCommitWriter(
+    db,
+    on_commit=on_problems_ingested,
+    max_batch=WRITE_QUEUE_MAX_BATCH,
+    max_delay=WRITE_QUEUE_MAX_DELAY_MS / 1000,
+    capacity=WRITE_QUEUE_CAPACITY
+)
+
+
+def queue_full_response(error: QueueFullError) -> JSONResponse:
+    """429 с Retry-After: интеграционный слой подождет и повторит"""
+    logger.warning(f"⏳ Прием приостановлен: {error}")
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(error), "retry_after": error.retry_after},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
 @app.post("/api/system_report")
-async def system_report(data: dict):
-    """ИСПРАВЛЕННЫЙ прием данных от интеграционного слоя"""
+async def system_report(data: dict, wait_for_commit: bool = False):
+    """
+    Прием данных от интеграционного слоя.
+    Строка ставится в очередь групповой записи; с wait_for_commit=true
+    ответ приходит после COMMIT и содержит id записи.
+    """
     try:
-        conn = sqlite3.connect(DB_PATH, timeout=30)  # Увеличиваем таймаут
-        cursor = conn.cursor()
-
         # Проверяем и преобразуем данные
-        text = data.get("text", "")[:1000]
-        category = data.get("category", "Другое")
-        location = data.get("location", "Екатеринбург")
-        sentiment = data.get("sentiment", "neutral")
-        priority = data.get("priority", 0)
-        metadata = data.get("metadata", "{}")
-
-        # Преобразуем priority в int
-        try:
-            priority = int(priority)
-        except:
-            priority = 0
+        problem = normalize_problem(data)
+        problem_id = await write_queue.submit(problem, wait_for_commit)
+
+        logger.info(f"✅ system_report: {problem['category']} - {problem['location']}")
+        if wait_for_commit:
+            return {"status": "success", "message": "Данные сохранены", "id": problem_id}
+        return {"status": "success", "message": "Данные приняты"}
+
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Ошибка в system_report: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"detail": str(e)}
+        )
 
-        # Вставляем данные
-        cursor.execute('''
-            INSERT INTO problems (text, category, location, sentiment, priority, metadata, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
-        ''', (text, category, location, sentiment, priority, metadata))
 
-        conn.commit()
-        conn.close()
+@app.post("/api/system_report/batch")
+async def system_report_batch(payload: Any = Body(...), wait_for_commit: bool = False):
+    """
+    Пакетный прием: массив проблем уходит в очередь групповой записи одним куском.
+    С wait_for_commit=true ответ приходит после COMMIT и saved - число записанных строк
+    """
+    problems = payload.get("problems") if isinstance(payload, dict) else payload
+    if not isinstance(problems, list):
+        raise HTTPException(status_code=422, detail="Ожидается массив проблем или {\"problems\": [...]}")
+
+    try:
+        rows, rejected = normalize_problems(problems)
+        ids = await write_queue.submit_many(rows, wait_for_commit)
 
-        logger.info(f"✅ system_report: {category} - {location}")
-        return {"status": "success", "message": "Данные сохранены"}
+        # С wait_for_commit saved - строки, прошедшие COMMIT; без него - принятые в очередь
+        failed = sum(1 for problem_id in ids if problem_id is None)
+        logger.info(f"✅ system_report/batch: принято {len(rows)} проблем")
+        return {"status": "success", "saved": len(rows) - failed, "rejected": rejected, "failed": failed}
 
+    except QueueFullError as e:
+        return queue_full_response(e)
     except Exception as e:
-        logger.error(f"❌ Ошибка в system_report: {e}")
+        logger.error(f"❌ Ошибка в system_report/batch: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"detail": str(e)}
+        )
+
+
+@app.post("/api/ingest_notify")
+async def ingest_notify(payload: dict):
+    """
+    Уведомление от интеграционного слоя, который записал проблемы
+    напрямую в БД (INGEST_SINK=direct): рассылаем их как обычный прием
+    """
+    ids = [int(i) for i in payload.get("ids", []) if str(i).isdigit()]
+
+    try:
+        problems = await db.read(fetch_problems_by_ids, ids)
+
+        await on_problems_ingested(problems)
+        return {"status": "success", "notified": len(problems)}
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка в ingest_notify: {e}")
         return JSONResponse(
             status_code=500,
             content={"detail": str(e)}
@@ -430,63 +586,57 @@ async def get_problems(
         offset: int = 0,
         category: str = None,
         priority: int = None,
-        last_hours: int = None
+        last_hours: int = None,
+        cursor: str = None,
+        with_total: bool = True
 ):
-    """УЛУЧШЕННЫЙ API с фильтрами"""
+    """
+    Лента проблем с фильтрами.
+    Постранично - через cursor из next_cursor предыдущего ответа: любая страница
+    стоит как первая. offset оставлен для старых клиентов.
+    """
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        where, params = problem_filters(category, priority, last_hours)
+        page_where, page_params = where, list(params)
 
-        # Базовый запрос с фильтрами
-        query = '''
+        if cursor:
+            page_where += ' AND (priority, created_at, id) < (?, ?, ?)'
+            page_params.extend(after)
+
+        # Сортировка и пагинация: id замыкает порядок, курсор однозначен
+        query = f'''
             SELECT id, text, category, location, sentiment, priority, metadata, created_at
             FROM problems 
-            WHERE category != 'Другое'
+            WHERE {page_where}
+            ORDER BY priority DESC, created_at DESC, id DESC
+            LIMIT ?
         '''
-        params = []
-
-        # Добавляем фильтры
-        if category and category != 'all':
-            query += ' AND category = ?'
-            params.append(category)
-
-        if priority is not None:
-            query += ' AND priority >= ?'
-            params.append(priority)
-
-        if last_hours:
-            query += ' AND created_at > datetime(?, ?)'
-            params.append('now')
-            params.append(f'-{last_hours} hours')
-
-        # Сортировка и пагинация
-        query += ' ORDER BY priority DESC, created_at DESC LIMIT ? OFFSET ?'
-        params.extend([limit, offset])
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-
-        # Считаем общее количество с теми же фильтрами
-        count_query = 'SELECT COUNT(*) FROM problems WHERE category != "Другое"'
-        count_params = []
-
-        if category and category != 'all':
-            count_query += ' AND category = ?'
-            count_params.append(category)
-
-        if priority is not None:
-            count_query += ' AND priority >= ?'
-            count_params.append(priority)
-
-        if last_hours:
-            count_query += ' AND created_at > datetime(?, ?)'
-            count_params.append('now')
-            count_params.append(f'-{last_hours} hours')
-
-        cursor.execute(count_query, count_params)
-        total = cursor.fetchone()[0]
-
-        conn.close()
+        page_params.append(limit)
+        if offset and not cursor:
+            query += ' OFFSET ?'
+            page_params.append(offset)
+
+        rows = await db.fetchall(query, page_params)
+
+        # Общее количество - из кэша счетчиков по фильтрам
+        total = None
+        if with_total:
+            count_key = problem_counts.key(category, priority, last_hours)
+            total = problem_counts.get(count_key)
+            if total is None:
+                total = (await db.fetchone(f'SELECT COUNT(*) FROM problems WHERE {where}', params))[0]
+                problem_counts.set(count_key, total)
+
+        next_cursor = None
+        if rows and len(rows) == limit:
+            last = rows[-1]
+            next_cursor = encode_cursor(last[5], last[7], last[0])
 
         # Форматирование ответа
         problems = []
@@ -528,6 +678,7 @@ async def get_problems(
             "problems": problems,
             "count": len(problems),
             "total": total,
+            "next_cursor": next_cursor,
             "filters": {
                 "category": category,
                 "priority": priority,
@@ -542,62 +693,30 @@ async def get_problems(
 
 @app.get("/api/stats")
 async def get_stats(timeframe: str = "24h"):
-    """Получение статистики"""
+    """
+    Получение статистики за окно: 24h, 7d, 30d, 90d, 12w...
+    Итоги и категории - из почасовых агрегатов, без прохода по problems
+    """
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        if timeframe == "24h":
-            time_filter = "datetime('now', '-1 day')"
-        elif timeframe == "7d":
-            time_filter = "datetime('now', '-7 days')"
-        else:
-            time_filter = "datetime('now', '-1 day')"
-
-        cursor.execute(f'''
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN priority >= 2 THEN 1 ELSE 0 END) as critical,
-                AVG(priority) as avg_priority
-            FROM problems 
-            WHERE created_at > {time_filter}
-        ''')
-
-        stats_row = cursor.fetchone()
-
-        cursor.execute(f'''
-            SELECT category, COUNT(*) as count
-            FROM problems 
-            WHERE created_at > {time_filter}
-            GROUP BY category
-            ORDER BY count DESC
-            LIMIT 10
-        ''')
-
-        categories = cursor.fetchall()
+        hours = parse_timeframe(timeframe)
+        totals = await window_totals(db, hours)
+        categories = await window_by_category(db, hours, limit=10)
 
         # Получаем последние критические проблемы
-        cursor.execute(f'''
+        critical_issues = await db.fetchall('''
             SELECT text, category, location, priority, created_at
             FROM problems 
-            WHERE priority >= 2 AND created_at > {time_filter}
+            WHERE priority >= 2 AND created_at > datetime('now', ?)
             ORDER BY priority DESC, created_at DESC
             LIMIT 5
-        ''')
-
-        critical_issues = cursor.fetchall()
-
-        conn.close()
+        ''', (f'-{hours} hours',))
 
         return {
             "timeframe": timeframe,
-            "total": stats_row[0] or 0,
-            "critical": stats_row[1] or 0,
-            "avg_priority": round(float(stats_row[2] or 0), 2),
-            "by_category": [
-                {"category": cat[0], "count": cat[1]}
-                for cat in categories
-            ],
+            "total": totals["total"],
+            "critical": totals["critical"],
+            "avg_priority": totals["avg_priority"],
+            "by_category": categories,
             "critical_issues": [
                 {
                     "text": issue[0][:100] + "..." if len(issue[0]) > 100 else issue[0],
@@ -624,19 +743,172 @@ async def get_stats(timeframe: str = "24h"):
         }
 
 
+@app.get("/api/stats/timeseries")
+async def get_stats_timeseries(timeframe: str = "7d", bucket: str = "hour", category: str = None):
+    """Ряд по часам или дням для графиков - из почасовых агрегатов"""
+    if bucket not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="bucket: hour или day")
+
+    try:
+        hours = parse_timeframe(timeframe)
+        series = await timeseries(db, hours, bucket, category)
+        return {
+            "timeframe": timeframe,
+            "bucket": bucket,
+            "category": category,
+            "series": series,
+            "updated": datetime.now().isoformat()
+        }
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка получения ряда статистики: {e}")
+        return {"timeframe": timeframe, "bucket": bucket, "series": [], "error": str(e)}
+
+
+def split_list(value: Optional[str]) -> List[str]:
+    """'ЖКХ,Дороги' -> ['ЖКХ', 'Дороги']"""
+    return sorted({item.strip() for item in (value or '').split(',') if item.strip()})
+
+
+@app.get("/api/trends")
+async def get_trends(timeframe: str = "30d", bucket: str = "day", categories: str = None,
+                     locations: str = None, min_priority: int = 0, split_by: str = "category"):
+    """
+    Ряды числа проблем по часам, дням или неделям с разбивкой по категориям
+    и/или локациям - из дневных и почасовых агрегатов
+    """
+    hours = parse_timeframe(timeframe)
+    category_list, location_list = split_list(categories), split_list(locations)
+    key = (hours, bucket, tuple(category_list), tuple(location_list), min_priority, split_by)
+
+    cached = trends_cache.get(key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    try:
+        trends = await trend_series(db, hours, bucket, category_list, location_list, min_priority, split_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    payload = json.dumps({
+        "timeframe": timeframe,
+        "bucket": bucket,
+        "split_by": split_by,
+        "min_priority": min_priority,
+        **trends,
+        "updated": datetime.now().isoformat()
+    }, ensure_ascii=False).encode('utf-8')
+    trends_cache.set(key, payload)
+    return Response(content=payload, media_type="application/json")
+
+
+@app.get("/api/alerts")
+async def get_alerts(limit: int = 50, alert_type: Optional[str] = None):
+    """Последние оповещения движка правил (таблица alerts)"""
+    limit = max(1, min(limit, 500))
+    try:
+        if alert_type:
+            rows = await db.fetchall(
+                'SELECT id, problem_id, alert_type, message, sent_at, acknowledged FROM alerts '
+                'WHERE alert_type = ? ORDER BY id DESC LIMIT ?', (alert_type, limit))
+        else:
+            rows = await db.fetchall(
+                'SELECT id, problem_id, alert_type, message, sent_at, acknowledged FROM alerts '
+                'ORDER BY id DESC LIMIT ?', (limit,))
+
+        alerts = []
+        for row in rows:
+            try:
+                message = json.loads(row[3]) if row[3] else None
+            except json.JSONDecodeError:
+                message = row[3]
+            alerts.append({
+                "id": row[0],
+                "problem_id": row[1],
+                "alert_type": row[2],
+                "message": message,
+                "sent_at": row[4],
+                "acknowledged": bool(row[5])
+            })
+
+        return {"alerts": alerts, "count": len(alerts)}
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка получения оповещений: {e}")
+        return {"alerts": [], "count": 0, "error": str(e)}
+
+
+@app.get("/api/anomalies")
+async def get_anomalies(category: Optional[str] = None, location: Optional[str] = None,
+                        min_z: Optional[float] = None, limit: int = 20, rule: Optional[str] = None):
+    """
+    Текущие z-score числа проблем по группам (категория × локация) из
+    потокового детектора - считаются в памяти, без запросов к БД
+    """
+    try:
+        result = alert_engine.anomaly_scores(
+            rule, {"category": category, "location": location}, min_z, max(1, min(limit, 500))
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return {**result, "timestamp": datetime.now().isoformat()}
+
+
+class TelegramSubscription(BaseModel):
+    chat_id: int
+    title: Optional[str] = None
+
+
+@app.get("/api/telegram/subscriptions")
+async def get_telegram_subscriptions():
+    """Чаты, подписанные на оповещения, и очередь отправки"""
+    rows = await db.fetchall('''
+        SELECT s.chat_id, s.title, s.active, s.created_at,
+               (SELECT COUNT(*) FROM telegram_outbox o WHERE o.chat_id = s.chat_id AND o.status = 'pending')
+        FROM telegram_subscriptions s
+        ORDER BY s.created_at
+    ''')
+    return {
+        "subscriptions": [{"chat_id": row[0], "title": row[1], "active": bool(row[2]),
+                           "created_at": row[3], "pending": row[4]} for row in rows],
+        "telegram": telegram.snapshot()
+    }
+
+
+def require_telegram_api_token(x_api_token: Optional[str] = Header(None)):
+    """Подписки меняет только бот: заголовок X-Api-Token = TELEGRAM_API_TOKEN.
+    Если токен в окружении не задан, изменения запрещены всем"""
+    if not TELEGRAM_API_TOKEN:
+        raise HTTPException(status_code=403, detail="TELEGRAM_API_TOKEN не задан, подписки изменять нельзя")
+    if not x_api_token or not secrets.compare_digest(x_api_token, TELEGRAM_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Неверный X-Api-Token")
+
+
+@app.post("/api/telegram/subscriptions", dependencies=[Depends(require_telegram_api_token)])
+async def add_telegram_subscription(subscription: TelegramSubscription):
+    await telegram.subscribe(subscription.chat_id, subscription.title)
+    return {"status": "subscribed", "chat_id": subscription.chat_id, "enabled": telegram.enabled}
+
+
+@app.delete("/api/telegram/subscriptions/{chat_id}", dependencies=[Depends(require_telegram_api_token)])
+async def delete_telegram_subscription(chat_id: int):
+    await telegram.unsubscribe(chat_id)
+    return {"status": "unsubscribed", "chat_id": chat_id}
+
+
 @app.get("/api/clusters")
 async def get_clusters():
     """Получение кластеризованных проблем"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # Кластеры по категории и местоположению
-        cursor.execute('''
+        # Кластеры по категории и местоположению. unlikely() подсказывает
+        # планировщику, что окно в 7 дней узкое: иначе он обходит весь индекс
+        # по location, лишь бы не сортировать группы
+        rows = await db.fetchall('''
             SELECT category, location, COUNT(*) as frequency,
                    GROUP_CONCAT(text, ' || ') as examples
             FROM problems 
-            WHERE created_at > datetime('now', '-7 days')
+            WHERE unlikely(created_at > datetime('now', '-7 days'))
             GROUP BY category, location
             HAVING COUNT(*) > 1
             ORDER BY COUNT(*) DESC
@@ -644,7 +916,7 @@ async def get_clusters():
         ''')
 
         clusters = []
-        for row in cursor.fetchall():
+        for row in rows:
             examples = row[3].split(' || ')[:3] if row[3] else []
             severity = min(3, row[2] // 2 + 1)
 
@@ -658,8 +930,6 @@ async def get_clusters():
                 "icon": ["🟢", "🟡", "🔴", "⚫"][severity - 1] if severity <= 3 else "⚪"
             })
 
-        conn.close()
-
         return {
             "clusters": clusters,
             "count": len(clusters),
@@ -823,105 +1093,18 @@ async def view_report(filename: str):
 
 
 @app.get("/api/dashboard")
-async def get_dashboard_data():
-    """Все данные для дашборда в одном запросе"""
+async def get_dashboard_data(request: Request):
+    """Все данные для дашборда в одном запросе - готовый снимок из памяти"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # 1. ОБЩАЯ СТАТИСТИКА
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN priority >= 3 THEN 1 ELSE 0 END) as urgent,
-                SUM(CASE WHEN created_at > datetime('now', '-1 day') THEN 1 ELSE 0 END) as last_24h
-            FROM problems 
-            WHERE category != 'Другое'
-        """)
-
-        stats_row = cursor.fetchone()
-        stats = {
-            "total": stats_row[0] or 0,
-            "urgent": stats_row[1] or 0,
-            "last_24h": stats_row[2] or 0,
-            "last_update": datetime.now().strftime("%H:%M")
-        }
-
-        # 2. РАСПРЕДЕЛЕНИЕ ПО КАТЕГОРИЯМ (последние 7 дней)
-        cursor.execute("""
-            SELECT category, COUNT(*) as count,
-                   SUM(CASE WHEN priority >= 3 THEN 1 ELSE 0 END) as urgent_count
-            FROM problems 
-            WHERE created_at > datetime('now', '-7 days')
-            AND category != 'Другое'
-            GROUP BY category
-            ORDER BY count DESC
-            LIMIT 8
-        """)
-
-        categories = []
-        for row in cursor.fetchall():
-            categories.append({
-                "name": row[0],
-                "count": row[1],
-                "urgent": row[2]
-            })
-
-        # 3. ПОСЛЕДНИЕ ИНЦИДЕНТЫ (высокий приоритет)
-        cursor.execute("""
-            SELECT id, text, category, location, priority, 
-                   strftime('%H:%M', created_at) as time,
-                   strftime('%d.%m', created_at) as date
-            FROM problems 
-            WHERE priority >= 2
-            AND category != 'Другое'
-            ORDER BY created_at DESC
-            LIMIT 15
-        """)
-
-        incidents = []
-        for row in cursor.fetchall():
-            incidents.append({
-                "id": row[0],
-                "text": (row[1][:120] + "...") if len(row[1]) > 120 else row[1],
-                "category": row[2],
-                "location": row[3],
-                "priority": row[4],
-                "time": row[5],
-                "date": row[6],
-                "badge": "🚨" if row[4] >= 3 else "⚠️",
-                "status": "critical" if row[4] >= 3 else "warning"
-            })
-
-        # 4. ТОП ПРОБЛЕМНЫХ ЛОКАЦИЙ
-        cursor.execute("""
-            SELECT location, COUNT(*) as problem_count
-            FROM problems 
-            WHERE location != 'Екатеринбург'
-            AND category != 'Другое'
-            GROUP BY location
-            HAVING problem_count > 1
-            ORDER BY problem_count DESC
-            LIMIT 5
-        """)
-
-        hotspots = []
-        for row in cursor.fetchall():
-            hotspots.append({
-                "location": row[0],
-                "count": row[1]
-            })
-
-        conn.close()
-
-        return {
-            "status": "success",
-            "stats": stats,
-            "categories": categories,
-            "incidents": incidents,
-            "hotspots": hotspots,
-            "timestamp": datetime.now().isoformat()
-        }
+        if dashboard.payload is None:
+            await dashboard.refresh()
+        if 'gzip' in request.headers.get('accept-encoding', ''):
+            return Response(
+                content=dashboard.payload_gzip,
+                media_type="application/json",
+                headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+            )
+        return Response(content=dashboard.payload, media_type="application/json", headers={"Vary": "Accept-Encoding"})
 
     except Exception as e:
         logger.error(f"❌ Ошибка в get_dashboard_data: {e}")
@@ -954,5 +1137,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=False,
-        log_level="info"
+        log_level="info",
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE
     )
\ No newline at end of file
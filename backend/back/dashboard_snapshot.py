@@ -0,0 +1,242 @@
+import asyncio
+import gzip
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+EXCLUDED_CATEGORY = 'Другое'
+DEFAULT_LOCATION = 'Екатеринбург'
+
+TOP_CATEGORIES = 8
+TOP_INCIDENTS = 15
+TOP_HOTSPOTS = 5
+
+
+# ========== СНИМОК ДАШБОРДА ==========
+class DashboardSnapshot:
+    """
+    Готовый ответ /api/dashboard в памяти, уже сериализованный в JSON.
+
+    Полный пересчет (четыре агрегата по таблице) выполняется при старте и раз
+    в refresh_interval секунд - он же сдвигает окна "24 часа" и "7 дней".
+    Между пересчетами новые проблемы добавляются в счетчики по одной
+    (add_problems), так что запрос дашборда - это просто отдача байтов.
+
+    Как в LiveCounters: пересчет читает один снимок БД вместе с MAX(id), и
+    проблемы с id не больше него уже учтены в агрегатах. Пришедшие во время
+    пересчета запоминаются и после него добавляются заново, если они новее
+    снимка.
+    """
+
+    def __init__(self, database: Database, refresh_interval: float = 300.0):
+        self.database = database
+        self.refresh_interval = refresh_interval
+
+        self.total = 0
+        self.urgent = 0
+        self.last_24h = 0
+        self.categories: Dict[str, Dict[str, int]] = {}
+        self.incidents: List[Dict[str, Any]] = []
+        self.locations: Dict[str, int] = {}
+
+        # id последней проблемы, учтенной пересчетом
+        self.last_id = 0
+        self.refreshing = False
+        self.arrived_during_refresh: List[Dict[str, Any]] = []
+
+        self.payload: Optional[bytes] = None
+        self.payload_gzip: Optional[bytes] = None
+        self.refreshed_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+
+    # ---------- жизненный цикл ----------
+    async def start(self):
+        await self.refresh()
+        self.task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"❌ Ошибка пересчета дашборда: {e}")
+
+    # ---------- полный пересчет ----------
+    async def refresh(self):
+        """Пересчитывает все блоки дашборда запросами к БД"""
+        async with self.lock:
+            self.refreshing = True
+            try:
+                rows = await self.database.read(self._query_snapshot)
+            finally:
+                self.refreshing = False
+                arrived, self.arrived_during_refresh = self.arrived_during_refresh, []
+
+            last_id, stats_row, category_rows, incident_rows, location_rows = rows
+            self.last_id = last_id
+            self.total = stats_row[0] or 0
+            self.urgent = stats_row[1] or 0
+            self.last_24h = stats_row[2] or 0
+            self.categories = {row[0]: {"count": row[1], "urgent": row[2] or 0} for row in category_rows}
+            self.incidents = [self._incident(*row) for row in incident_rows]
+            self.locations = {row[0]: row[1] for row in location_rows}
+
+            # Пришедшие во время запросов: те, что позже снимка, добавляем заново
+            self._count(arrived)
+
+            self.refreshed_at = datetime.now()
+            self._render()
+
+    @staticmethod
+    def _query_snapshot(conn):
+        """Все агрегаты и MAX(id) в одной читающей транзакции - один снимок БД"""
+        conn.execute("BEGIN")
+        try:
+            last_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM problems").fetchone()[0]
+
+            stats_row = conn.execute("""
+                SELECT
+                    COUNT(*) as total,
+                    SUM(CASE WHEN priority >= 3 THEN 1 ELSE 0 END) as urgent,
+                    SUM(CASE WHEN created_at > datetime('now', '-1 day') THEN 1 ELSE 0 END) as last_24h
+                FROM problems
+                WHERE category != 'Другое'
+            """).fetchone()
+
+            category_rows = conn.execute("""
+                SELECT category, COUNT(*) as count,
+                       SUM(CASE WHEN priority >= 3 THEN 1 ELSE 0 END) as urgent_count
+                FROM problems
+                WHERE created_at > datetime('now', '-7 days')
+                AND category != 'Другое'
+                GROUP BY category
+            """).fetchall()
+
+            incident_rows = conn.execute("""
+                SELECT id, text, category, location, priority,
+                       strftime('%H:%M', created_at) as time,
+                       strftime('%d.%m', created_at) as date
+                FROM problems
+                WHERE priority >= 2
+                AND category != 'Другое'
+                ORDER BY created_at DESC
+                LIMIT 15
+            """).fetchall()
+
+            # Все локации, а не топ-5: иначе новая проблема не сможет вывести
+            # локацию в топ между пересчетами
+            location_rows = conn.execute("""
+                SELECT location, COUNT(*) as problem_count
+                FROM problems
+                WHERE location != 'Екатеринбург'
+                AND category != 'Другое'
+                GROUP BY location
+            """).fetchall()
+        finally:
+            conn.execute("COMMIT")
+
+        return last_id, stats_row, category_rows, incident_rows, location_rows
+
+    # ---------- инкрементальное обновление ----------
+    def add_problems(self, problems: List[Dict[str, Any]]):
+        """Учитывает только что записанные проблемы без запросов к БД"""
+        if self.refreshing:
+            self.arrived_during_refresh.extend(problems)
+        if self.payload is None:
+            return
+
+        self._count(problems)
+        self._render()
+
+    def _count(self, problems: List[Dict[str, Any]]):
+        # created_at в БД ставится datetime('now') - это UTC
+        now = datetime.utcnow()
+        new_incidents = []
+
+        for problem in problems:
+            problem_id = problem.get("id")
+            if problem_id is not None and problem_id <= self.last_id:
+                continue
+            # Как в SQL: category != 'Другое' и location != 'Екатеринбург' отбрасывают и NULL
+            category = problem.get("category")
+            if category is None or category == EXCLUDED_CATEGORY:
+                continue
+            priority = problem.get("priority") or 0
+
+            self.total += 1
+            self.last_24h += 1
+            if priority >= 3:
+                self.urgent += 1
+
+            bucket = self.categories.setdefault(category, {"count": 0, "urgent": 0})
+            bucket["count"] += 1
+            if priority >= 3:
+                bucket["urgent"] += 1
+
+            location = problem.get("location")
+            if location is not None and location != DEFAULT_LOCATION:
+                self.locations[location] = self.locations.get(location, 0) + 1
+
+            if priority >= 2:
+                new_incidents.append(self._incident(
+                    problem.get("id"), problem.get("text", ""), category, location, priority,
+                    now.strftime('%H:%M'), now.strftime('%d.%m')
+                ))
+
+        if new_incidents:
+            # Новые - сверху, как в ORDER BY created_at DESC
+            self.incidents = (new_incidents[::-1] + self.incidents)[:TOP_INCIDENTS]
+
+    # ---------- сборка ответа ----------
+    @staticmethod
+    def _incident(problem_id, text, category, location, priority, time, date) -> Dict[str, Any]:
+        text = text or ""
+        return {
+            "id": problem_id,
+            "text": (text[:120] + "...") if len(text) > 120 else text,
+            "category": category,
+            "location": location,
+            "priority": priority,
+            "time": time,
+            "date": date,
+            "badge": "🚨" if priority >= 3 else "⚠️",
+            "status": "critical" if priority >= 3 else "warning"
+        }
+
+    def _render(self):
+        categories = sorted(self.categories.items(), key=lambda item: -item[1]["count"])[:TOP_CATEGORIES]
+        hotspots = sorted(
+            ((location, count) for location, count in self.locations.items() if count > 1),
+            key=lambda item: -item[1]
+        )[:TOP_HOTSPOTS]
+
+        payload = {
+            "status": "success",
+            "stats": {
+                "total": self.total,
+                "urgent": self.urgent,
+                "last_24h": self.last_24h,
+                "last_update": datetime.now().strftime("%H:%M")
+            },
+            "categories": [
+                {"name": name, "count": data["count"], "urgent": data["urgent"]}
+                for name, data in categories
+            ],
+            "incidents": self.incidents,
+            "hotspots": [{"location": location, "count": count} for location, count in hotspots],
+            "timestamp": datetime.now().isoformat()
+        }
+        self.payload = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        # Сжимаем один раз на снимок, а не на каждый запрос мобильного клиента
+        self.payload_gzip = gzip.compress(self.payload, compresslevel=6, mtime=0)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# ========== ПУЛ СОЕДИНЕНИЙ SQLITE ==========
+# Настройки каждого соединения: WAL читается параллельно с записью,
+# synchronous=NORMAL в WAL безопасен и не делает fsync на каждый COMMIT
+CONNECTION_PRAGMAS = (
+    "PRAGMA busy_timeout = 30000",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA mmap_size = 268435456",
+)
+
+
+class Database:
+    """
+    Доступ к БД для асинхронного бэкенда: один писатель и N читателей.
+
+    Запросы выполняются в пулах потоков, event loop не блокируется.
+    Записи идут через единственный поток писателя (SQLite все равно
+    допускает одного писателя), чтения - параллельно на своих соединениях.
+    """
+
+    def __init__(self, db_path: str, readers: int = 4):
+        self.db_path = db_path
+        self.reader_count = max(1, readers)
+
+        self.writer: Optional[sqlite3.Connection] = None
+        self.readers: queue.SimpleQueue = queue.SimpleQueue()
+        self.read_pool: Optional[ThreadPoolExecutor] = None
+        self.write_pool: Optional[ThreadPoolExecutor] = None
+
+    def open(self):
+        self.writer = self._connect()
+        journal_mode = self.writer.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+
+        for _ in range(self.reader_count):
+            self.readers.put(self._connect(readonly=True))
+
+        self.read_pool = ThreadPoolExecutor(max_workers=self.reader_count, thread_name_prefix="db-read")
+        self.write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+        logger.info(f"🗄️ Пул БД открыт: 1 писатель, {self.reader_count} читателей, journal_mode={journal_mode}")
+
+    def close(self):
+        if self.read_pool:
+            self.read_pool.shutdown(wait=True)
+        if self.write_pool:
+            self.write_pool.shutdown(wait=True)
+
+        while not self.readers.empty():
+            self.readers.get().close()
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        logger.info("🗄️ Пул БД закрыт")
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        # Соединение живет в пуле и переходит между потоками, но в каждый
+        # момент им пользуется только один поток
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    # ---------- выполнение ----------
+    def _with_reader(self, fn: Callable, *args):
+        conn = self.readers.get()
+        try:
+            return fn(conn, *args)
+        finally:
+            self.readers.put(conn)
+
+    async def read(self, fn: Callable[..., Any], *args) -> Any:
+        """fn(conn, *args) на свободном читающем соединении"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.read_pool, self._with_reader, fn, *args)
+
+    async def write(self, fn: Callable[..., Any], *args) -> Any:
+        """fn(conn, *args) на соединении писателя; записи выполняются строго по очереди"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.write_pool, fn, self.writer, *args)
+
+    async def fetchall(self, sql: str, params=()) -> List[tuple]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def fetchone(self, sql: str, params=()) -> Optional[tuple]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
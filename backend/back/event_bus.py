@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Тип события после записи пачки проблем в БД; данные - список проблем с id
+PROBLEMS_COMMITTED = "problems_committed"
+
+
+# ========== ШИНА СОБЫТИЙ ==========
+class EventBus:
+    """
+    Шина событий внутри процесса.
+
+    publish не ждет обработчиков: синхронные вызываются сразу, корутины
+    запускаются отдельными задачами. Ошибка одного обработчика не мешает
+    остальным.
+    """
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Callable[[Any], Optional[Awaitable]]]] = defaultdict(list)
+        self.tasks: Set[asyncio.Task] = set()
+
+    def subscribe(self, event_type: str, handler: Callable[[Any], Optional[Awaitable]]):
+        self.handlers[event_type].append(handler)
+
+    def publish(self, event_type: str, payload: Any):
+        for handler in self.handlers.get(event_type, ()):
+            try:
+                result = handler(payload)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика {event_type}: {e}")
+                continue
+
+            if asyncio.iscoroutine(result):
+                task = asyncio.create_task(result)
+                self.tasks.add(task)
+                task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"❌ Ошибка обработчика события: {task.exception()}")
+
+
+# ========== ДЕЛЬТЫ СТАТИСТИКИ ==========
+class StatsDeltaDebouncer:
+    """
+    Копит приращения статистики по новым проблемам и отправляет их одним
+    сообщением не чаще раза в interval секунд: пачка из сотен проблем -
+    одно обновление счетчиков у клиентов, а не сотни.
+    """
+
+    def __init__(self, send: Callable[[Dict[str, Any]], Awaitable], interval: float = 0.25,
+                 critical_threshold: int = 2):
+        self.send = send
+        self.interval = interval
+        self.critical_threshold = critical_threshold
+
+        self.problems = 0
+        self.critical = 0
+        self.by_category: Dict[str, int] = defaultdict(int)
+        self.task: Optional[asyncio.Task] = None
+
+    def add(self, problems: List[Dict[str, Any]]):
+        for problem in problems:
+            self.problems += 1
+            if (problem.get("priority") or 0) >= self.critical_threshold:
+                self.critical += 1
+            self.by_category[problem.get("category") or "Другое"] += 1
+
+        if self.task is None and self.problems:
+            self.task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.interval)
+        finally:
+            self.task = None
+
+        delta = {
+            "problems": self.problems,
+            "critical": self.critical,
+            "by_category": dict(self.by_category)
+        }
+        self.problems, self.critical = 0, 0
+        self.by_category.clear()
+
+        try:
+            await self.send(delta)
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки дельты статистики: {e}")
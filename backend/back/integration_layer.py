@@ -7,6 +7,7 @@ import sqlite3
 import time
 import uuid
 import re
+import threading
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
@@ -70,7 +71,7 @@ if analyze_news_article is None:
     print("⚠️ Использую заглушку для analyze_news_article")
 
 
-    def analyze_news_article(text, source_url="", source_name="", parse_time=""):
+    def analyze_news_article(text, source_url="", source_name="", parse_time="", repeated_lines=None):
         print(f"[ЗАГЛУШКА] analyze_news_article: {text[:50]}...")
         return [{
             "category": "Другое",
@@ -82,11 +83,35 @@ if analyze_news_article is None:
 
 print("✅ Импорт neural network завершен\n")
 
+# Сжатие текста перед отправкой в LLM (модуль без внешних зависимостей)
+sys.path.insert(0, neural_network_dir)
+from text_compaction import find_repeated_lines, usage_summary
+
+# Общий с бэкендом код записи в problems
+sys.path.insert(0, back_dir)
+from problems_repository import normalize_problems, insert_problems
+from write_queue import HIGH_PRIORITY
+
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Адрес бэкенда (можно переопределить, например, на mock-сервер для бенчмарков)
+BACKEND_URL = os.environ.get('BACKEND_URL', 'http://localhost:8000')
+
+# Куда сохранять проблемы: http - через API бэкенда, direct - прямо в БД
+# (если интеграционный слой работает на той же машине, что и бэкенд)
+INGEST_SINK = os.environ.get('INGEST_SINK', 'http')
+DIRECT_DB_PATH = os.environ.get('DATABASE_URL') or os.path.join(backend_dir, 'data', 'municipal_monitoring.db')
+
+# Пакетная отправка: сбрасываем буфер по размеру или по времени
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '100'))
+INGEST_FLUSH_INTERVAL = float(os.environ.get('INGEST_FLUSH_INTERVAL', '1.0'))
+
+# Сколько раз повторять отправку, если бэкенд перегружен (429)
+INGEST_MAX_RETRIES = int(os.environ.get('INGEST_MAX_RETRIES', '5'))
+
 
 # ========== ФУНКЦИЯ ФИЛЬТРАЦИИ МУНИЦИПАЛЬНОГО КОНТЕНТА ==========
 def is_municipal_problem(text):
@@ -316,46 +341,90 @@ def init_database():
 
 
 # ========== ФУНКЦИЯ ДЛЯ ОТПРАВКИ В БЭКЕНД ==========
+_backend_session = None
+_backend_session_lock = threading.Lock()
+
+
+def get_backend_session():
+    """Общая keep-alive сессия: не открываем новое соединение на каждую проблему"""
+    global _backend_session
+    with _backend_session_lock:
+        if _backend_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _backend_session = session
+        return _backend_session
+
+
+def post_with_backpressure(session, url, payload, timeout):
+    """POST в бэкенд с учетом 429: ждем Retry-After и повторяем"""
+    for attempt in range(INGEST_MAX_RETRIES + 1):
+        response = session.post(url, json=payload, timeout=timeout)
+        if response.status_code != 429 or attempt == INGEST_MAX_RETRIES:
+            return response
+
+        try:
+            retry_after = float(response.headers.get('Retry-After', '1'))
+        except ValueError:
+            retry_after = 1.0
+        retry_after = min(max(retry_after, 0.1), 30.0)
+        logger.warning(f"⏳ Бэкенд перегружен, повтор через {retry_after:.1f} с "
+                       f"(попытка {attempt + 1}/{INGEST_MAX_RETRIES})")
+        time.sleep(retry_after)
+    return response
+
+
+def prepare_backend_payload(analysis_result):
+    """Готовит данные для бэкенда; None - если проблему отправлять не нужно"""
+    # Преобразуем приоритет в int
+    priority = analysis_result.get("priority", 0)
+    if priority is None:
+        priority = 0
+    elif isinstance(priority, str):
+        try:
+            priority = int(priority)
+        except:
+            priority = 0
+
+    # Преобразуем sentiment
+    sentiment = analysis_result.get("sentiment", "neutral")
+    if sentiment is None:
+        sentiment = "neutral"
+
+    # Готовим данные
+    data_to_send = {
+        "text": analysis_result.get("text", analysis_result.get("summary", ""))[:500],
+        # ИЗМЕНЕНО: проверяем оба поля
+        "category": analysis_result.get("category", "Другое"),
+        "location": analysis_result.get("location", "Екатеринбург"),
+        "sentiment": sentiment,
+        "priority": priority,
+        "metadata": analysis_result.get("metadata", json.dumps({}))  # ИЗМЕНЕНО: берем готовый metadata
+    }
+
+    # Пропускаем если категория "Новости" или "Другое"
+    if data_to_send["category"] in ["Новости", "Другое", "Новость"]:
+        logger.info(f"⏭️ Пропускаем: {data_to_send['category']}")
+        return None
+
+    return data_to_send
+
+
 def send_to_backend(analysis_result, source_url="", parse_time=""):
     """ИСПРАВЛЕННАЯ функция отправки данных в бэкенд"""
     try:
-        # Преобразуем приоритет в int
-        priority = analysis_result.get("priority", 0)
-        if priority is None:
-            priority = 0
-        elif isinstance(priority, str):
-            try:
-                priority = int(priority)
-            except:
-                priority = 0
-
-        # Преобразуем sentiment
-        sentiment = analysis_result.get("sentiment", "neutral")
-        if sentiment is None:
-            sentiment = "neutral"
-
-        # Готовим данные
-        data_to_send = {
-            "text": analysis_result.get("text", analysis_result.get("summary", ""))[:500],
-            # ИЗМЕНЕНО: проверяем оба поля
-            "category": analysis_result.get("category", "Другое"),
-            "location": analysis_result.get("location", "Екатеринбург"),
-            "sentiment": sentiment,
-            "priority": priority,
-            "metadata": analysis_result.get("metadata", json.dumps({}))  # ИЗМЕНЕНО: берем готовый metadata
-        }
-
-        # Пропускаем если категория "Новости" или "Другое"
-        if data_to_send["category"] in ["Новости", "Другое", "Новость"]:
-            logger.info(f"⏭️ Пропускаем: {data_to_send['category']}")
+        data_to_send = prepare_backend_payload(analysis_result)
+        if data_to_send is None:
             return False
 
         # Отправляем в бэкенд API
-        backend_url = "http://localhost:8000/api/system_report"
-        response = requests.post(backend_url, json=data_to_send, timeout=10)
+        backend_url = f"{BACKEND_URL}/api/system_report"
+        response = post_with_backpressure(get_backend_session(), backend_url, data_to_send, timeout=10)
 
         if response.status_code == 200:
-            logger.info(f"✅ Отправлено в бэкенд: {data_to_send['category']} (приоритет: {priority})")
+            logger.info(f"✅ Отправлено в бэкенд: {data_to_send['category']} (приоритет: {data_to_send['priority']})")
             return True
         else:
             logger.error(f"❌ Ошибка {response.status_code}: {response.text[:100]}")
@@ -366,6 +435,149 @@ def send_to_backend(analysis_result, source_url="", parse_time=""):
         return False
 
 
+class ProblemBatcher:
+    """
+    Копит проблемы и отправляет их пачкой в /api/system_report/batch
+    по достижении batch_size или раз в flush_interval секунд
+    """
+
+    def __init__(self, batch_size=INGEST_BATCH_SIZE, flush_interval=INGEST_FLUSH_INTERVAL, backend_url=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Ждем COMMIT: saved в ответе - записанные строки, а не принятые в очередь
+        self.batch_url = f"{backend_url or BACKEND_URL}/api/system_report/batch?wait_for_commit=true"
+        self.session = get_backend_session()
+
+        self.buffer = []
+        self.oldest_at = None
+        self.sent = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._timer.start()
+
+    def add(self, analysis_result):
+        """Ставит проблему в очередь; False - если проблема отфильтрована"""
+        data_to_send = prepare_backend_payload(analysis_result)
+        if data_to_send is None:
+            return False
+
+        with self.lock:
+            self.buffer.append(data_to_send)
+            if self.oldest_at is None:
+                self.oldest_at = time.monotonic()
+            full = len(self.buffer) >= self.batch_size
+
+        if full:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Отправляет накопленное; возвращает число сохраненных бэкендом строк"""
+        with self.lock:
+            batch, self.buffer, self.oldest_at = self.buffer, [], None
+        if not batch:
+            return 0
+
+        # Пачки уходят по одной, чтобы порядок вставки совпадал с порядком
+        # анализа (внутри пачки срочные записываются первыми)
+        with self.send_lock:
+            try:
+                saved = self._send_batch(batch)
+                if saved is not None:
+                    self.sent += saved
+                    self.failed += len(batch) - saved
+                    logger.info(f"✅ Отправлена пачка: {saved} проблем")
+                    return saved
+            except Exception as e:
+                logger.error(f"❌ Ошибка пакетной отправки: {e}")
+
+        self.failed += len(batch)
+        return 0
+
+    def _send_batch(self, batch):
+        """Число сохраненных строк или None при ошибке"""
+        # Срочные - отдельным запросом и первыми: бэкенд принимает пачку
+        # целиком или отвечает 429, и при заполненной обычной полосе смешанная
+        # пачка не прошла бы вместе со срочными строками
+        high = [problem for problem in batch if problem.get("priority", 0) >= HIGH_PRIORITY]
+        normal = [problem for problem in batch if problem.get("priority", 0) < HIGH_PRIORITY]
+
+        saved = None
+        for lane in (high, normal):
+            if not lane:
+                continue
+            lane_saved = self._post_batch(lane)
+            if lane_saved is not None:
+                saved = (saved or 0) + lane_saved
+        return saved
+
+    def _post_batch(self, batch):
+        response = post_with_backpressure(self.session, self.batch_url, {"problems": batch}, timeout=30)
+        if response.status_code == 200:
+            return response.json().get("saved", len(batch))
+        logger.error(f"❌ Ошибка пакетной отправки {response.status_code}: {response.text[:100]}")
+        return None
+
+    def _flush_periodically(self):
+        while not self._stop.wait(min(self.flush_interval, 0.25)):
+            with self.lock:
+                expired = self.oldest_at is not None and time.monotonic() - self.oldest_at >= self.flush_interval
+            if expired:
+                self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._timer.join(timeout=5)
+        self.flush()
+        return self.sent
+
+
+class DirectSink(ProblemBatcher):
+    """
+    Пишет пачки прямо в таблицу problems через problems_repository,
+    минуя JSON и HTTP, а затем коротко уведомляет бэкенд (только id),
+    чтобы тот разослал живые обновления
+    """
+
+    def __init__(self, db_path=DIRECT_DB_PATH, batch_size=INGEST_BATCH_SIZE,
+                 flush_interval=INGEST_FLUSH_INTERVAL, backend_url=None):
+        self.db_path = db_path
+        self.notify_url = f"{backend_url or BACKEND_URL}/api/ingest_notify"
+        super().__init__(batch_size, flush_interval, backend_url)
+
+    def _send_batch(self, batch):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            problems, rejected = normalize_problems(batch)
+            ids = insert_problems(conn, problems)
+        finally:
+            conn.close()
+
+        if rejected:
+            logger.warning(f"⚠️ Отклонено проблем с неверными полями: {rejected}")
+
+        # Данные уже сохранены - ошибка уведомления не должна их терять
+        try:
+            self.session.post(self.notify_url, json={"ids": ids}, timeout=5)
+        except Exception as e:
+            logger.warning(f"⚠️ Бэкенд не уведомлен о новых проблемах: {e}")
+        return len(ids)
+
+
+def create_sink(kind=None):
+    """Приемник для process_and_save_news: http (по умолчанию) или direct"""
+    kind = kind or INGEST_SINK
+    if kind == 'direct':
+        return DirectSink()
+    if kind != 'http':
+        logger.warning(f"⚠️ Неизвестный INGEST_SINK={kind}, использую http")
+    return ProblemBatcher()
+
+
 # ========== ФУНКЦИЯ ДЛЯ СОЗДАНИЯ КЛАСТЕРОВ ==========
 def create_clusters_from_problems():
     """Создание кластеров из существующих проблем"""
@@ -439,7 +651,7 @@ def cluster_similar_problems():
                    MIN(created_at) as first_seen,
                    MAX(created_at) as last_seen
             FROM problems 
-            WHERE created_at > datetime('now', '-7 days')
+            WHERE unlikely(created_at > datetime('now', '-7 days'))
             GROUP BY category, location
             HAVING COUNT(*) > 1
             ORDER BY COUNT(*) DESC
@@ -469,13 +681,14 @@ def cluster_similar_problems():
 
 
 # ========== ФУНКЦИЯ ДЛЯ ЗАГРУЗКИ И ОБРАБОТКИ НОВОСТЕЙ ==========
-def process_and_save_news():
+def process_and_save_news(news_file=None, sink=None):
     """Обработка новостей и сохранение в БД для дашборда"""
     try:
         print(f"\n🔍 [process_and_save_news] НАЧАЛО обработки новостей")
 
         # Путь к файлу с новостями
-        news_file = os.path.join(backend_dir, 'data', 'ekb_news.txt')
+        if news_file is None:
+            news_file = os.path.join(backend_dir, 'data', 'ekb_news.txt')
 
         print(f"   📁 Путь к файлу: {news_file}")
         print(f"   📂 Файл существует: {os.path.exists(news_file)}")
@@ -497,7 +710,11 @@ def process_and_save_news():
         news_sections = content.split("=" * 80)
         print(f"   📰 Найдено секций новостей: {len(news_sections)}")
 
-        processed_count = 0
+        # Строки, повторяющиеся из секции в секцию - подписи каналов, а не новости
+        repeated_lines = find_repeated_lines(news_sections)
+
+        queued_count = 0
+        sink = sink or create_sink()
 
         for i, section in enumerate(news_sections):
             if not section.strip():
@@ -508,6 +725,7 @@ def process_and_save_news():
             # Ищем текст новости и метаданные
             lines = section.strip().split('\n')
             news_text = ""
+            news_lines = []
             source_url = ""
             parse_time = ""
 
@@ -533,6 +751,7 @@ def process_and_save_news():
                     # Пропускаем разделители
                     if not line.startswith("=") and not line.startswith("&"):
                         news_text += line + " "
+                        news_lines.append(line)
 
             news_text = news_text.strip()
 
@@ -570,11 +789,13 @@ def process_and_save_news():
                 try:
                     print(f"      🤖 Отправляю на AI анализ...")
 
+                    # Сжатие для промпта - внутри analyze_news_article, превью строится по полному тексту
                     ai_results = analyze_news_article(
-                        news_text[:1500],
+                        "\n".join(news_lines),
                         source_url,
                         "parser",
-                        parse_time if parse_time else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                        parse_time if parse_time else datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        repeated_lines=repeated_lines
                     )
 
                     if ai_results and len(ai_results) > 0:
@@ -587,14 +808,10 @@ def process_and_save_news():
 
                         print(
                             f"      ✅ AI анализ: {validated_data['category']} (приоритет: {validated_data['priority']})")
-                        print(f"      📤 Отправляю в бэкенд...")
-
-                        # Отправляем в бэкенд
-                        if send_to_backend(validated_data, source_url, parse_time):
-                            processed_count += 1
-                            print(f"      ✅ Успешно отправлено! Всего: {processed_count}")
-                        else:
-                            print(f"      ❌ Не удалось отправить в бэкенд")
+                        # Отправляем в бэкенд пачками
+                        if sink.add(validated_data):
+                            queued_count += 1
+                            print(f"      📤 В очереди на отправку: {queued_count}")
 
                     else:
                         print(f"      ⚠️ AI вернул пустой результат")
@@ -605,7 +822,15 @@ def process_and_save_news():
             else:
                 print(f"      ⚠️ Текст новости слишком короткий ({len(news_text)} символов)")
 
+        processed_count = sink.close()
+        if sink.failed:
+            print(f"      ❌ Не удалось отправить в бэкенд: {sink.failed}")
+
         print(f"\n🎯 ИТОГО: Обработано {processed_count} новостей")
+        usage = usage_summary()
+        if usage["calls"]:
+            print(f"🪙 Токены GigaChat: {usage['total_tokens']} за {usage['calls']} вызовов "
+                  f"(в среднем {usage['avg_prompt_tokens']} на промпт)")
 
         # После обработки создаем кластеры
         if processed_count > 0:
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from database import Database
+from rollups import BUCKET_FORMAT, window_start
+
+logger = logging.getLogger(__name__)
+
+CRITICAL_PRIORITY = 2
+
+
+# ========== ЖИВЫЕ СЧЕТЧИКИ ==========
+class LiveCounters:
+    """
+    Счетчики проблем в памяти: всего, критических (priority >= 2) и по часам
+    для окна "за последний час" - чтобы get_stats, /health и периодическая
+    рассылка не ходили в БД.
+
+    При старте и раз в resync_interval секунд счетчики сверяются с
+    problems_hourly (так учитываются удаления и записи в обход бэкенда),
+    между сверками каждая записанная проблема прибавляется сразу
+    (add_problems).
+    """
+
+    def __init__(self, database: Database, resync_interval: float = 300.0):
+        self.database = database
+        self.resync_interval = resync_interval
+
+        self.total = 0
+        self.critical = 0
+        # bucket часа (как в problems_hourly) -> [проблем, критических]
+        self.hours: Dict[str, List[int]] = {}
+
+        # id последней проблемы, учтенной сверкой: более старые уже в счетчиках
+        self.last_id = 0
+        self.resyncing = False
+        self.arrived_during_resync: List[Dict[str, Any]] = []
+
+        self.resynced_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+    # ---------- жизненный цикл ----------
+    async def start(self):
+        await self.resync()
+        self.task = asyncio.create_task(self._resync_periodically())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def _resync_periodically(self):
+        while True:
+            await asyncio.sleep(self.resync_interval)
+            try:
+                await self.resync()
+            except Exception as e:
+                logger.error(f"❌ Ошибка сверки счетчиков: {e}")
+
+    async def resync(self):
+        """Счетчики по агрегату; MAX(id) в том же запросе - один снимок БД"""
+        self.resyncing = True
+        try:
+            rows = await self.database.fetchall('''
+                SELECT bucket, SUM(problems), SUM(critical),
+                       (SELECT IFNULL(MAX(id), 0) FROM problems)
+                FROM problems_hourly
+                GROUP BY bucket
+            ''')
+        finally:
+            self.resyncing = False
+            arrived, self.arrived_during_resync = self.arrived_during_resync, []
+
+        recent = window_start(1)
+        self.total = sum(row[1] or 0 for row in rows)
+        self.critical = sum(row[2] or 0 for row in rows)
+        self.hours = {row[0]: [row[1] or 0, row[2] or 0] for row in rows if row[0] >= recent}
+        self.last_id = rows[0][3] if rows else 0
+        self.resynced_at = datetime.now()
+
+        # Пришедшие во время запроса: те, что позже снимка, добавляем заново
+        self._count(arrived)
+
+    # ---------- обновление ----------
+    def add_problems(self, problems: List[Dict[str, Any]]):
+        if self.resyncing:
+            self.arrived_during_resync.extend(problems)
+        self._count(problems)
+
+    def _count(self, problems: List[Dict[str, Any]]):
+        for problem in problems:
+            problem_id = problem.get("id")
+            if problem_id is not None and problem_id <= self.last_id:
+                continue
+            critical = int((problem.get("priority") or 0) >= CRITICAL_PRIORITY)
+            self.total += 1
+            self.critical += critical
+
+            # created_at в БД ставится datetime('now') - это UTC
+            created_at = problem.get("created_at") or datetime.utcnow().strftime(BUCKET_FORMAT)
+            hour = self.hours.setdefault(created_at[:13] + ":00:00", [0, 0])
+            hour[0] += 1
+            hour[1] += critical
+
+    # ---------- чтение ----------
+    def last_hour(self) -> Dict[str, int]:
+        """Как window_totals(db, 1): только текущий час, прошедшие часы отбрасываются"""
+        since = window_start(1)
+        for bucket in [bucket for bucket in self.hours if bucket < since]:
+            del self.hours[bucket]
+
+        total = critical = 0
+        for problems, critical_problems in self.hours.values():
+            total += problems
+            critical += critical_problems
+        return {"total": total, "critical": critical}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "critical": self.critical,
+            "last_hour": self.last_hour(),
+            "resynced_at": self.resynced_at.isoformat() if self.resynced_at else None
+        }
@@ -0,0 +1,239 @@
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# ========== БАЗОВАЯ СХЕМА ==========
+# Совпадает с рабочей БД: id - целочисленный rowid (на нем держится пакетная
+# вставка в problems_repository)
+BASE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS problems (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        text TEXT NOT NULL,
+        category TEXT,
+        location TEXT DEFAULT 'Екатеринбург',
+        sentiment TEXT DEFAULT 'neutral',
+        priority INTEGER DEFAULT 0,
+        metadata TEXT DEFAULT '{}',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS websocket_sessions (
+        session_id TEXT PRIMARY KEY,
+        user_agent TEXT,
+        connected_at TIMESTAMP,
+        last_active TIMESTAMP,
+        ip_address TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        problem_id TEXT,
+        alert_type TEXT,
+        message TEXT,
+        sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        acknowledged BOOLEAN DEFAULT FALSE
+    )
+    ''',
+]
+
+
+def create_base_schema(conn):
+    for statement in BASE_SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+
+
+def init_schema(conn) -> int:
+    """Таблицы + все миграции; возвращает версию схемы"""
+    create_base_schema(conn)
+    return apply_migrations(conn)
+
+
+# ========== МИГРАЦИИ СХЕМЫ ==========
+# Версия схемы хранится в PRAGMA user_version. Каждая миграция - номер,
+# описание и список выражений; уже примененные повторно не выполняются.
+# Индексы подобраны под запросы API: проверка - scripts/check_query_plans.py
+
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "индексы под запросы API", [
+        # Лента проблем и критические инциденты: ORDER BY priority DESC, created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_problems_priority_created ON problems (priority, created_at)",
+        # Статистика за период: покрывающий индекс для COUNT/SUM/GROUP BY по окну created_at
+        "CREATE INDEX IF NOT EXISTS idx_problems_created ON problems (created_at, category, priority, location)",
+        # Фильтр по категории в /api/problems
+        "CREATE INDEX IF NOT EXISTS idx_problems_category_priority ON problems (category, priority, created_at)",
+        # Горячие точки: GROUP BY location без сортировки
+        "CREATE INDEX IF NOT EXISTS idx_problems_location_category ON problems (location, category)",
+    ]),
+    (2, "почасовые агрегаты problems_hourly", [
+        '''
+        CREATE TABLE IF NOT EXISTS problems_hourly (
+            bucket TEXT NOT NULL,
+            category TEXT NOT NULL,
+            sentiment TEXT NOT NULL,
+            problems INTEGER NOT NULL DEFAULT 0,
+            critical INTEGER NOT NULL DEFAULT 0,
+            priority_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, category, sentiment)
+        ) WITHOUT ROWID
+        ''',
+        # Агрегаты ведет сама БД: учитываются записи любого писателя
+        # (бэкенд, INGEST_SINK=direct, ручной импорт)
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_problems_hourly_insert AFTER INSERT ON problems
+        BEGIN
+            INSERT INTO problems_hourly (bucket, category, sentiment, problems, critical, priority_sum)
+            VALUES (
+                strftime('%Y-%m-%d %H:00:00', IFNULL(NEW.created_at, 'now')),
+                IFNULL(NEW.category, 'Другое'),
+                IFNULL(NEW.sentiment, 'neutral'),
+                1,
+                IFNULL(NEW.priority, 0) >= 2,
+                IFNULL(NEW.priority, 0)
+            )
+            ON CONFLICT (bucket, category, sentiment) DO UPDATE SET
+                problems = problems + 1,
+                critical = critical + excluded.critical,
+                priority_sum = priority_sum + excluded.priority_sum;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_problems_hourly_delete AFTER DELETE ON problems
+        BEGIN
+            UPDATE problems_hourly SET
+                problems = problems - 1,
+                critical = critical - (IFNULL(OLD.priority, 0) >= 2),
+                priority_sum = priority_sum - IFNULL(OLD.priority, 0)
+            WHERE bucket = strftime('%Y-%m-%d %H:00:00', IFNULL(OLD.created_at, 'now'))
+              AND category = IFNULL(OLD.category, 'Другое')
+              AND sentiment = IFNULL(OLD.sentiment, 'neutral');
+        END
+        ''',
+        # Заполняем по уже накопленным проблемам
+        '''
+        INSERT OR REPLACE INTO problems_hourly (bucket, category, sentiment, problems, critical, priority_sum)
+        SELECT strftime('%Y-%m-%d %H:00:00', IFNULL(created_at, 'now')),
+               IFNULL(category, 'Другое'),
+               IFNULL(sentiment, 'neutral'),
+               COUNT(*),
+               SUM(IFNULL(priority, 0) >= 2),
+               SUM(IFNULL(priority, 0))
+        FROM problems
+        GROUP BY 1, 2, 3
+        ''',
+    ]),
+    (3, "дневные агрегаты problems_daily для трендов", [
+        # Ключ начинается с дня: окно в 90 дней - один непрерывный диапазон.
+        # prio1..prio3 - число проблем с priority не ниже 1, 2 и 3
+        '''
+        CREATE TABLE IF NOT EXISTS problems_daily (
+            day TEXT NOT NULL,
+            category TEXT NOT NULL,
+            location TEXT NOT NULL,
+            problems INTEGER NOT NULL DEFAULT 0,
+            prio1 INTEGER NOT NULL DEFAULT 0,
+            prio2 INTEGER NOT NULL DEFAULT 0,
+            prio3 INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category, location)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_problems_daily_insert AFTER INSERT ON problems
+        BEGIN
+            INSERT INTO problems_daily (day, category, location, problems, prio1, prio2, prio3)
+            VALUES (
+                date(IFNULL(NEW.created_at, 'now')),
+                IFNULL(NEW.category, 'Другое'),
+                IFNULL(NEW.location, 'Екатеринбург'),
+                1,
+                IFNULL(NEW.priority, 0) >= 1,
+                IFNULL(NEW.priority, 0) >= 2,
+                IFNULL(NEW.priority, 0) >= 3
+            )
+            ON CONFLICT (day, category, location) DO UPDATE SET
+                problems = problems + 1,
+                prio1 = prio1 + excluded.prio1,
+                prio2 = prio2 + excluded.prio2,
+                prio3 = prio3 + excluded.prio3;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_problems_daily_delete AFTER DELETE ON problems
+        BEGIN
+            UPDATE problems_daily SET
+                problems = problems - 1,
+                prio1 = prio1 - (IFNULL(OLD.priority, 0) >= 1),
+                prio2 = prio2 - (IFNULL(OLD.priority, 0) >= 2),
+                prio3 = prio3 - (IFNULL(OLD.priority, 0) >= 3)
+            WHERE day = date(IFNULL(OLD.created_at, 'now'))
+              AND category = IFNULL(OLD.category, 'Другое')
+              AND location = IFNULL(OLD.location, 'Екатеринбург');
+        END
+        ''',
+        '''
+        INSERT OR REPLACE INTO problems_daily (day, category, location, problems, prio1, prio2, prio3)
+        SELECT date(IFNULL(created_at, 'now')),
+               IFNULL(category, 'Другое'),
+               IFNULL(location, 'Екатеринбург'),
+               COUNT(*),
+               SUM(IFNULL(priority, 0) >= 1),
+               SUM(IFNULL(priority, 0) >= 2),
+               SUM(IFNULL(priority, 0) >= 3)
+        FROM problems
+        GROUP BY 1, 2, 3
+        ''',
+    ]),
+    (4, "подписки и очередь доставки оповещений в Telegram", [
+        '''
+        CREATE TABLE IF NOT EXISTS telegram_subscriptions (
+            chat_id INTEGER PRIMARY KEY,
+            title TEXT,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Каждая строка - одно оповещение для одного чата; pending переживают
+        # перезапуск и досылаются (telegram_notifier.py)
+        '''
+        CREATE TABLE IF NOT EXISTS telegram_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            alert TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_telegram_outbox_pending ON telegram_outbox (id) WHERE status = 'pending'",
+    ]),
+]
+
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn) -> int:
+    """Применяет недостающие миграции, возвращает итоговую версию схемы"""
+    version = schema_version(conn)
+
+    for number, description, statements in MIGRATIONS:
+        if number <= version:
+            continue
+        for statement in statements:
+            conn.execute(statement)
+        # PRAGMA не принимает параметры, number - наш собственный int
+        conn.execute(f"PRAGMA user_version = {int(number)}")
+        conn.commit()
+        version = number
+        logger.info(f"🧱 Миграция {number}: {description}")
+
+    # Обновляем статистику планировщика для новых индексов
+    conn.execute("PRAGMA optimize")
+    return version
@@ -0,0 +1,215 @@
+import base64
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+# ========== ХРАНИЛИЩЕ ПРОБЛЕМ ==========
+# Общий код записи в таблицу problems: им пользуются и эндпоинты бэкенда,
+# и интеграционный слой, чтобы правила приведения данных были одни.
+
+INSERT_PROBLEM_SQL = '''
+    INSERT INTO problems (text, category, location, sentiment, priority, metadata, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+'''
+
+PROBLEM_FIELDS = ("id", "text", "category", "location", "sentiment", "priority", "created_at")
+
+
+def _text_field(data: Dict[str, Any], name: str, default: str) -> str:
+    """Строковое поле: числа приводим к строке, списки и объекты - ValueError"""
+    value = data.get(name)
+    if value is None or value == "":
+        return default
+    if not isinstance(value, (str, int, float)):
+        raise ValueError(f"Поле {name}: ожидается строка, получено {type(value).__name__}")
+    return str(value)
+
+
+def normalize_problem(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Проверяем и преобразуем данные одной проблемы (как в /api/system_report).
+    Неподходящий тип поля - ValueError: такую проблему отклоняем, а не пишем
+    """
+    text = _text_field(data, "text", "")[:1000]
+    category = _text_field(data, "category", "Другое")
+    location = _text_field(data, "location", "Екатеринбург")
+    sentiment = _text_field(data, "sentiment", "neutral")
+    metadata = data.get("metadata", "{}")
+
+    # Преобразуем priority в int
+    try:
+        priority = int(data.get("priority", 0))
+    except (TypeError, ValueError):
+        priority = 0
+
+    # metadata хранится строкой JSON
+    if not isinstance(metadata, str):
+        metadata = json.dumps(metadata or {}, ensure_ascii=False)
+
+    return {
+        "text": text,
+        "category": category,
+        "location": location,
+        "sentiment": sentiment,
+        "priority": priority,
+        "metadata": metadata
+    }
+
+
+def normalize_problems(items: List[Any]) -> Tuple[List[Dict[str, Any]], int]:
+    """Пачка проблем: (прошедшие проверку, число отклоненных) - плохая строка не валит пачку"""
+    problems = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            problems.append(normalize_problem(item))
+        except ValueError:
+            continue
+    return problems, len(items) - len(problems)
+
+
+def insert_problems(conn, problems: List[Dict[str, Any]]) -> List[int]:
+    """
+    Вставка пачки проблем одним executemany в одной транзакции.
+    Возвращает rowid вставленных строк.
+    """
+    if not problems:
+        return []
+
+    rows = [
+        (p["text"], p["category"], p["location"], p["sentiment"], p["priority"], p["metadata"])
+        for p in problems
+    ]
+
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.executemany(INSERT_PROBLEM_SQL, rows)
+        cursor.execute('SELECT last_insert_rowid()')
+        last_id = cursor.fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Пишем под блокировкой одной транзакцией - rowid идут подряд
+    return list(range(last_id - len(rows) + 1, last_id + 1))
+
+
+def fetch_problems_by_ids(conn, ids: List[int]) -> List[Dict[str, Any]]:
+    """Только что записанные проблемы - для живых обновлений"""
+    if not ids:
+        return []
+
+    placeholders = ",".join("?" for _ in ids)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {", ".join(PROBLEM_FIELDS)}
+        FROM problems
+        WHERE id IN ({placeholders})
+        ORDER BY id
+    ''', list(ids))
+    return [dict(zip(PROBLEM_FIELDS, row)) for row in cursor.fetchall()]
+
+
+# ========== ЧТЕНИЕ С ФИЛЬТРАМИ И КУРСОРОМ ==========
+# Лента проблем сортируется по (priority, created_at, id) по убыванию - этот
+# же кортеж служит курсором: следующая страница начинается строго после него
+# и читается из индекса idx_problems_priority_created без OFFSET.
+
+EXCLUDED_CATEGORY = 'Другое'
+
+
+def problem_filters(category: Optional[str] = None, priority: Optional[int] = None,
+                    last_hours: Optional[int] = None) -> Tuple[str, List[Any]]:
+    """WHERE для ленты проблем и его параметры"""
+    where = ["category != ?"]
+    params: List[Any] = [EXCLUDED_CATEGORY]
+
+    if category and category != 'all':
+        where.append("category = ?")
+        params.append(category)
+
+    if priority is not None:
+        where.append("priority >= ?")
+        params.append(priority)
+
+    if last_hours:
+        where.append("created_at > datetime('now', ?)")
+        params.append(f'-{int(last_hours)} hours')
+
+    return " AND ".join(where), params
+
+
+def encode_cursor(priority: int, created_at: str, problem_id: int) -> str:
+    raw = json.dumps([priority, created_at, problem_id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[int, str, int]:
+    """Курсор из next_cursor; ValueError, если он поврежден"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        priority, created_at, problem_id = json.loads(base64.urlsafe_b64decode(padded))
+        return int(priority), str(created_at), int(problem_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+
+
+class ProblemCountCache:
+    """
+    Кэш COUNT(*) для ленты проблем по набору фильтров.
+
+    Новые проблемы увеличивают подходящие счетчики сразу (add_problems),
+    а раз в ttl секунд счетчик пересчитывается запросом - так учитываются
+    строки, вышедшие из окна last_hours, и записи в обход бэкенда.
+
+    Фильтры приходят от клиентов, поэтому наборов не больше max_entries
+    (LRU, как rollups.TTLCache), а устаревшие удаляются при каждой записи.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[tuple, List[float]]" = OrderedDict()
+
+    @staticmethod
+    def key(category=None, priority=None, last_hours=None) -> tuple:
+        return (category if category and category != 'all' else None, priority, last_hours or None)
+
+    def get(self, key: tuple) -> Optional[int]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return int(entry[0])
+
+    def set(self, key: tuple, count: int):
+        self.entries[key] = [count, time.monotonic()]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _drop_expired(self):
+        expired_before = time.monotonic() - self.ttl
+        for key in [key for key, entry in self.entries.items() if entry[1] < expired_before]:
+            del self.entries[key]
+
+    def add_problems(self, problems: List[Dict[str, Any]]):
+        # Устаревшие все равно будут пересчитаны запросом - не тратим на них время
+        self._drop_expired()
+        for key, entry in self.entries.items():
+            category, priority, _ = key
+            for problem in problems:
+                if problem.get("category") == EXCLUDED_CATEGORY:
+                    continue
+                if category is not None and problem.get("category") != category:
+                    continue
+                if priority is not None and (problem.get("priority") or 0) < priority:
+                    continue
+                entry[0] += 1
@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+# ========== ОБЩАЯ ШИНА МЕЖДУ ВОРКЕРАМИ ==========
+# Несколько процессов uvicorn (--workers N) держат каждый своих
+# WebSocket-клиентов и свои кэши. Шина доставляет события всем воркерам
+# (включая отправителя), а claim дает общее на всех подавление повторов:
+# ключ получает только первый, кто его запросил, до истечения ttl.
+#
+# PUBSUB_URL:
+#     local                     - один процесс, всё в памяти (по умолчанию)
+#     sqlite[:///путь/к/bus.db] - воркеры на одной машине, общий файл SQLite
+#     redis://host:6379/0       - Redis (для проверки - scripts/fake_redis_server.py)
+
+class PubSub(ABC):
+    """Интерфейс шины: каналы со строковыми сообщениями и общие ключи с ttl"""
+
+    name = "base"
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Callable[[str], Optional[Awaitable]]]] = defaultdict(list)
+        self.stats = {"published": 0, "received": 0, "errors": 0}
+
+    def subscribe(self, channel: str, handler: Callable[[str], Optional[Awaitable]]):
+        """Подписка до start(); handler(payload) - функция или корутина"""
+        self.handlers[channel].append(handler)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, channel: str, payload: str):
+        """Доставить payload всем подписчикам канала во всех воркерах"""
+
+    @abstractmethod
+    async def claim(self, key: str, ttl: float) -> bool:
+        """True, если ключ свободен (или истек) и теперь занят нами на ttl секунд"""
+
+    def _dispatch(self, channel: str, payload: str):
+        self.stats["received"] += 1
+        for handler in self.handlers.get(channel, ()):
+            try:
+                result = handler(payload)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"❌ Ошибка обработчика канала {channel}: {e}")
+
+
+# ========== ОДИН ПРОЦЕСС ==========
+class LocalPubSub(PubSub):
+    name = "local"
+
+    def __init__(self, max_claims: int = 10000):
+        super().__init__()
+        # Истекшие ключи вычищаются, когда их набирается max_claims
+        self.max_claims = max_claims
+        self.claims: Dict[str, float] = {}
+
+    async def publish(self, channel: str, payload: str):
+        self.stats["published"] += 1
+        self._dispatch(channel, payload)
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        now = time.monotonic()
+        if self.claims.get(key, 0) > now:
+            return False
+        if len(self.claims) >= self.max_claims:
+            self.claims = {k: expires for k, expires in self.claims.items() if expires > now}
+        self.claims[key] = now + ttl
+        return True
+
+
+# ========== SQLITE ==========
+class SqlitePubSub(PubSub):
+    """
+    Шина через общий файл SQLite: сообщения - строки таблицы, каждый
+    воркер раз в poll_interval читает новые по возрастанию id. Задержка
+    доставки - до poll_interval; старые сообщения удаляются через retention
+    секунд. Подходит для воркеров на одной машине без внешних сервисов.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, poll_interval: float = 0.02, retention: float = 60.0):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+
+        self.conn: Optional[sqlite3.Connection] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.last_id = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        # Одно соединение и один поток: запросы шины идут строго по очереди
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pubsub")
+        await self._run(self._open)
+        self.task = asyncio.create_task(self._poll())
+        logger.info(f"📮 Шина SQLite: {self.path}")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.executor:
+            await self._run(self.conn.close)
+            self.executor.shutdown(wait=True)
+
+    def _open(self):
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS bus_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS bus_claims (
+                key TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        self.conn.commit()
+        # Историю до запуска не переигрываем
+        self.last_id = self.conn.execute("SELECT IFNULL(MAX(id), 0) FROM bus_messages").fetchone()[0]
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def publish(self, channel: str, payload: str):
+        await self._run(self._insert, channel, payload)
+        self.stats["published"] += 1
+
+    def _insert(self, channel: str, payload: str):
+        self.conn.execute(
+            "INSERT INTO bus_messages (channel, payload, created_at) VALUES (?, ?, ?)",
+            (channel, payload, time.time())
+        )
+        self.conn.commit()
+
+    def _fetch_new(self) -> List[Tuple[int, str, str]]:
+        return self.conn.execute(
+            "SELECT id, channel, payload FROM bus_messages WHERE id > ? ORDER BY id",
+            (self.last_id,)
+        ).fetchall()
+
+    def _cleanup(self):
+        self.conn.execute("DELETE FROM bus_messages WHERE created_at < ?", (time.time() - self.retention,))
+        self.conn.execute("DELETE FROM bus_claims WHERE expires_at < ?", (time.time(),))
+        self.conn.commit()
+
+    async def _poll(self):
+        last_cleanup = time.monotonic()
+        while True:
+            try:
+                for message_id, channel, payload in await self._run(self._fetch_new):
+                    self.last_id = message_id
+                    self._dispatch(channel, payload)
+
+                if time.monotonic() - last_cleanup > self.retention:
+                    last_cleanup = time.monotonic()
+                    await self._run(self._cleanup)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"❌ Ошибка чтения шины SQLite: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        return await self._run(self._claim, key, ttl)
+
+    def _claim(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        # Вставка или перехват истекшего ключа - одним выражением
+        cursor = self.conn.execute('''
+            INSERT INTO bus_claims (key, expires_at) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET expires_at = excluded.expires_at
+            WHERE bus_claims.expires_at < ?
+        ''', (key, now + ttl, now))
+        self.conn.commit()
+        return cursor.rowcount == 1
+
+
+# ========== REDIS ==========
+class RespConnection:
+    """Минимальный клиент протокола Redis (RESP2) поверх asyncio"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int, password: Optional[str] = None, db: int = 0) -> "RespConnection":
+        reader, writer = await asyncio.open_connection(host, port)
+        connection = cls(reader, writer)
+        if password:
+            await connection.execute("AUTH", password)
+        if db:
+            await connection.execute("SELECT", str(db))
+        return connection
+
+    def send(self, *args: str):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg.encode('utf-8') if isinstance(arg, str) else arg
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        self.writer.write(b"".join(parts))
+
+    async def execute(self, *args: str) -> Any:
+        self.send(*args)
+        await self.writer.drain()
+        return await self.read_reply()
+
+    async def read_reply(self) -> Any:
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis закрыл соединение")
+        kind, body = line[:1], line[1:-2]
+
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RuntimeError(f"Redis: {body.decode()}")
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2].decode('utf-8')
+        if kind == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise RuntimeError(f"Непонятный ответ Redis: {line!r}")
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisPubSub(PubSub):
+    """
+    Шина через Redis: PUBLISH/SUBSCRIBE для событий, SET NX EX для claim.
+    Два соединения - команды и подписка (подписанное соединение в Redis
+    других команд не принимает); подписка переподключается сама.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, reconnect_delay: float = 1.0):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip("/") or 0)
+        self.reconnect_delay = reconnect_delay
+
+        self.commands: Optional[RespConnection] = None
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.subscribed = asyncio.Event()
+
+    async def start(self):
+        self.task = asyncio.create_task(self._listen())
+        # Подписка должна быть активна до первых событий
+        await asyncio.wait_for(self.subscribed.wait(), timeout=10)
+        logger.info(f"📮 Шина Redis: {self.host}:{self.port}/{self.db}")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.commands:
+            self.commands.close()
+
+    async def _command(self, *args: str) -> Any:
+        async with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.commands is None:
+                        self.commands = await RespConnection.open(self.host, self.port, self.password, self.db)
+                    return await self.commands.execute(*args)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    self.commands = None
+                    if attempt:
+                        raise
+
+    async def publish(self, channel: str, payload: str):
+        await self._command("PUBLISH", channel, payload)
+        self.stats["published"] += 1
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        reply = await self._command("SET", key, "1", "NX", "PX", str(int(ttl * 1000)))
+        return reply == "OK"
+
+    async def _listen(self):
+        while True:
+            connection = None
+            try:
+                connection = await RespConnection.open(self.host, self.port, self.password, self.db)
+                channels = list(self.handlers)
+                if not channels:
+                    self.subscribed.set()
+                    return
+                connection.send("SUBSCRIBE", *channels)
+                await connection.writer.drain()
+                for _ in channels:
+                    await connection.read_reply()
+                self.subscribed.set()
+
+                while True:
+                    reply = await connection.read_reply()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == "message":
+                        self._dispatch(reply[1], reply[2])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"⚠️ Подписка Redis прервана: {e}; переподключение")
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                if connection:
+                    connection.close()
+
+
+def create_pubsub(url: Optional[str], default_sqlite_path: str) -> PubSub:
+    """Шина по PUBSUB_URL (см. описание в начале модуля)"""
+    url = (url or "local").strip()
+    if url == "local":
+        return LocalPubSub()
+    if url == "sqlite":
+        return SqlitePubSub(default_sqlite_path)
+    if url.startswith("sqlite:///"):
+        return SqlitePubSub(url[len("sqlite:///"):] or default_sqlite_path)
+    if url.startswith("redis://"):
+        return RedisPubSub(url)
+    raise ValueError(f"Неизвестный PUBSUB_URL: {url}")
@@ -0,0 +1,242 @@
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import Database
+
+# ========== ПОЧАСОВЫЕ АГРЕГАТЫ ==========
+# Таблица problems_hourly (миграция 2) хранит на каждый час × категорию ×
+# тональность число проблем, число критических (priority >= 2) и сумму
+# приоритетов. Её ведут триггеры на problems, поэтому статистика за любое
+# окно - это сумма нескольких сотен строк агрегата, а не проход по проблемам.
+# Точность окна - час: окно в N часов - это текущий неполный час и N-1
+# предыдущих, так что окно в 1 час - только текущий час.
+
+BUCKET_FORMAT = '%Y-%m-%d %H:00:00'
+DEFAULT_WINDOW_HOURS = 24
+MAX_WINDOW_HOURS = 366 * 24
+
+_timeframe_re = re.compile(r'^(\d+)\s*([hdw])$')
+_units_in_hours = {"h": 1, "d": 24, "w": 24 * 7}
+
+
+def parse_timeframe(timeframe: Optional[str]) -> int:
+    """'24h', '7d', '30d', '12w' -> число часов; непонятное - 24 часа"""
+    match = _timeframe_re.match((timeframe or '').strip().lower())
+    if not match:
+        return DEFAULT_WINDOW_HOURS
+    hours = int(match.group(1)) * _units_in_hours[match.group(2)]
+    return max(1, min(hours, MAX_WINDOW_HOURS))
+
+
+def window_start(hours: int, now: Optional[datetime] = None) -> str:
+    """Первый час окна в формате bucket (время UTC, как datetime('now') в SQLite)"""
+    now = now or datetime.utcnow()
+    return (now - timedelta(hours=hours - 1)).strftime(BUCKET_FORMAT)
+
+
+async def window_totals(database: Database, hours: int) -> Dict[str, Any]:
+    row = await database.fetchone('''
+        SELECT SUM(problems), SUM(critical), SUM(priority_sum)
+        FROM problems_hourly
+        WHERE bucket >= ?
+    ''', (window_start(hours),))
+
+    total, critical, priority_sum = (value or 0 for value in row)
+    return {
+        "total": total,
+        "critical": critical,
+        "avg_priority": round(priority_sum / total, 2) if total else 0.0
+    }
+
+
+async def window_by_category(database: Database, hours: int, limit: int = 10) -> List[Dict[str, Any]]:
+    rows = await database.fetchall('''
+        SELECT category, SUM(problems) as count
+        FROM problems_hourly
+        WHERE bucket >= ?
+        GROUP BY category
+        ORDER BY count DESC
+        LIMIT ?
+    ''', (window_start(hours), limit))
+    return [{"category": row[0], "count": row[1]} for row in rows]
+
+
+async def timeseries(database: Database, hours: int, bucket: str = "hour",
+                     category: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Ряд по часам или дням за окно. Пустые интервалы заполняются нулями,
+    чтобы график не "склеивал" соседние точки
+    """
+    size = 10 if bucket == "day" else 19  # длина префикса bucket: дата или дата+час
+    where, params = "bucket >= ?", [window_start(hours)]
+    if category and category != 'all':
+        where += " AND category = ?"
+        params.append(category)
+
+    rows = await database.fetchall(f'''
+        SELECT substr(bucket, 1, {size}) as period,
+               SUM(problems), SUM(critical), SUM(priority_sum)
+        FROM problems_hourly
+        WHERE {where}
+        GROUP BY period
+        ORDER BY period
+    ''', params)
+    by_period = {row[0]: row[1:] for row in rows}
+
+    step = timedelta(days=1) if bucket == "day" else timedelta(hours=1)
+    now = datetime.utcnow()
+    current = datetime.strptime(window_start(hours, now), BUCKET_FORMAT)
+    if bucket == "day":
+        current = current.replace(hour=0)
+
+    series = []
+    while current <= now:
+        period = current.strftime(BUCKET_FORMAT)[:size]
+        problems, critical, priority_sum = by_period.get(period, (0, 0, 0))
+        series.append({
+            "bucket": period,
+            "count": problems,
+            "critical": critical,
+            "avg_priority": round(priority_sum / problems, 2) if problems else 0.0
+        })
+        current += step
+    return series
+
+
+# ========== ТРЕНДЫ ==========
+# Ряды по категориям и локациям берутся из problems_daily (миграция 3):
+# день × категория × локация со счетчиками по порогам приоритета. Часовые
+# ряды - из problems_hourly, где локаций нет, а из порогов есть только
+# "все" (0) и "критические" (2).
+
+TREND_BUCKETS = ("hour", "day", "week")
+TREND_SPLITS = ("category", "location", "category_location", "none")
+MAX_HOURLY_WINDOW_HOURS = 31 * 24
+
+# Колонка problems_daily для порога min_priority
+PRIORITY_COLUMNS = {0: "problems", 1: "prio1", 2: "prio2", 3: "prio3"}
+HOURLY_PRIORITY_COLUMNS = {0: "problems", 2: "critical"}
+
+
+class TTLCache:
+    """Небольшой LRU-кэш ответов с временем жизни"""
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value):
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+def trend_labels(hours: int, bucket: str, now: Optional[datetime] = None) -> List[str]:
+    """Все интервалы окна по порядку - ряды выравниваются по ним и заполняются нулями"""
+    now = now or datetime.utcnow()
+    start = now - timedelta(hours=hours)
+
+    if bucket == "hour":
+        current, step, fmt = datetime.strptime(window_start(hours, now), BUCKET_FORMAT), timedelta(hours=1), BUCKET_FORMAT
+    elif bucket == "week":
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        current, step, fmt = day - timedelta(days=day.weekday()), timedelta(days=7), '%Y-%m-%d'
+    else:
+        current, step, fmt = start.replace(hour=0, minute=0, second=0, microsecond=0), timedelta(days=1), '%Y-%m-%d'
+
+    labels = []
+    while current <= now:
+        labels.append(current.strftime(fmt))
+        current += step
+    return labels
+
+
+def _in_clause(column: str, values: List[str], params: List[Any]) -> str:
+    params.extend(values)
+    return f"{column} IN ({', '.join('?' for _ in values)})"
+
+
+async def trend_series(database: Database, hours: int, bucket: str = "day",
+                       categories: Optional[List[str]] = None, locations: Optional[List[str]] = None,
+                       min_priority: int = 0, split_by: str = "category") -> Dict[str, Any]:
+    """
+    Ряды числа проблем по интервалам. Ошибки параметров - ValueError
+    (комбинации, которых нет в агрегатах)
+    """
+    if bucket not in TREND_BUCKETS:
+        raise ValueError(f"bucket: одно из {', '.join(TREND_BUCKETS)}")
+    if split_by not in TREND_SPLITS:
+        raise ValueError(f"split_by: одно из {', '.join(TREND_SPLITS)}")
+
+    if bucket == "hour":
+        if locations or split_by in ("location", "category_location"):
+            raise ValueError("Часовые ряды строятся только по категориям, без локаций")
+        if min_priority not in HOURLY_PRIORITY_COLUMNS:
+            raise ValueError("Для часовых рядов min_priority: 0 или 2")
+        if hours > MAX_HOURLY_WINDOW_HOURS:
+            raise ValueError("Часовые ряды - не длиннее 31 дня")
+        table, value_column = "problems_hourly", HOURLY_PRIORITY_COLUMNS[min_priority]
+        period, start = "bucket", window_start(hours)
+        time_column = "bucket"
+    else:
+        if min_priority not in PRIORITY_COLUMNS:
+            raise ValueError("min_priority: от 0 до 3")
+        table, value_column = "problems_daily", PRIORITY_COLUMNS[min_priority]
+        period = "date(day, 'weekday 0', '-6 days')" if bucket == "week" else "day"
+        start = (datetime.utcnow() - timedelta(hours=hours)).strftime('%Y-%m-%d')
+        time_column = "day"
+
+    # Для недель окно расширяем до понедельника - первая неделя будет полной
+    labels = trend_labels(hours, bucket)
+    if bucket == "week":
+        start = labels[0]
+
+    keys = {"category": ["category"], "location": ["location"],
+            "category_location": ["category", "location"], "none": []}[split_by]
+
+    params: List[Any] = [start]
+    where = [f"{time_column} >= ?"]
+    if categories:
+        where.append(_in_clause("category", categories, params))
+    if locations:
+        where.append(_in_clause("location", locations, params))
+
+    select_keys = "".join(f"{key}, " for key in keys)
+    rows = await database.fetchall(f'''
+        SELECT {select_keys}{period} as period, SUM({value_column})
+        FROM {table}
+        WHERE {" AND ".join(where)}
+        GROUP BY {select_keys}period
+    ''', params)
+
+    index = {label: position for position, label in enumerate(labels)}
+    series: Dict[tuple, Dict[str, Any]] = {}
+    for row in rows:
+        key, label, value = tuple(row[:len(keys)]), row[len(keys)], row[len(keys) + 1] or 0
+        position = index.get(label)
+        if position is None or not value:
+            continue
+        entry = series.get(key)
+        if entry is None:
+            entry = dict(zip(keys, key))
+            entry.update({"points": [0] * len(labels), "total": 0})
+            series[key] = entry
+        entry["points"][position] += value
+        entry["total"] += value
+
+    return {
+        "buckets": labels,
+        "series": sorted(series.values(), key=lambda item: -item["total"])
+    }
@@ -0,0 +1,355 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+try:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.exceptions import (TelegramBadRequest, TelegramForbiddenError,
+                                    TelegramMigrateToChat, TelegramNotFound, TelegramRetryAfter)
+    AIOGRAM_AVAILABLE = True
+except ImportError:
+    AIOGRAM_AVAILABLE = False
+
+# Предел длины сообщения Bot API
+MAX_MESSAGE_LENGTH = 4096
+# Сколько оповещений помещаем в одну сводку
+MAX_DIGEST_ALERTS = 30
+# Ответы 400, означающие, что чата больше нет (удален, пользователь деактивирован)
+GONE_CHAT_ERRORS = ("chat not found", "user is deactivated", "group chat was deactivated",
+                    "peer_id_invalid", "chat_write_forbidden")
+
+
+# ========== ОГРАНИЧЕНИЕ СКОРОСТИ ==========
+class TokenBucket:
+    """Не больше rate отправок в секунду в среднем, всплеск - до burst"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# ========== ДОСТАВКА ОПОВЕЩЕНИЙ В TELEGRAM ==========
+class TelegramNotifier:
+    """
+    Очередь отправки оповещений в чаты администраторов.
+
+    enqueue() записывает оповещение для каждого подписанного чата в
+    telegram_outbox и сразу возвращается; отправляет фоновая задача.
+    Ограничения Telegram соблюдаются заранее: общий темп - global_rate
+    сообщений в секунду, в один чат - не чаще раза в chat_interval секунд.
+    Всё, что накопилось для чата за это время, уходит одной сводкой.
+
+    Ответ 429 (flood wait) откладывает чат на retry_after секунд, сетевые
+    ошибки и 5xx - на растущую паузу; бот, которого заблокировали или
+    удалили из чата, отписывается. Неотправленное остается в БД со статусом
+    pending и досылается после перезапуска (не старше max_age секунд).
+    """
+
+    def __init__(self, database: Database, token: Optional[str], api_url: Optional[str] = None,
+                 chat_interval: float = 3.0, global_rate: float = 25.0, max_age: float = 86400.0,
+                 max_backoff: float = 300.0, claim: Optional[Callable[[str, float], Awaitable[bool]]] = None):
+        self.database = database
+        self.token = token
+        self.api_url = api_url
+        self.chat_interval = chat_interval
+        self.global_limit = TokenBucket(global_rate)
+        self.max_age = max_age
+        self.max_backoff = max_backoff
+        self.claim = claim
+
+        self.enabled = bool(token) and AIOGRAM_AVAILABLE
+        self.bot = None
+        self.chats: Dict[int, Optional[str]] = {}
+
+        # chat_id -> очередь (id строки outbox, оповещение)
+        self.queues: Dict[int, Deque[Tuple[int, Dict[str, Any]]]] = {}
+        self.ready_at: Dict[int, float] = {}
+        self.failures: Dict[int, int] = {}
+        self.in_flight: Set[int] = set()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.send_tasks: Set[asyncio.Task] = set()
+
+        self.stats = {"queued": 0, "sent_messages": 0, "sent_alerts": 0, "digests": 0,
+                      "flood_waits": 0, "retries": 0, "dropped": 0}
+
+    # ---------- жизненный цикл ----------
+    async def start(self, seed_chats: Optional[List[int]] = None):
+        if not self.enabled:
+            reason = "нет TELEGRAM_TOKEN" if AIOGRAM_AVAILABLE else "не установлен aiogram"
+            logger.info(f"📵 Оповещения в Telegram выключены ({reason})")
+            return
+
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.api_url)) if self.api_url else AiohttpSession()
+        self.bot = Bot(token=self.token, session=session)
+
+        for chat_id in seed_chats or ():
+            await self.subscribe(chat_id)
+        rows = await self.database.fetchall("SELECT chat_id, title FROM telegram_subscriptions WHERE active = 1")
+        self.chats = {row[0]: row[1] for row in rows}
+
+        # Недоставленное досылает один воркер
+        if self.claim is None or await self.claim("telegram:recovery", 60):
+            await self._recover()
+
+        self.task = asyncio.create_task(self._run())
+        logger.info(f"📨 Оповещения в Telegram: {len(self.chats)} чатов")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        for task in list(self.send_tasks):
+            task.cancel()
+        if self.bot:
+            await self.bot.session.close()
+
+    async def _recover(self):
+        def recover(conn):
+            conn.execute('''
+                UPDATE telegram_outbox SET status = 'expired'
+                WHERE status = 'pending' AND created_at < datetime('now', ?)
+            ''', (f'-{int(self.max_age)} seconds',))
+            conn.execute('''
+                DELETE FROM telegram_outbox
+                WHERE status != 'pending' AND created_at < datetime('now', '-7 days')
+            ''')
+            conn.commit()
+            return conn.execute('''
+                SELECT id, chat_id, alert FROM telegram_outbox
+                WHERE status = 'pending' ORDER BY id
+            ''').fetchall()
+
+        rows = await self.database.write(recover)
+        for outbox_id, chat_id, alert in rows:
+            self.queues.setdefault(chat_id, deque()).append((outbox_id, json.loads(alert)))
+        if rows:
+            logger.info(f"📨 Досылаем {len(rows)} оповещений после перезапуска")
+
+    # ---------- подписки ----------
+    async def subscribe(self, chat_id: int, title: Optional[str] = None):
+        def upsert(conn):
+            conn.execute('''
+                INSERT INTO telegram_subscriptions (chat_id, title, active) VALUES (?, ?, 1)
+                ON CONFLICT (chat_id) DO UPDATE SET active = 1, title = IFNULL(excluded.title, title)
+            ''', (chat_id, title))
+            conn.commit()
+
+        await self.database.write(upsert)
+        self.chats[chat_id] = title
+
+    async def unsubscribe(self, chat_id: int):
+        def deactivate(conn):
+            conn.execute("UPDATE telegram_subscriptions SET active = 0 WHERE chat_id = ?", (chat_id,))
+            conn.execute("UPDATE telegram_outbox SET status = 'dropped' WHERE chat_id = ? AND status = 'pending'",
+                         (chat_id,))
+            conn.commit()
+
+        await self.database.write(deactivate)
+        self.chats.pop(chat_id, None)
+        self.stats["dropped"] += len(self.queues.pop(chat_id, ()))
+
+    # ---------- постановка в очередь ----------
+    async def enqueue(self, alert: Dict[str, Any]):
+        """Оповещение всем подписанным чатам: запись в outbox, отправка - в фоне"""
+        if not self.enabled:
+            return
+
+        payload = json.dumps(alert, ensure_ascii=False)
+
+        def insert(conn):
+            # Подписки читаем из БД: чат могли подписать через другой воркер
+            cursor = conn.cursor()
+            rows = []
+            for (chat_id,) in cursor.execute("SELECT chat_id FROM telegram_subscriptions WHERE active = 1").fetchall():
+                cursor.execute("INSERT INTO telegram_outbox (chat_id, alert) VALUES (?, ?)", (chat_id, payload))
+                rows.append((chat_id, cursor.lastrowid))
+            conn.commit()
+            return rows
+
+        rows = await self.database.write(insert)
+        for chat_id, outbox_id in rows:
+            self.chats.setdefault(chat_id, None)
+            self.queues.setdefault(chat_id, deque()).append((outbox_id, alert))
+        self.stats["queued"] += len(rows)
+        self.wakeup.set()
+
+    # ---------- отправка ----------
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            waiting = [chat_id for chat_id, queue in self.queues.items() if queue and chat_id not in self.in_flight]
+            ready = sorted((chat_id for chat_id in waiting if self.ready_at.get(chat_id, 0) <= now),
+                           key=lambda chat_id: self.ready_at.get(chat_id, 0))
+
+            if not ready:
+                delays = [self.ready_at[chat_id] - now for chat_id in waiting if chat_id in self.ready_at]
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=min(delays) if delays else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for chat_id in ready:
+                await self.global_limit.acquire()
+                self.in_flight.add(chat_id)
+                task = asyncio.create_task(self._send_chat(chat_id))
+                self.send_tasks.add(task)
+                task.add_done_callback(self.send_tasks.discard)
+
+    async def _send_chat(self, chat_id: int):
+        queue = self.queues.get(chat_id) or deque()
+        batch = [queue[i] for i in range(min(len(queue), MAX_DIGEST_ALERTS))]
+        text, included = self.format_message([alert for _, alert in batch])
+        batch = batch[:included]
+        ids = [outbox_id for outbox_id, _ in batch]
+
+        try:
+            await self.bot.send_message(chat_id, text, disable_web_page_preview=True)
+
+        except TelegramRetryAfter as e:
+            # Flood wait: Telegram сам говорит, сколько ждать
+            self.stats["flood_waits"] += 1
+            self.ready_at[chat_id] = time.monotonic() + e.retry_after
+            await self._mark_attempt(ids)
+
+        except TelegramMigrateToChat as e:
+            # Группа стала супергруппой - у неё новый chat_id
+            await self._migrate_chat(chat_id, e.migrate_to_chat_id)
+
+        except (TelegramForbiddenError, TelegramNotFound) as e:
+            logger.warning(f"⚠️ Чат {chat_id} недоступен для бота ({e}), отписываем")
+            await self.unsubscribe(chat_id)
+
+        except TelegramBadRequest as e:
+            if any(error in e.message.lower() for error in GONE_CHAT_ERRORS):
+                logger.warning(f"⚠️ Чат {chat_id} больше не существует ({e}), отписываем")
+                await self.unsubscribe(chat_id)
+                return
+
+            # Повтор не поможет: сообщение отбрасываем, подписка остается
+            logger.warning(f"⚠️ Telegram отклонил сообщение для чата {chat_id}: {e}")
+            for _ in batch:
+                queue.popleft()
+            self.stats["dropped"] += len(batch)
+            await self._mark(ids, "failed")
+
+        except Exception as e:
+            # Сеть, 5xx: пауза растет 2, 4, 8... секунд до max_backoff
+            self.stats["retries"] += 1
+            self.failures[chat_id] = self.failures.get(chat_id, 0) + 1
+            delay = min(self.max_backoff, 2 ** self.failures[chat_id])
+            self.ready_at[chat_id] = time.monotonic() + delay
+            logger.warning(f"⚠️ Ошибка отправки в чат {chat_id}: {e}; повтор через {delay} с")
+            await self._mark_attempt(ids)
+
+        else:
+            for _ in batch:
+                queue.popleft()
+            self.failures.pop(chat_id, None)
+            self.ready_at[chat_id] = time.monotonic() + self.chat_interval
+            self.stats["sent_messages"] += 1
+            self.stats["sent_alerts"] += len(batch)
+            self.stats["digests"] += len(batch) > 1
+            await self._mark(ids, "sent")
+
+        finally:
+            self.in_flight.discard(chat_id)
+            self.wakeup.set()
+
+    async def _migrate_chat(self, old_chat_id: int, new_chat_id: int):
+        """Перенос подписки и очереди на новый chat_id"""
+        title = self.chats.get(old_chat_id)
+        queue = self.queues.pop(old_chat_id, deque())
+
+        def migrate(conn):
+            conn.execute("UPDATE telegram_subscriptions SET active = 0 WHERE chat_id = ?", (old_chat_id,))
+            conn.execute("UPDATE telegram_outbox SET chat_id = ? WHERE chat_id = ? AND status = 'pending'",
+                         (new_chat_id, old_chat_id))
+            conn.commit()
+
+        await self.database.write(migrate)
+        self.chats.pop(old_chat_id, None)
+        await self.subscribe(new_chat_id, title)
+        self.queues.setdefault(new_chat_id, deque()).extend(queue)
+
+    async def _mark(self, ids: List[int], status: str):
+        def update(conn):
+            conn.executemany("UPDATE telegram_outbox SET status = ?, sent_at = datetime('now') WHERE id = ?",
+                             [(status, outbox_id) for outbox_id in ids])
+            conn.commit()
+        await self.database.write(update)
+
+    async def _mark_attempt(self, ids: List[int]):
+        def update(conn):
+            conn.executemany("UPDATE telegram_outbox SET attempts = attempts + 1 WHERE id = ?",
+                             [(outbox_id,) for outbox_id in ids])
+            conn.commit()
+        await self.database.write(update)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "enabled": self.enabled,
+            "chats": len(self.chats),
+            "pending": sum(len(queue) for queue in self.queues.values()),
+            "waiting_chats": sum(1 for chat_id, queue in self.queues.items()
+                                 if queue and self.ready_at.get(chat_id, 0) > now),
+            **self.stats
+        }
+
+    # ---------- текст ----------
+    @staticmethod
+    def format_alert(alert: Dict[str, Any]) -> str:
+        lines = [
+            alert.get("title") or "🚨 ОПОВЕЩЕНИЕ",
+            f"Категория: {alert.get('category', 'Неизвестно')}",
+            f"Место: {alert.get('location', 'Не указано')}",
+            f"Описание: {alert.get('text', '')}",
+        ]
+        if alert.get("priority"):
+            lines.append(f"Приоритет: {alert['priority']}/3")
+        lines.append(f"Время: {alert.get('time', '')}")
+        return "\n".join(lines)
+
+    @classmethod
+    def format_message(cls, alerts: List[Dict[str, Any]]) -> Tuple[str, int]:
+        """Текст сообщения и сколько оповещений в него вошло (одно - целиком, несколько - сводкой)"""
+        if len(alerts) == 1:
+            return cls.format_alert(alerts[0])[:MAX_MESSAGE_LENGTH], 1
+
+        header = f"🚨 Новых оповещений: {len(alerts)}\n"
+        lines = []
+        length = len(header)
+        for alert in alerts:
+            line = (f"\n• {alert.get('time', '')} {alert.get('title') or 'Оповещение'}: "
+                    f"{alert.get('category', '')} — {alert.get('location', '')}")
+            if length + len(line) > MAX_MESSAGE_LENGTH:
+                break
+            lines.append(line)
+            length += len(line)
+
+        # Не вместившиеся уйдут следующим сообщением
+        header = f"🚨 Новых оповещений: {len(lines)}\n"
+        return header + "".join(lines), len(lines)
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from database import Database
+from problems_repository import insert_problems
+
+logger = logging.getLogger(__name__)
+
+# Начиная с этого priority проблема идет в срочную полосу
+HIGH_PRIORITY = 2
+
+
+class QueueFullError(Exception):
+    """Очередь записи заполнена - клиенту нужно повторить позже"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Очередь записи заполнена, повторите через {retry_after} с")
+        self.retry_after = retry_after
+
+
+# ========== ОЧЕРЕДЬ ЗАПИСИ С ГРУППОВЫМ COMMIT ==========
+class GroupCommitWriter:
+    """
+    Write-behind очередь для таблицы problems.
+
+    Обработчики кладут строки в очередь и сразу отвечают клиенту, а отдельная
+    задача-писатель забирает всё накопленное за max_delay секунд (или до
+    max_batch строк) и пишет одной транзакцией через писателя Database.
+    Один fsync на пачку вместо одного на строку.
+
+    Очередь ограничена capacity строками и разделена на две полосы: срочные
+    проблемы (priority >= HIGH_PRIORITY) пишутся первыми, а обычным доступна
+    только часть емкости (normal_share), чтобы при заторе оставалось место
+    для срочных. Если места нет, submit бросает QueueFullError.
+
+    Если пачка не записалась (строка нарушает ограничение схемы и т.п.),
+    строки пишутся по одной: теряется только плохая строка, а не строки
+    других клиентов, которым уже ответили "принято".
+    """
+
+    def __init__(self, database: Database,
+                 on_commit: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+                 max_batch: int = 500, max_delay: float = 0.005,
+                 capacity: int = 5000, normal_share: float = 0.8):
+        self.database = database
+        self.on_commit = on_commit
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.capacity = capacity
+        self.normal_limit = int(capacity * normal_share)
+
+        self.high = deque()
+        self.normal = deque()
+        self.pending = asyncio.Event()
+        self.committing = False
+        self.task: Optional[asyncio.Task] = None
+        self.notify_tasks: Set[asyncio.Task] = set()
+
+        # Скорость записи (строк/с), по ней считаем Retry-After
+        self.rate = 0.0
+
+        self.stats = {"queued": 0, "committed": 0, "batches": 0, "failed": 0,
+                      "rejected": 0, "max_batch_seen": 0}
+
+    @property
+    def depth(self) -> int:
+        return len(self.high) + len(self.normal)
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+        logger.info(f"✍️ Очередь записи запущена (пачка до {self.max_batch} строк / {self.max_delay * 1000:.0f} мс)")
+
+    async def stop(self):
+        """Дописываем всё, что уже в очереди"""
+        if self.task:
+            while self.depth or self.committing:
+                await asyncio.sleep(self.max_delay or 0.01)
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.notify_tasks:
+            await asyncio.gather(*self.notify_tasks, return_exceptions=True)
+        logger.info(f"✍️ Очередь записи остановлена, записано строк: {self.stats['committed']}")
+
+    # ---------- прием ----------
+    async def submit(self, problem: Dict[str, Any], wait_for_commit: bool = False) -> Optional[int]:
+        """Ставит строку в очередь; при wait_for_commit ждет COMMIT и возвращает id (ошибка записи - исключение)"""
+        futures = self._enqueue([problem], wait_for_commit)
+        return await futures[0] if wait_for_commit else None
+
+    async def submit_many(self, problems: List[Dict[str, Any]], wait_for_commit: bool = False) -> List[Optional[int]]:
+        """
+        Пачка принимается целиком или не принимается (QueueFullError).
+        При wait_for_commit возвращает id по строкам, None - строка не записана
+        """
+        futures = self._enqueue(problems, wait_for_commit)
+        if not wait_for_commit:
+            return []
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return [None if isinstance(result, BaseException) else result for result in results]
+
+    def _enqueue(self, problems: List[Dict[str, Any]], wait_for_commit: bool) -> List[Optional[asyncio.Future]]:
+        self._admit(problems)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for problem in problems:
+            future = loop.create_future() if wait_for_commit else None
+            lane = self.high if problem.get("priority", 0) >= HIGH_PRIORITY else self.normal
+            lane.append((problem, future))
+            futures.append(future)
+        self.stats["queued"] += len(problems)
+        if problems:
+            self.pending.set()
+        return futures
+
+    def _admit(self, problems):
+        high = sum(1 for p in problems if p.get("priority", 0) >= HIGH_PRIORITY)
+        normal = len(problems) - high
+
+        fits = self.depth + len(problems) <= self.capacity
+        if normal:
+            fits = fits and len(self.normal) + normal <= self.normal_limit
+        # Пачку больше лимита принимаем в пустую очередь, иначе она не пройдет никогда
+        if not fits and self.depth:
+            self.stats["rejected"] += len(problems)
+            raise QueueFullError(self.retry_after())
+
+    def retry_after(self) -> int:
+        """Через сколько секунд очередь примерно разгрузится"""
+        if self.rate <= 0:
+            return 1
+        return min(30, max(1, math.ceil(self.depth / self.rate)))
+
+    # ---------- запись ----------
+    def _take(self):
+        batch = []
+        for lane in (self.high, self.normal):
+            while lane and len(batch) < self.max_batch:
+                batch.append(lane.popleft())
+        if not self.depth:
+            self.pending.clear()
+        return batch
+
+    async def _run(self):
+        while True:
+            await self.pending.wait()
+
+            # Даем накопиться тому, что придет за max_delay
+            if self.depth < self.max_batch and self.max_delay:
+                await asyncio.sleep(self.max_delay)
+
+            batch = self._take()
+            self.committing = True
+            try:
+                await self._commit(batch)
+            finally:
+                self.committing = False
+
+    async def _commit(self, batch):
+        problems = [problem for problem, _ in batch]
+        started = time.monotonic()
+        try:
+            ids = await self.database.write(insert_problems, problems)
+        except Exception as e:
+            logger.error(f"❌ Ошибка групповой записи ({len(batch)} строк), пишем по одной: {e}")
+            batch, ids = await self._commit_one_by_one(batch)
+            problems = [problem for problem, _ in batch]
+            if not batch:
+                return
+
+        elapsed = max(time.monotonic() - started, 1e-4)
+        self.rate = len(ids) / elapsed if not self.rate else 0.8 * self.rate + 0.2 * len(ids) / elapsed
+        self.stats["committed"] += len(ids)
+        self.stats["batches"] += 1
+        self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(ids))
+
+        for (problem, future), problem_id in zip(batch, ids):
+            problem["id"] = problem_id
+            if future and not future.done():
+                future.set_result(problem_id)
+
+        if self.on_commit:
+            # Рассылка не должна задерживать следующую пачку
+            task = asyncio.create_task(self._notify(problems))
+            self.notify_tasks.add(task)
+            task.add_done_callback(self.notify_tasks.discard)
+
+    async def _commit_one_by_one(self, batch):
+        """Запись строк по отдельности; возвращает записанные строки и их id"""
+        committed, ids = [], []
+        for problem, future in batch:
+            try:
+                problem_ids = await self.database.write(insert_problems, [problem])
+            except Exception as e:
+                logger.error(f"❌ Строка не записана ({problem.get('category')} - {problem.get('location')}): {e}")
+                self.stats["failed"] += 1
+                if future and not future.done():
+                    future.set_exception(e)
+                continue
+            committed.append((problem, future))
+            ids.extend(problem_ids)
+        return committed, ids
+
+    async def _notify(self, problems):
+        try:
+            await self.on_commit(problems)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработчика после записи: {e}")
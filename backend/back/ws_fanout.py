@@ -0,0 +1,413 @@
+import asyncio
+import json
+import logging
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Оповещения не выбрасываются никогда, даже сверх лимита очереди
+CRITICAL_TYPES = {"alert"}
+# Периодическая статистика: в очереди нужна только последняя
+REPLACEABLE_TYPES = {"stats_update"}
+
+# Подписка без фильтра по измерению
+ANY = "*"
+MAX_PRIORITY = 5
+MAX_SUBSCRIPTION_VALUES = 50
+
+# Канал общей шины для рассылки между воркерами
+WS_CHANNEL = "ws"
+
+# Код закрытия для клиента, который не успевает читать ("try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+# ========== КОДИРОВАНИЕ ==========
+def encode_message(message: Dict[str, Any]) -> str:
+    """
+    Компактный JSON одного события. Строка кодируется один раз и
+    разделяется всеми адресатами; orjson - если установлен
+    """
+    if orjson is not None:
+        return orjson.dumps(message, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+# ========== ОЧЕРЕДЬ ОДНОГО КЛИЕНТА ==========
+class ClientChannel:
+    """
+    Исходящая очередь соединения и её задача-писатель.
+
+    Переполнение (политика медленного клиента):
+        - новое stats_update заменяет все ещё не отправленные;
+        - при полной очереди сначала выбрасывается самое старое
+          stats_update, потом самое старое обычное сообщение;
+        - alert не выбрасывается никогда;
+        - переполнение - потеря целой очереди (capacity) обычных сообщений,
+          пока клиент не догнал рассылку; после max_overflows переполнений
+          подряд клиент отключается. Разовая пачка не страшна: как только
+          очередь опустеет, счет начинается заново.
+    Отправка дольше send_timeout секунд тоже отключает клиента.
+    """
+
+    def __init__(self, websocket: WebSocket, capacity: int, send_timeout: float, max_overflows: int):
+        self.websocket = websocket
+        self.capacity = capacity
+        self.send_timeout = send_timeout
+        self.max_overflows = max_overflows
+
+        self.queue: Deque[Tuple[str, str]] = deque()
+        # Сколько сообщений каждого типа в очереди: чтобы не перебирать её
+        # на каждом переполнении
+        self.queued_types: Counter = Counter()
+        self.pending = asyncio.Event()
+        # Потеряно обычных сообщений с момента, когда очередь была пуста
+        self.lost_behind = 0
+        self.dropped = 0
+        self.sent = 0
+        self.closed = False
+        self.slow = False
+        self.close_reason: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def put(self, message_type: str, text: str):
+        """Неблокирующая постановка в очередь"""
+        if self.closed:
+            return
+
+        if self.queued_types[message_type] and message_type in REPLACEABLE_TYPES:
+            self.queue = deque(item for item in self.queue if item[0] != message_type)
+            self.dropped += self.queued_types.pop(message_type)
+
+        if len(self.queue) >= self.capacity and not self._drop_oldest(REPLACEABLE_TYPES):
+            if message_type in REPLACEABLE_TYPES:
+                # Очередь забита важным - свежую статистику просто пропускаем
+                self.dropped += 1
+                return
+
+            self.lost_behind += 1
+            if self.lost_behind >= self.capacity * self.max_overflows:
+                self.close(f"очередь переполнилась {self.max_overflows} раз подряд", slow=True)
+                return
+
+            # Теряем самое старое обычное сообщение, а если в очереди одни
+            # оповещения - само новое (оповещение же встает сверх лимита)
+            if not self._drop_oldest_regular() and message_type not in CRITICAL_TYPES:
+                self.dropped += 1
+                return
+
+        self.queue.append((message_type, text))
+        self.queued_types[message_type] += 1
+        self.pending.set()
+
+    def _drop_oldest(self, types) -> bool:
+        """Выбрасывает самое старое сообщение одного из типов types"""
+        if not any(self.queued_types[message_type] for message_type in types):
+            return False
+        for index, (message_type, _) in enumerate(self.queue):
+            if message_type in types:
+                self._drop_at(index)
+                return True
+        return False
+
+    def _drop_oldest_regular(self) -> bool:
+        """Выбрасывает самое старое сообщение, кроме оповещений"""
+        critical = sum(self.queued_types[message_type] for message_type in CRITICAL_TYPES)
+        if critical == len(self.queue):
+            return False
+        if not critical:
+            self._drop_at(0)
+            return True
+        for index, (message_type, _) in enumerate(self.queue):
+            if message_type not in CRITICAL_TYPES:
+                self._drop_at(index)
+                return True
+        return False
+
+    def _drop_at(self, index: int):
+        message_type, _ = self.queue[index]
+        del self.queue[index]
+        self.queued_types[message_type] -= 1
+        self.dropped += 1
+
+    def close(self, reason: str, slow: bool = False):
+        """Останавливает писателя; медленному клиенту он же закрывает соединение"""
+        if self.closed:
+            return
+        self.closed = True
+        self.slow = slow
+        self.close_reason = reason
+        self.pending.set()
+
+    async def run(self):
+        try:
+            while True:
+                await self.pending.wait()
+                if self.closed:
+                    break
+                if not self.queue:
+                    # Клиент догнал рассылку - счет переполнений заново
+                    self.lost_behind = 0
+                    self.pending.clear()
+                    continue
+
+                message_type, text = self.queue.popleft()
+                self.queued_types[message_type] -= 1
+                try:
+                    await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+                    self.sent += 1
+                except asyncio.TimeoutError:
+                    self.close(f"отправка дольше {self.send_timeout} с", slow=True)
+                except Exception as e:
+                    self.close(f"ошибка отправки: {e}")
+        finally:
+            self.queue.clear()
+            self.queued_types.clear()
+
+        if self.slow:
+            logger.warning(f"🐢 Медленный WebSocket-клиент отключен: {self.close_reason}")
+            try:
+                await asyncio.wait_for(self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE), self.send_timeout)
+            except Exception:
+                pass
+
+
+# ========== ПОДПИСКИ ==========
+def parse_subscription(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    {"type": "subscribe", "categories": [...], "locations": [...],
+     "districts": [...], "min_priority": 2} -> нормализованный фильтр.
+    districts - синоним locations: район хранится в том же поле location
+    """
+    def values(*keys) -> List[str]:
+        result = set()
+        for key in keys:
+            items = request.get(key) or []
+            if isinstance(items, str):
+                items = [items]
+            if not isinstance(items, list):
+                raise ValueError(f"{key}: ожидается список строк")
+            result.update(str(item).strip() for item in items if str(item).strip())
+        if len(result) > MAX_SUBSCRIPTION_VALUES:
+            raise ValueError(f"Не больше {MAX_SUBSCRIPTION_VALUES} значений в фильтре")
+        return sorted(result)
+
+    try:
+        min_priority = int(request.get("min_priority") or 0)
+    except (TypeError, ValueError):
+        raise ValueError("min_priority: целое число")
+
+    return {
+        "categories": values("categories"),
+        "locations": values("locations", "districts"),
+        "min_priority": max(0, min(min_priority, MAX_PRIORITY))
+    }
+
+
+class TopicIndex:
+    """
+    Индекс "тема -> подписчики". Ключ - пара (категория, локация), где
+    ANY означает "любая"; внутри ключа подписчики разложены по порогу
+    приоритета. Событие (категория, локация, приоритет) проверяет четыре
+    ключа и получает ровно тех, кому оно нужно: на клиента приходится
+    один ключ на каждую пару из его фильтра, так что дублей не бывает.
+    """
+
+    def __init__(self):
+        self.index: Dict[Tuple[str, str], Dict[int, Set[ClientChannel]]] = {}
+        self.keys: Dict[ClientChannel, List[Tuple[Tuple[str, str], int]]] = {}
+
+    def add(self, channel: ClientChannel, subscription: Dict[str, Any]):
+        self.remove(channel)
+        categories = subscription["categories"] or [ANY]
+        locations = subscription["locations"] or [ANY]
+        level = subscription["min_priority"]
+
+        keys = [((category, location), level) for category in categories for location in locations]
+        for key, level in keys:
+            self.index.setdefault(key, {}).setdefault(level, set()).add(channel)
+        self.keys[channel] = keys
+
+    def remove(self, channel: ClientChannel):
+        for key, level in self.keys.pop(channel, ()):
+            levels = self.index[key]
+            levels[level].discard(channel)
+            if not levels[level]:
+                del levels[level]
+            if not levels:
+                del self.index[key]
+
+    def match(self, category: str, location: str, priority: int) -> Iterable[ClientChannel]:
+        for key in ((category, location), (category, ANY), (ANY, location), (ANY, ANY)):
+            levels = self.index.get(key)
+            if not levels:
+                continue
+            for level, channels in levels.items():
+                if level <= priority:
+                    yield from channels
+
+
+# ========== РАССЫЛКА ==========
+class FanoutManager:
+    """
+    Менеджер WebSocket-соединений с рассылкой через очереди.
+
+    broadcast сериализует сообщение один раз и кладет его в общую очередь -
+    публикующему не важно, сколько клиентов подключено и как быстро они
+    читают. Задача-распределитель раскладывает сообщения по очередям
+    клиентов, а писатель каждого клиента отправляет их в своем темпе.
+
+    Сообщение с темой (категория, локация, приоритет) получают только
+    подписанные на неё клиенты - их находит TopicIndex; без темы
+    (статистика) - все. Новый клиент подписан на всё.
+
+    С общей шиной (bus, см. pubsub.py) broadcast уходит всем воркерам, и
+    каждый раздает сообщение своим клиентам; broadcast_local - только
+    клиентам этого процесса.
+    """
+
+    def __init__(self, queue_size: int = 100, send_timeout: float = 5.0, max_overflows: int = 3,
+                 bus=None):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.max_overflows = max_overflows
+        self.bus = bus
+        if bus is not None:
+            bus.subscribe(WS_CHANNEL, self._on_bus_message)
+
+        self.channels: Dict[WebSocket, ClientChannel] = {}
+        self.topics = TopicIndex()
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {
+            "broadcasts": 0,
+            "delivered": 0,
+            "dropped": 0,
+            "slow_disconnects": 0
+        }
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.channels)
+
+    # ---------- жизненный цикл ----------
+    async def start(self):
+        self.task = asyncio.create_task(self._distribute())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        for channel in list(self.channels.values()):
+            channel.close("остановка сервера")
+
+    # ---------- соединения ----------
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        channel = ClientChannel(websocket, self.queue_size, self.send_timeout, self.max_overflows)
+        channel.task = asyncio.create_task(self._serve(channel))
+        self.channels[websocket] = channel
+        self.topics.add(channel, parse_subscription({}))
+        logger.info(f"✅ WebSocket подключен. Всего подключений: {len(self.channels)}")
+
+    def disconnect(self, websocket: WebSocket):
+        channel = self.channels.pop(websocket, None)
+        if channel is None:
+            return
+        self.topics.remove(channel)
+        channel.close("клиент отключился")
+        logger.info(f"🔌 WebSocket отключен. Осталось подключений: {len(self.channels)}")
+
+    async def _serve(self, channel: ClientChannel):
+        await channel.run()
+        self.stats["delivered"] += channel.sent
+        self.stats["dropped"] += channel.dropped
+        if channel.slow:
+            self.stats["slow_disconnects"] += 1
+        self.disconnect(channel.websocket)
+
+    # ---------- отправка ----------
+    def subscribe(self, websocket: WebSocket, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Заменяет фильтр клиента; ошибки формата - ValueError"""
+        subscription = parse_subscription(request)
+        channel = self.channels.get(websocket)
+        if channel:
+            self.topics.add(channel, subscription)
+        return subscription
+
+    async def broadcast(self, message: dict, topic: Optional[Dict[str, Any]] = None):
+        """
+        Отправка сообщения подписанным клиентам всех воркеров (не ждет
+        отправки). topic - категория, локация и приоритет события; без него - всем
+        """
+        if self.bus is None:
+            await self.broadcast_local(message, topic)
+            return
+
+        # Кадр шины: заголовок [тип, тема] и уже сериализованное сообщение;
+        # в компактном JSON переводов строки нет
+        message_type, topic = message.get("type", ""), self._topic(topic)
+        await self.bus.publish(WS_CHANNEL, encode_message([message_type, topic]) + "\n" + encode_message(message))
+
+    async def broadcast_local(self, message: dict, topic: Optional[Dict[str, Any]] = None):
+        """Отправка только клиентам этого процесса"""
+        if not self.channels:
+            return
+        self._enqueue(message.get("type", ""), encode_message(message), self._topic(topic))
+
+    def _on_bus_message(self, payload: str):
+        header, text = payload.split("\n", 1)
+        message_type, topic = json.loads(header)
+        if self.channels:
+            self._enqueue(message_type, text, tuple(topic) if topic else None)
+
+    @staticmethod
+    def _topic(topic: Optional[Dict[str, Any]]) -> Optional[tuple]:
+        if topic is None:
+            return None
+        return (topic.get("category") or "", topic.get("location") or "", topic.get("priority") or 0)
+
+    def _enqueue(self, message_type: str, text: str, topic: Optional[tuple]):
+        self.stats["broadcasts"] += 1
+        self.outbox.put_nowait((message_type, text, topic))
+
+    async def send_personal_message(self, message: dict, websocket: WebSocket):
+        """Отправка сообщения конкретному клиенту - через его же очередь"""
+        self.send_encoded(websocket, message.get("type", ""), encode_message(message))
+
+    def send_encoded(self, websocket: WebSocket, message_type: str, text: str):
+        """Уже сериализованное сообщение конкретному клиенту"""
+        channel = self.channels.get(websocket)
+        if channel:
+            channel.put(message_type, text)
+
+    async def _distribute(self):
+        while True:
+            message_type, text, topic = await self.outbox.get()
+            recipients = list(self.topics.match(*topic) if topic else self.channels.values())
+            for channel in recipients:
+                channel.put(message_type, text)
+            # Даем писателям забрать сообщение: иначе пачка из сотен
+            # problem_created переполнит очереди даже быстрых клиентов
+            await asyncio.sleep(0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Счетчики для /health"""
+        channels = list(self.channels.values())
+        queued = [len(channel.queue) for channel in channels]
+        return {
+            **self.stats,
+            "delivered": self.stats["delivered"] + sum(channel.sent for channel in channels),
+            "dropped": self.stats["dropped"] + sum(channel.dropped for channel in channels),
+            "connections": len(self.channels),
+            "topics": len(self.topics.index),
+            "queued": sum(queued),
+            "max_client_queue": max(queued, default=0)
+        }
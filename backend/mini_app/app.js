@@ -8,6 +8,11 @@ let ws = null;
 let reconnectAttempts = 0;
 const MAX_RECONNECT_ATTEMPTS = 5;
 
+// Опрос API - только если WebSocket так и не удалось восстановить
+let fallbackPolling = null;
+let pingInterval = null;
+let wasConnected = false;
+
 // Текущая вкладка
 let currentTab = 'dashboard';
 
@@ -26,12 +31,8 @@ document.addEventListener('DOMContentLoaded', function() {
     loadDashboardData();
     loadProblems();
 
-    // Подключиться к WebSocket
+    // Дальше обновления приходят через WebSocket, без опроса API
     connectWebSocket();
-
-    // Обновлять данные каждые 30 секунд
-    setInterval(loadDashboardData, 30000);
-    setInterval(loadProblems, 60000);
 });
 
 // ========== УПРАВЛЕНИЕ ВКЛАДКАМИ ==========
@@ -83,12 +84,22 @@ function connectWebSocket() {
             console.log('✅ WebSocket подключен');
             updateConnectionStatus('connected');
             reconnectAttempts = 0;
+            stopFallbackPolling();
+
+            // После переподключения догружаем то, что пришло, пока
+            // соединения не было
+            if (wasConnected) {
+                loadDashboardData();
+                loadProblems();
+            }
+            wasConnected = true;
 
             // Запросить текущую статистику
             ws.send(JSON.stringify({ type: 'get_stats' }));
 
             // Периодически отправлять ping
-            setInterval(() => {
+            clearInterval(pingInterval);
+            pingInterval = setInterval(() => {
                 if (ws.readyState === WebSocket.OPEN) {
                     ws.send(JSON.stringify({ type: 'ping' }));
                 }
@@ -114,6 +125,8 @@ function connectWebSocket() {
                 reconnectAttempts++;
                 console.log(`🔄 Попытка переподключения ${reconnectAttempts}/${MAX_RECONNECT_ATTEMPTS}`);
                 setTimeout(connectWebSocket, 3000);
+            } else {
+                startFallbackPolling();
             }
         };
 
@@ -128,14 +141,42 @@ function connectWebSocket() {
     }
 }
 
+function startFallbackPolling() {
+    if (!fallbackPolling) {
+        console.log('⏱️ WebSocket недоступен, обновляем данные опросом API');
+        loadDashboardData();
+        loadProblems();
+        fallbackPolling = setInterval(() => {
+            loadDashboardData();
+            loadProblems();
+        }, 30000);
+    }
+
+    // И изредка пробуем подключиться снова
+    setTimeout(() => {
+        reconnectAttempts = 0;
+        connectWebSocket();
+    }, 60000);
+}
+
+function stopFallbackPolling() {
+    if (fallbackPolling) {
+        clearInterval(fallbackPolling);
+        fallbackPolling = null;
+    }
+}
+
 function handleWebSocketMessage(data) {
     switch (data.type) {
         case 'alert':
             showAlertNotification(data.data);
             break;
-        case 'new_problem':
+        case 'problem_created':
             addProblemToList(data.data);
             break;
+        case 'stats_delta':
+            applyStatsDelta(data.data);
+            break;
         case 'stats_update':
             updateStatsDisplay(data.data);
             break;
@@ -415,6 +456,24 @@ function updateStatsDisplay(stats) {
     }
 }
 
+function applyStatsDelta(delta) {
+    // Новые проблемы попадают в любое окно статистики - просто прибавляем
+    const counters = {
+        'total-count': delta.problems,
+        'critical-count': delta.critical,
+        'last-hour-count': delta.problems
+    };
+
+    Object.entries(counters).forEach(([id, increment]) => {
+        const element = document.getElementById(id);
+        if (element && increment) {
+            element.textContent = (parseInt(element.textContent, 10) || 0) + increment;
+        }
+    });
+
+    updateLastUpdateTime();
+}
+
 function updateLastUpdateTime() {
     const timeElement = document.getElementById('last-update-time');
     if (timeElement) {
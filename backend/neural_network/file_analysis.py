@@ -0,0 +1,245 @@
+"""
+Полный анализ файла новостей парсера (ekb_news.txt).
+
+Файл читается потоково, новости дедуплицируются по нормализованному тексту и
+анализируются параллельно с ограничением числа одновременных запросов.
+Результаты пишутся по мере готовности:
+    - ekb_news_analyzed.progress.jsonl - журнал готовых новостей (для докачки);
+    - ekb_news_analyzed.json           - сводный файл в прежнем формате,
+      перезаписывается атомарно каждые N результатов и в конце.
+Прерванный запуск по тому же файлу продолжается с места остановки.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+ANALYSIS_CONCURRENCY = int(os.environ.get('ANALYSIS_CONCURRENCY', '4'))
+
+# Как часто переписывать сводный JSON и печатать прогресс
+FLUSH_EVERY = 10
+
+SECTION_SEPARATOR = "=" * 80
+ITEM_SEPARATOR = "&" * 40
+META_SEPARATOR = "-" * 40
+
+MIN_NEWS_LENGTH = 50
+
+
+# ========== ЧТЕНИЕ ФАЙЛА ==========
+def iter_news_items(file_path: str):
+    """Построчно читает файл парсера и отдаёт новости с метаданными источника"""
+    source_url = ""
+    parse_time = ""
+    in_news = False
+    lines = []
+
+    def make_item():
+        text = " ".join(lines).strip()
+        if len(text) > MIN_NEWS_LENGTH:
+            return {"text": text, "source_url": source_url, "parse_time": parse_time}
+        return None
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for raw_line in f:
+            line = raw_line.strip()
+            if not line:
+                continue
+
+            if line.startswith(SECTION_SEPARATOR) or line.startswith(ITEM_SEPARATOR):
+                item = make_item()
+                if item:
+                    yield item
+                lines = []
+                if line.startswith(SECTION_SEPARATOR):
+                    source_url, parse_time, in_news = "", "", False
+                continue
+
+            if line.startswith("ССЫЛКА:"):
+                source_url = line.replace("ССЫЛКА:", "").strip()
+            elif line.startswith("ВРЕМЯ ПАРСИНГА:"):
+                parse_time = line.replace("ВРЕМЯ ПАРСИНГА:", "").strip()
+            elif line.startswith(META_SEPARATOR):
+                in_news = True
+            elif in_news:
+                lines.append(line)
+
+    item = make_item()
+    if item:
+        yield item
+
+
+def news_hash(text: str) -> str:
+    normalized = re.sub(r'\s+', ' ', text.lower()).strip()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def file_signature(file_path: str) -> dict:
+    stat = os.stat(file_path)
+    return {"file": os.path.abspath(file_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+# ========== ЗАПИСЬ РЕЗУЛЬТАТОВ ==========
+class AnalysisWriter:
+    """Журнал готовых новостей + атомарно обновляемый сводный JSON"""
+
+    def __init__(self, file_path: str, output_path: str, resume: bool = True):
+        self.file_path = file_path
+        self.output_path = output_path
+        self.progress_path = os.path.splitext(output_path)[0] + '.progress.jsonl'
+        self.signature = file_signature(file_path)
+        self.results = []
+        self.done_hashes = set()
+        self.resumed = 0
+
+        if resume:
+            self._load_progress()
+        if not self.done_hashes:
+            with open(self.progress_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({"signature": self.signature}, ensure_ascii=False) + '\n')
+
+    def _load_progress(self):
+        if not os.path.exists(self.progress_path):
+            return
+        try:
+            with open(self.progress_path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline() or '{}')
+                if header.get("signature") != self.signature:
+                    print("   ℹ️ Файл новостей изменился - начинаю анализ заново")
+                    return
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Обрыв записи при аварийной остановке
+                    self.done_hashes.add(entry["hash"])
+                    self.results.extend(entry["results"])
+        except (OSError, ValueError) as e:
+            print(f"   ⚠️ Не удалось прочитать журнал прогресса: {e}")
+            self.done_hashes, self.results = set(), []
+            return
+
+        self.resumed = len(self.done_hashes)
+        print(f"   ♻️ Продолжаю прерванный анализ: уже готово {self.resumed} новостей")
+
+    def add(self, item_hash: str, results: list):
+        self.done_hashes.add(item_hash)
+        self.results.extend(results)
+        with open(self.progress_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"hash": item_hash, "results": results}, ensure_ascii=False) + '\n')
+
+    def write_summary(self, status: str, news_processed: int, started_at: float):
+        payload = {
+            "status": status,
+            "analysis_time": time.time(),
+            "started_at": started_at,
+            "file_analyzed": self.file_path,
+            "news_processed": news_processed,
+            "analyses_count": len(self.results),
+            "results": self.results
+        }
+        tmp_path = self.output_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.output_path)
+
+    def finish(self, news_processed: int, started_at: float):
+        self.write_summary("success", news_processed, started_at)
+        # Запуск завершён - докачивать нечего
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+
+# ========== АНАЛИЗ ==========
+def run_file_analysis(file_path: str, analyze_fn, output_path: str = None,
+                      concurrency: int = ANALYSIS_CONCURRENCY, resume: bool = True) -> dict:
+    """
+    Анализирует все новости файла функцией analyze_fn(text, source_url, source_name, parse_time)
+    и возвращает сводку в формате start_analysis
+    """
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(os.path.abspath(file_path)), 'ekb_news_analyzed.json')
+
+    writer = AnalysisWriter(file_path, output_path, resume)
+    started_at = time.time()
+    stats = {"seen": 0, "duplicates": 0, "skipped_done": writer.resumed, "analyzed": 0, "errors": 0}
+    seen_hashes = set()
+
+    def analyze_item(index, item):
+        results = analyze_fn(item["text"], item["source_url"], "parser",
+                             item["parse_time"] or datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        for result in results or []:
+            result.setdefault("original_text_preview", item["text"][:150] + "...")
+            result["news_index"] = index
+            result["text_length"] = len(item["text"])
+        return results or []
+
+    def report_progress():
+        elapsed = max(time.time() - started_at, 1e-6)
+        print(f"   📈 Готово {stats['analyzed']} (+{stats['skipped_done']} из прошлого запуска) | "
+              f"{stats['analyzed'] / elapsed:.2f} новостей/с | дубликатов: {stats['duplicates']} | "
+              f"ошибок: {stats['errors']}")
+
+    def collect(done_futures):
+        for future in done_futures:
+            item_hash = futures[future]
+            del futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                stats["errors"] += 1
+                print(f"   ❌ Ошибка анализа новости: {e}")
+                continue
+            writer.add(item_hash, results)
+            stats["analyzed"] += 1
+            if stats["analyzed"] % FLUSH_EVERY == 0:
+                writer.write_summary("in_progress", stats["analyzed"] + writer.resumed, started_at)
+                report_progress()
+
+    futures = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for item in iter_news_items(file_path):
+            stats["seen"] += 1
+            item_hash = news_hash(item["text"])
+
+            if item_hash in seen_hashes:
+                stats["duplicates"] += 1
+                continue
+            seen_hashes.add(item_hash)
+            if item_hash in writer.done_hashes:
+                continue
+
+            # Ограничиваем число одновременных запросов к LLM
+            if len(futures) >= concurrency:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            futures[pool.submit(analyze_item, stats["seen"], item)] = item_hash
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    news_processed = stats["analyzed"] + writer.resumed
+    if stats["errors"]:
+        # Журнал оставляем: следующий запуск доделает упавшие новости
+        writer.write_summary("success", news_processed, started_at)
+    else:
+        writer.finish(news_processed, started_at)
+    report_progress()
+
+    elapsed = time.time() - started_at
+    return {
+        "status": "success",
+        "results": writer.results,
+        "analyzed_count": news_processed,
+        "new_count": stats["analyzed"],
+        "duplicates": stats["duplicates"],
+        "errors": stats["errors"],
+        "elapsed_s": round(elapsed, 2),
+        "throughput": round(stats["analyzed"] / elapsed, 2) if elapsed else 0.0,
+        "output": output_path
+    }
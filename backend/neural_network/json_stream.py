@@ -0,0 +1,107 @@
+"""
+Потоковое извлечение JSON-объектов из ответа LLM.
+
+Старый clean_json_response считал '{' и '}' посимвольно и не учитывал строки,
+поэтому скобка внутри значения summary ломала разбиение. JsonObjectScanner
+отслеживает строковые литералы и экранирование, принимает текст кусками
+(по мере генерации ответа), останавливается после первых N объектов и
+отбрасывает объекты без обязательных полей.
+"""
+import json
+
+# Поля, без которых ответ нейросети для дашборда бесполезен
+ANALYSIS_REQUIRED_FIELDS = ("category", "criticality", "sentiment")
+
+
+class JsonObjectScanner:
+    """Инкрементальный сканер JSON-объектов верхнего уровня"""
+
+    def __init__(self, max_objects: int = None, required_fields=None):
+        self.max_objects = max_objects
+        self.required_fields = tuple(required_fields or ())
+        self.objects = []
+        self.skipped = 0
+
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def done(self) -> bool:
+        return self.max_objects is not None and len(self.objects) >= self.max_objects
+
+    def feed(self, chunk: str) -> list:
+        """Обрабатывает очередной кусок текста, возвращает новые готовые объекты"""
+        found = []
+        for char in chunk:
+            if self.done:
+                break
+
+            if self._depth == 0:
+                # Вне объекта: ждём открывающую скобку, остальное (пояснения модели, ```json) пропускаем
+                if char == '{':
+                    self._depth = 1
+                    self._buffer = [char]
+                continue
+
+            self._buffer.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    obj = self._complete()
+                    if obj is not None:
+                        self.objects.append(obj)
+                        found.append(obj)
+        return found
+
+    def _complete(self):
+        text = ''.join(self._buffer)
+        self._buffer = []
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            self.skipped += 1  # Пропускаем некорректные объекты
+            return None
+
+        if not isinstance(obj, dict) or any(field not in obj for field in self.required_fields):
+            self.skipped += 1
+            return None
+        return obj
+
+
+def clean_json_response(text: str, max_objects: int = None, required_fields=None) -> list:
+    """Разделяет строку, содержащую несколько JSON объектов, и возвращает список словарей"""
+    scanner = JsonObjectScanner(max_objects, required_fields)
+    scanner.feed(text.strip())
+    return scanner.objects
+
+
+def extract_from_stream(chunks, max_objects: int = 1, required_fields=None):
+    """
+    Читает поток кусков текста, пока не соберёт max_objects объектов.
+    Возвращает (объекты, весь прочитанный текст). Поток дальше не читается -
+    генерацию можно не дожидаться.
+    """
+    scanner = JsonObjectScanner(max_objects, required_fields)
+    received = []
+    for chunk in chunks:
+        received.append(chunk)
+        scanner.feed(chunk)
+        if scanner.done:
+            break
+    return scanner.objects, ''.join(received)
@@ -0,0 +1,383 @@
+"""
+Локальный классификатор новостей, дистиллированный из ответов GigaChat.
+
+integration_layer.process_ai_response сохраняет полный ответ нейросети в
+metadata.ai_response каждой строки таблицы problems - это готовая размеченная
+выборка (category, criticality, sentiment). Здесь на ней обучается лёгкая
+CPU-модель: TF-IDF признаки + линейные softmax-головы по каждому полю.
+Предсказание занимает десятки микросекунд, поэтому GigaChat вызывается только
+когда уверенность локальной модели ниже порога.
+
+Запуск:
+    python local_classifier.py train      - обучить модель на всей истории
+    python local_classifier.py evaluate   - офлайн-сравнение с ответами LLM
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(CURRENT_DIR)
+
+DEFAULT_DB_PATH = os.environ.get('DATABASE_URL') or os.path.join(BACKEND_DIR, 'data', 'municipal_monitoring.db')
+DEFAULT_MODEL_PATH = os.environ.get('LOCAL_MODEL_PATH') or os.path.join(CURRENT_DIR, 'local_model.json')
+
+# Ниже этой уверенности (по любой из голов) отдаём новость в GigaChat
+MIN_CONFIDENCE = float(os.environ.get('LOCAL_MODEL_MIN_CONFIDENCE', '0.8'))
+
+# Поля ответа нейросети, которые учится предсказывать модель
+HEADS = ('category', 'criticality', 'sentiment')
+
+# Метка, которой помечаются ответы локальной модели (их не используем для обучения)
+LOCAL_MODEL_TAG = 'local_classifier'
+
+MODEL_VERSION = 1
+
+TOKEN_RE = re.compile(r'[а-яёa-z0-9]+')
+
+# original_preview в ответах - первые 200 символов новости (neural_network.py)
+PREVIEW_LENGTH = 200
+
+
+# ========== ПРИЗНАКИ ==========
+def tokenize(text: str) -> list:
+    """Слова, их усечённые основы (грубый стемминг для русского) и биграммы"""
+    words = TOKEN_RE.findall((text or '').lower().replace('ё', 'е'))
+    tokens = []
+    for word in words:
+        if len(word) < 2:
+            continue
+        tokens.append(word)
+        if len(word) > 5:
+            tokens.append('~' + word[:5])
+    for first, second in zip(words, words[1:]):
+        tokens.append(first + '_' + second)
+    return tokens
+
+
+def model_text(text: str) -> str:
+    """Окно текста, на котором учится модель: начало новости, как в original_preview"""
+    return (text or '')[:PREVIEW_LENGTH].rstrip('.').strip()
+
+
+def term_frequencies(text: str) -> dict:
+    tf = {}
+    for token in tokenize(text):
+        tf[token] = tf.get(token, 0) + 1
+    return tf
+
+
+def normalize_label(head: str, value):
+    """Приводим ответы LLM к конечному набору меток"""
+    if value is None:
+        return None
+    if head == 'criticality':
+        try:
+            return str(max(0, min(5, int(value))))
+        except (TypeError, ValueError):
+            return None
+    if head == 'sentiment':
+        value = str(value).lower()
+        if 'негатив' in value:
+            return 'негативная'
+        if 'позитив' in value:
+            return 'позитивная'
+        return 'нейтральная'
+    value = str(value).strip()
+    return value or None
+
+
+# ========== ДАННЫЕ ==========
+def load_training_rows(db_path: str = DEFAULT_DB_PATH) -> list:
+    """Достаём из problems пары (текст, метки LLM) из metadata.ai_response"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, text, metadata FROM problems')
+    raw_rows = cursor.fetchall()
+    conn.close()
+
+    rows = []
+    for problem_id, text, metadata in raw_rows:
+        try:
+            ai_response = json.loads(metadata or '{}').get('ai_response') or {}
+        except (TypeError, ValueError, AttributeError):
+            continue
+
+        if not isinstance(ai_response, dict) or ai_response.get('analyzed_by') == LOCAL_MODEL_TAG:
+            continue
+
+        labels = {head: normalize_label(head, ai_response.get(head)) for head in HEADS}
+        if labels['category'] is None:
+            continue
+
+        source_text = model_text(ai_response.get('original_preview') or ai_response.get('summary') or text)
+        if len(source_text) < 20:
+            continue
+
+        rows.append({"id": str(problem_id), "text": source_text, "labels": labels})
+
+    return rows
+
+
+def split_rows(rows: list, test_share: float = 0.2):
+    """Детерминированное разбиение по хэшу id - одинаковое при каждом запуске"""
+    train, test = [], []
+    for row in rows:
+        bucket = int(hashlib.md5(row["id"].encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+        (test if bucket < test_share else train).append(row)
+    return train, test
+
+
+# ========== МОДЕЛЬ ==========
+class LocalClassifier:
+    """TF-IDF + по одной линейной softmax-голове на каждое поле ответа"""
+
+    def __init__(self, idf: dict, heads: dict, trained_at: str = "", samples: int = 0):
+        self.idf = idf
+        self.heads = heads
+        self.trained_at = trained_at
+        self.samples = samples
+
+    # ---------- обучение ----------
+    @classmethod
+    def train(cls, rows: list, epochs: int = 40, learning_rate: float = 0.5, l2: float = 1e-4, seed: int = 42):
+        documents = [term_frequencies(row["text"]) for row in rows]
+
+        document_frequency = {}
+        for tf in documents:
+            for term in tf:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        total = len(documents)
+        idf = {term: round(math.log((1 + total) / (1 + df)) + 1.0, 5) for term, df in document_frequency.items()}
+
+        model = cls(idf, {}, datetime.now().isoformat(), total)
+        vectors = [model._vectorize(tf) for tf in documents]
+
+        for head in HEADS:
+            samples = [(vector, row["labels"][head]) for vector, row in zip(vectors, rows)
+                       if row["labels"].get(head) is not None]
+            if not samples:
+                continue
+            model.heads[head] = cls._train_head(samples, epochs, learning_rate, l2, seed)
+
+        return model
+
+    @staticmethod
+    def _train_head(samples: list, epochs: int, learning_rate: float, l2: float, seed: int) -> dict:
+        """Мультиклассовая логистическая регрессия, SGD по разреженным векторам"""
+        classes = sorted({label for _, label in samples})
+        class_index = {label: i for i, label in enumerate(classes)}
+        weights = {}
+        bias = [0.0] * len(classes)
+
+        rng = random.Random(seed)
+        order = list(range(len(samples)))
+
+        for epoch in range(epochs):
+            rng.shuffle(order)
+            rate = learning_rate / (1 + epoch * 0.1)
+            for i in order:
+                vector, label = samples[i]
+                probs = _softmax(_scores(vector, weights, bias))
+                target = class_index[label]
+
+                for k in range(len(classes)):
+                    gradient = probs[k] - (1.0 if k == target else 0.0)
+                    if abs(gradient) < 1e-6:
+                        continue
+                    bias[k] -= rate * gradient
+                    for term, value in vector.items():
+                        row = weights.get(term)
+                        if row is None:
+                            row = weights[term] = [0.0] * len(classes)
+                        row[k] -= rate * (gradient * value + l2 * row[k])
+
+        return {
+            "classes": classes,
+            "bias": [round(b, 5) for b in bias],
+            "weights": {term: [round(w, 5) for w in row] for term, row in weights.items()
+                        if any(abs(w) > 1e-4 for w in row)}
+        }
+
+    # ---------- предсказание ----------
+    def _vectorize(self, tf: dict) -> dict:
+        vector = {}
+        for term, count in tf.items():
+            idf = self.idf.get(term)
+            if idf is not None:
+                vector[term] = (1.0 + math.log(count)) * idf
+
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        if norm:
+            for term in vector:
+                vector[term] /= norm
+        return vector
+
+    def predict(self, text: str) -> dict:
+        """Метки и уверенность по каждой голове + общая уверенность (минимум по головам)"""
+        # Полную статью обрезаем так же, как обучающие примеры: иначе
+        # признаки и порог уверенности рассчитаны на другой текст
+        vector = self._vectorize(term_frequencies(model_text(text)))
+        result = {"confidence": {}}
+
+        for head, params in self.heads.items():
+            probs = _softmax(_scores(vector, params["weights"], params["bias"]))
+            best = max(range(len(probs)), key=probs.__getitem__)
+            label = params["classes"][best]
+            result[head] = int(label) if head == 'criticality' else label
+            result["confidence"][head] = round(probs[best], 4)
+
+        result["min_confidence"] = min(result["confidence"].values()) if result["confidence"] else 0.0
+        return result
+
+    def is_confident(self, prediction: dict, threshold: float = MIN_CONFIDENCE) -> bool:
+        return all(head in prediction for head in HEADS) and prediction["min_confidence"] >= threshold
+
+    # ---------- сохранение ----------
+    def save(self, path: str = DEFAULT_MODEL_PATH):
+        payload = {
+            "version": MODEL_VERSION,
+            "trained_at": self.trained_at,
+            "samples": self.samples,
+            "idf": self.idf,
+            "heads": self.heads
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_MODEL_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        if payload.get("version") != MODEL_VERSION:
+            raise ValueError(f"Неподдерживаемая версия модели: {payload.get('version')}")
+        return cls(payload["idf"], payload["heads"], payload.get("trained_at", ""), payload.get("samples", 0))
+
+
+def _scores(vector: dict, weights: dict, bias: list) -> list:
+    scores = list(bias)
+    for term, value in vector.items():
+        row = weights.get(term)
+        if row is not None:
+            for k, weight in enumerate(row):
+                scores[k] += weight * value
+    return scores
+
+
+def _softmax(scores: list) -> list:
+    top = max(scores)
+    exps = [math.exp(score - top) for score in scores]
+    total = sum(exps)
+    return [value / total for value in exps]
+
+
+# ========== ЗАГРУЗКА ДЛЯ СЕРВИНГА ==========
+_cached_model = None
+_cached_mtime = None
+
+
+def get_local_classifier(path: str = DEFAULT_MODEL_PATH):
+    """Модель из файла (перечитывается после переобучения) или None, если её нет"""
+    global _cached_model, _cached_mtime
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    if _cached_model is None or mtime != _cached_mtime:
+        try:
+            _cached_model = LocalClassifier.load(path)
+            _cached_mtime = mtime
+            print(f"✅ Локальная модель загружена: {path} ({_cached_model.samples} примеров)")
+        except Exception as e:
+            print(f"⚠️ Не удалось загрузить локальную модель: {e}")
+            _cached_model, _cached_mtime = None, None
+
+    return _cached_model
+
+
+# ========== ОФЛАЙН-ОЦЕНКА ==========
+def evaluate(rows: list, threshold: float = MIN_CONFIDENCE, test_share: float = 0.2) -> dict:
+    """Обучаем на части истории и сравниваем предсказания с сохранёнными ответами LLM"""
+    train_rows, test_rows = split_rows(rows, test_share)
+    if not train_rows or not test_rows:
+        raise ValueError(f"Слишком мало данных для оценки: {len(rows)} примеров")
+
+    model = LocalClassifier.train(train_rows)
+
+    correct = {head: 0 for head in HEADS}
+    totals = {head: 0 for head in HEADS}
+    covered = 0
+    covered_correct = 0
+    elapsed = 0.0
+
+    for row in test_rows:
+        started = time.perf_counter()
+        prediction = model.predict(row["text"])
+        elapsed += time.perf_counter() - started
+
+        all_correct = True
+        for head in HEADS:
+            expected = row["labels"].get(head)
+            if expected is None:
+                continue
+            totals[head] += 1
+            if str(prediction.get(head)) == expected:
+                correct[head] += 1
+            else:
+                all_correct = False
+
+        if model.is_confident(prediction, threshold):
+            covered += 1
+            covered_correct += int(all_correct)
+
+    return {
+        "train_size": len(train_rows),
+        "test_size": len(test_rows),
+        "accuracy": {head: round(correct[head] / totals[head], 4) if totals[head] else None for head in HEADS},
+        "threshold": threshold,
+        "local_coverage": round(covered / len(test_rows), 4),
+        "accuracy_when_local": round(covered_correct / covered, 4) if covered else None,
+        "avg_predict_us": round(elapsed / len(test_rows) * 1e6, 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный классификатор на ответах GigaChat")
+    parser.add_argument('command', choices=['train', 'evaluate'])
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="SQLite с таблицей problems")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help="Куда сохранить модель")
+    parser.add_argument('--threshold', type=float, default=MIN_CONFIDENCE, help="Порог уверенности")
+    args = parser.parse_args(argv)
+
+    rows = load_training_rows(args.db)
+    print(f"📚 Размеченных ответов LLM: {len(rows)}")
+
+    if args.command == 'train':
+        started = time.time()
+        model = LocalClassifier.train(rows)
+        model.save(args.model)
+        print(f"✅ Модель обучена за {time.time() - started:.1f} с и сохранена: {args.model}")
+        for head, params in model.heads.items():
+            print(f"   {head}: {len(params['classes'])} классов, {len(params['weights'])} признаков")
+        return 0
+
+    report = evaluate(rows, args.threshold)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
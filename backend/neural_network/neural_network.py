@@ -1,5 +1,5 @@
 import os
-import json
+import sys
 from gigachat import GigaChat
 from gigachat.models import Chat, Messages, MessagesRole
 from dotenv import load_dotenv
@@ -8,29 +8,20 @@ from datetime import datetime
 load_dotenv()
 AUTH_KEY = os.getenv('AUTH_KEY')
 
+# Соседние модули папки neural_network (файл часто грузится через importlib)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-def clean_json_response(text: str) -> list:
-    """Разделяет строку, содержащую несколько JSON объектов, и возвращает список словарей"""
-    text = text.strip()
-    json_objects = []
-    stack = 0
-    start = 0
+from local_classifier import get_local_classifier, LOCAL_MODEL_TAG
+from text_compaction import compact_news_text, estimate_tokens, record_usage, usage_summary
+from json_stream import clean_json_response, extract_from_stream, ANALYSIS_REQUIRED_FIELDS
+from file_analysis import run_file_analysis, ANALYSIS_CONCURRENCY
 
-    for i, char in enumerate(text):
-        if char == '{':
-            if stack == 0:
-                start = i
-            stack += 1
-        elif char == '}':
-            stack -= 1
-            if stack == 0:
-                try:
-                    json_obj = json.loads(text[start:i + 1])
-                    json_objects.append(json_obj)
-                except json.JSONDecodeError:
-                    continue  # Пропускаем некорректные объекты
+# USE_LOCAL_MODEL=0 - всегда спрашивать GigaChat, даже если локальная модель уверена
+USE_LOCAL_MODEL = os.getenv('USE_LOCAL_MODEL', '1') != '0'
 
-    return json_objects
+# GIGACHAT_STREAM=1 - потоковый разбор ответа (быстрее первый результат, но
+# в потоке GigaChat не присылает usage и расход токенов пишется по оценке)
+USE_STREAMING = os.getenv('GIGACHAT_STREAM', '0') == '1'
 
 
 def analyze_citizen_message(text: str):
@@ -38,8 +29,56 @@ def analyze_citizen_message(text: str):
     return analyze_news_article(text)
 
 
-def analyze_news_article(news_text, source_url="", source_name="", parse_time=""):
-    """Анализ новости и создание краткой выжимки для дашборда"""
+def analyze_with_local_model(news_text, source_url="", source_name="", parse_time=""):
+    """Ответ локальной модели в формате GigaChat или None, если она не уверена"""
+    if not USE_LOCAL_MODEL:
+        return None
+
+    classifier = get_local_classifier()
+    if classifier is None:
+        return None
+
+    prediction = classifier.predict(news_text)
+    if not classifier.is_confident(prediction):
+        print(f"   🤔 Локальная модель не уверена ({prediction['min_confidence']:.2f}), спрашиваю GigaChat")
+        return None
+
+    sentiment = prediction["sentiment"]
+    emotion = {"негативная": "тревога/опасность", "позитивная": "надежда"}.get(sentiment, "нейтрально")
+    first_sentence = news_text.split('. ')[0]
+
+    print(f"   ⚡ Локальная модель: {prediction['category']} - criticality {prediction['criticality']}")
+    return [{
+        "summary": first_sentence[:150] + ("..." if len(first_sentence) > 150 else ""),
+        "category": prediction["category"],
+        "criticality": prediction["criticality"],
+        "sentiment": sentiment,
+        "emotion": emotion,
+        "location": None,
+        "time_info": parse_time.split()[0] if parse_time else "сегодня",
+        "source_preview": source_name or (source_url.split('/')[-1] if source_url else "Источник"),
+        "original_preview": news_text[:200] + "..." if len(news_text) > 200 else news_text,
+        "source_url": source_url,
+        "source_name": source_name if source_name else source_url,
+        "parse_time": parse_time,
+        "analyzed_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "analyzed_by": LOCAL_MODEL_TAG,
+        "confidence": prediction["confidence"]
+    }]
+
+
+def analyze_news_article(news_text, source_url="", source_name="", parse_time="", repeated_lines=None):
+    """
+    Анализ новости и создание краткой выжимки для дашборда.
+    news_text - исходный текст новости: сжимается для промпта здесь же, а
+    превью и локальная модель видят его целиком. repeated_lines - строки,
+    повторяющиеся в других новостях файла (find_repeated_lines)
+    """
+    # Сначала локальная модель, обученная на прошлых ответах GigaChat
+    local_result = analyze_with_local_model(news_text, source_url, source_name, parse_time)
+    if local_result:
+        return local_result
+
     # ПУТЬ К ФАЙЛУ sys_prompt.txt
     current_file_path = os.path.abspath(__file__)  # полный путь к neural_network.py
     current_dir = os.path.dirname(current_file_path)  # папка neural_network
@@ -81,6 +120,11 @@ def analyze_news_article(news_text, source_url="", source_name="", parse_time=""
     }
     """
 
+    # Вместо слепой обрезки - лучшие предложения в пределах бюджета токенов
+    compact_text = compact_news_text(news_text, repeated_lines=repeated_lines)
+    estimated_prompt_tokens = estimate_tokens(news_prompt) + estimate_tokens(compact_text)
+    print(f"   Сжато до {len(compact_text)} символов (~{estimate_tokens(compact_text)} токенов)")
+
     with GigaChat(
             credentials=AUTH_KEY,
             verify_ssl_certs=False,
@@ -90,18 +134,44 @@ def analyze_news_article(news_text, source_url="", source_name="", parse_time=""
         chat_request = Chat(
             messages=[
                 Messages(role=MessagesRole.SYSTEM, content=news_prompt),
-                Messages(role=MessagesRole.USER, content=news_text[:1200]),  # Ограничиваем длину
+                Messages(role=MessagesRole.USER, content=compact_text),
             ],
             temperature=0.1,  # Меньше креатива, больше фактов
             max_tokens=500,
         )
-        response = client.chat(chat_request)
-        raw_content = response.choices[0].message.content.strip()
-
-        print(f"   Получен ответ от GigaChat ({len(raw_content)} символов)")
+        if USE_STREAMING:
+            # Разбираем ответ по мере генерации и обрываем поток после первого валидного объекта
+            stream = client.stream(chat_request)
+            try:
+                chunks = (chunk.choices[0].delta.content for chunk in stream if chunk.choices)
+                result, raw_content = extract_from_stream(chunks, max_objects=1,
+                                                          required_fields=ANALYSIS_REQUIRED_FIELDS)
+            finally:
+                stream.close()  # закрывает соединение, не дожидаясь конца генерации
+            # В потоке GigaChat не присылает usage - считаем по оценке
+            prompt_tokens = estimated_prompt_tokens
+            completion_tokens = estimate_tokens(raw_content)
+            usage_source = "estimate"
+        else:
+            response = client.chat(chat_request)
+            raw_content = response.choices[0].message.content.strip()
+            result = clean_json_response(raw_content, max_objects=1, required_fields=ANALYSIS_REQUIRED_FIELDS)
+            prompt_tokens = response.usage.prompt_tokens
+            completion_tokens = response.usage.completion_tokens
+            usage_source = "api"
+
+        token_usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "estimated_prompt_tokens": estimated_prompt_tokens,
+            "input_chars": len(compact_text),
+            "source": usage_source
+        }
+        record_usage(token_usage)
 
-        # Разделяем и возвращаем список JSON-объектов
-        result = clean_json_response(raw_content)
+        print(f"   Получен ответ от GigaChat ({len(raw_content)} символов, "
+              f"токены: {token_usage['prompt_tokens']} + {token_usage['completion_tokens']})")
 
         if result and len(result) > 0:
             ai_data = result[0]
@@ -112,6 +182,7 @@ def analyze_news_article(news_text, source_url="", source_name="", parse_time=""
             ai_data["source_name"] = source_name if source_name else source_url
             ai_data["parse_time"] = parse_time
             ai_data["analyzed_at"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            ai_data["token_usage"] = token_usage
 
             print(f"   ✅ AI анализ: {ai_data.get('category')} - criticality {ai_data.get('criticality')}")
             return [ai_data]
@@ -131,17 +202,20 @@ def analyze_news_article(news_text, source_url="", source_name="", parse_time=""
                 "source_url": source_url,
                 "source_name": source_name,
                 "parse_time": parse_time,
-                "analyzed_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                "analyzed_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "token_usage": token_usage
             }]
 
 
-def start_analysis(file_path, auth_key):
+def start_analysis(file_path, auth_key, mode="full", output_path=None, concurrency=ANALYSIS_CONCURRENCY,
+                   resume=True):
     """
-    Анализ файла с новостями и возврат JSON результатов
-    Упрощенная версия для совместимости
+    Анализ файла с новостями и возврат JSON результатов.
+    mode="full" - все новости файла (параллельно, с дедупликацией и докачкой),
+    mode="demo" - только первый абзац, как раньше
     """
     print(f"\n{'=' * 60}")
-    print(f"🤖 АНАЛИЗ ФАЙЛА (упрощенный)")
+    print(f"🤖 АНАЛИЗ ФАЙЛА ({'полный' if mode == 'full' else 'упрощенный'})")
     print(f"📁 Файл: {file_path}")
     print(f"{'=' * 60}")
 
@@ -149,6 +223,20 @@ def start_analysis(file_path, auth_key):
         print(f"❌ Файл не найден: {file_path}")
         return {"status": "error", "message": "File not found"}
 
+    if mode == "full":
+        try:
+            result = run_file_analysis(file_path, analyze_news_article, output_path, concurrency, resume)
+        except Exception as e:
+            print(f"❌ Ошибка анализа файла: {e}")
+            return {"status": "error", "message": f"Analysis error: {e}"}
+
+        result["token_usage"] = usage_summary()
+        print(f"✅ Проанализировано {result['analyzed_count']} новостей "
+              f"({result['throughput']} новостей/с, дубликатов: {result['duplicates']})")
+        print(f"🪙 Токены GigaChat: {result['token_usage']['total_tokens']} "
+              f"за {result['token_usage']['calls']} вызовов")
+        return result
+
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
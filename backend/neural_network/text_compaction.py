@@ -0,0 +1,204 @@
+"""
+Сжатие текста новости перед отправкой в GigaChat.
+
+Раньше текст обрезался вслепую (news_text[:1200]), и в промпт попадали
+подписи "Фото: ...", хэштеги и ссылки, а описание самого инцидента
+отрезалось. Здесь:
+    1. выкидываем шаблонный мусор (подписи, ссылки, повторяющиеся строки);
+    2. ранжируем предложения по плотности муниципальных слов и упоминаний мест;
+    3. набираем лучшие предложения в пределах бюджета токенов GigaChat,
+       сохраняя исходный порядок и заголовок.
+"""
+import os
+import re
+import math
+import threading
+
+# Бюджет токенов на текст новости в промпте (≈1200 символов русского текста)
+NEWS_TOKEN_BUDGET = int(os.environ.get('NEWS_TOKEN_BUDGET', '320'))
+
+# Среднее число символов кириллицы на токен у токенизатора GigaChat.
+# Точность оценки видна по estimate_ratio в token_usage.as_dict()
+CHARS_PER_TOKEN = float(os.environ.get('GIGACHAT_CHARS_PER_TOKEN', '3.8'))
+
+MUNICIPAL_KEYWORDS = [
+    'авари', 'прорыв', 'затоп', 'отключ', 'не работает', 'свалк', 'мусор', 'яма', 'ямы',
+    'дорог', 'светофор', 'лифт', 'отоплен', 'вод', 'свет', 'электричеств', 'тепл',
+    'жалоб', 'обращени', 'проблем', 'инцидент', 'дтп', 'уборк', 'благоустро', 'жкх',
+    'коммунал', 'подвал', 'крыш', 'труб', 'канализац', 'утечк', 'засор', 'пожар',
+    'пострада', 'эвакуац', 'ремонт', 'снег', 'гололед', 'остановк', 'транспорт',
+    'трамва', 'автобус', 'жител', 'школ', 'больниц', 'поликлиник', 'мэри', 'администрац'
+]
+
+LOCATION_PATTERNS = [
+    r'\bул\.\s*\w+', r'\bулиц\w*\s+\w+', r'\bпр(?:оспект|-т|\.)\s*\w+', r'\bпер(?:еул\w*|\.)\s*\w+',
+    r'\bрайон\w*', r'\bмкрн?\.?\s*\w+', r'\bд(?:ом|\.)\s*\d+', r'\bтракт\w*', r'\bплощад\w*',
+    r'\bекад\b', r'\bперекрест\w*', r'\bпересечени\w*'
+]
+
+DISTRICTS = [
+    'верх-исетск', 'железнодорожн', 'кировск', 'ленинск', 'октябрьск', 'орджоникидзевск',
+    'чкаловск', 'уралмаш', 'эльмаш', 'виз', 'академическ', 'академ', 'ботаник', 'химмаш',
+    'вторчермет', 'пионерск', 'сортировк', 'компрессорн', 'широкая речка', 'уктус'
+]
+
+# Строки-шаблоны: подписи к фото, призывы подписаться, ссылки, хэштеги
+BOILERPLATE_PATTERNS = [
+    r'^(фото|видео|источник|скриншот|иллюстрация)\s*[:/—-]',
+    r'^\W*подпи(сывайтесь|сывайся|саться|шитесь|шись)\b.*(канал|чат|бот|нас)',
+    r'прислать новость|предложить новость|наш (канал|чат|бот)',
+    r'^\s*(@\w+\s*)+$',
+    r'^\s*(#\w+\s*)+$',
+    r'^\s*https?://\S+\s*$',
+    r'^(реклама|erid|на правах рекламы)\b',
+]
+
+_location_re = re.compile('|'.join(LOCATION_PATTERNS), re.IGNORECASE)
+# Основа района - с начала слова (любое окончание), короткие аббревиатуры
+# вроде "виз" - только целым словом, иначе совпадают "визит" и "телевизор"
+_district_re = re.compile(
+    r'\b(' + '|'.join(re.escape(d) + (r'\b' if len(d) <= 3 else r'\w*') for d in DISTRICTS) + ')',
+    re.IGNORECASE
+)
+_boilerplate_res = [re.compile(pattern, re.IGNORECASE) for pattern in BOILERPLATE_PATTERNS]
+_url_re = re.compile(r'https?://\S+|www\.\S+')
+_hashtag_re = re.compile(r'(?:^|\s)#\w+')
+_sentence_split_re = re.compile(r'(?<=[.!?…])\s+(?=[«"(A-ZА-ЯЁ0-9])|\n+')
+_token_re = re.compile(r'[A-Za-zА-Яа-яЁё]+|\d+|[^\sA-Za-zА-Яа-яЁё\d]')
+
+
+# ========== ОЦЕНКА ТОКЕНОВ ==========
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов GigaChat без обращения к API"""
+    tokens = 0
+    for piece in _token_re.findall(text or ''):
+        if piece.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif piece[0].isalpha():
+            tokens += max(1, math.ceil(len(piece) / CHARS_PER_TOKEN))
+        else:
+            tokens += 1
+    return tokens
+
+
+class TokenUsageStats:
+    """Накопленный расход токенов по всем вызовам GigaChat в процессе"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.estimated_prompt_tokens = 0
+
+    def record(self, usage: dict):
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += usage.get('prompt_tokens', 0)
+            self.completion_tokens += usage.get('completion_tokens', 0)
+            self.total_tokens += usage.get('total_tokens', 0)
+            self.estimated_prompt_tokens += usage.get('estimated_prompt_tokens', 0)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.total_tokens,
+                "avg_prompt_tokens": round(self.prompt_tokens / self.calls, 1) if self.calls else 0,
+                "estimate_ratio": round(self.prompt_tokens / self.estimated_prompt_tokens, 3)
+                if self.estimated_prompt_tokens else None
+            }
+
+
+token_usage = TokenUsageStats()
+
+
+def record_usage(usage: dict):
+    token_usage.record(usage)
+
+
+def usage_summary() -> dict:
+    """Расход токенов всех вызовов GigaChat в процессе (для сводки анализа)"""
+    return token_usage.as_dict()
+
+
+# ========== ОЧИСТКА ==========
+def is_boilerplate(line: str, repeated_lines: set = None) -> bool:
+    stripped = line.strip()
+    if not stripped:
+        return True
+    if repeated_lines and stripped.lower() in repeated_lines:
+        return True
+    return any(pattern.search(stripped) for pattern in _boilerplate_res)
+
+
+def find_repeated_lines(texts: list, min_count: int = 3) -> set:
+    """Строки, повторяющиеся в нескольких новостях (подписи каналов и т.п.)"""
+    counts = {}
+    for text in texts:
+        for line in {line.strip().lower() for line in text.split('\n') if len(line.strip()) > 5}:
+            counts[line] = counts.get(line, 0) + 1
+    return {line for line, count in counts.items() if count >= min_count}
+
+
+def strip_boilerplate(text: str, repeated_lines: set = None) -> str:
+    lines = [line for line in text.split('\n') if not is_boilerplate(line, repeated_lines)]
+    cleaned = '\n'.join(lines)
+    cleaned = _url_re.sub('', cleaned)
+    cleaned = _hashtag_re.sub(' ', cleaned)
+    return re.sub(r'[ \t]{2,}', ' ', cleaned).strip()
+
+
+# ========== РАНЖИРОВАНИЕ ==========
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in _sentence_split_re.split(text) if s and s.strip()]
+
+
+def score_sentence(sentence: str) -> float:
+    lower = sentence.lower()
+    words = max(1, len(lower.split()))
+
+    keyword_hits = sum(1 for word in MUNICIPAL_KEYWORDS if word in lower)
+    location_hits = len(_location_re.findall(sentence)) + len({d.lower() for d in _district_re.findall(sentence)})
+    number_hits = len(re.findall(r'\d+', sentence))
+
+    # Плотность, а не сумма: длинное предложение не должно выигрывать за счёт длины
+    density = (2.0 * keyword_hits + 2.5 * location_hits + 0.5 * number_hits) / math.sqrt(words)
+    if words < 4:
+        density *= 0.5
+    return density
+
+
+def compact_news_text(text: str, token_budget: int = NEWS_TOKEN_BUDGET, repeated_lines: set = None) -> str:
+    """Самое информативное содержимое новости в пределах бюджета токенов"""
+    cleaned = strip_boilerplate(text or '', repeated_lines)
+    if estimate_tokens(cleaned) <= token_budget:
+        return cleaned
+
+    sentences = split_sentences(cleaned)
+    if not sentences:
+        return cleaned
+
+    costs = [estimate_tokens(sentence) for sentence in sentences]
+    chosen = set()
+    used = 0
+
+    # Заголовок (первое предложение) оставляем всегда - в нём обычно суть
+    if costs[0] <= token_budget:
+        chosen.add(0)
+        used = costs[0]
+
+    ranked = sorted(range(1, len(sentences)), key=lambda i: (-score_sentence(sentences[i]), i))
+    for i in ranked:
+        if used + costs[i] <= token_budget:
+            chosen.add(i)
+            used += costs[i]
+
+    if not chosen:
+        # Даже одно предложение не влезает - режем по оценке символов
+        return cleaned[:int(token_budget * CHARS_PER_TOKEN)]
+
+    return '\n'.join(sentences[i] for i in sorted(chosen))
@@ -0,0 +1,241 @@
+"""
+Бенчмарк LLM-этапа: analyze_news_article и интеграционный пайплайн против
+локальной замены GigaChat (mock_gigachat_server.py).
+
+Примеры:
+    # поднять mock-сервер автоматически и прогнать 200 новостей в 16 потоков
+    python benchmark_llm.py --spawn-mock --latency lognormal:800:0.5 --items 200 --concurrency 16
+
+    # против уже запущенного mock-сервера, плюс process_and_save_news
+    python benchmark_llm.py --mock-url http://127.0.0.1:9090 --mode both
+
+Отчёт: items/s, p50/p95/p99 задержки, пиковая конкурентность (клиент и сервер).
+"""
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import argparse
+import threading
+import contextlib
+import subprocess
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+NEWS_FILE = os.path.join(PROJECT_ROOT, 'data', 'ekb_news.txt')
+
+
+def percentile(values: list, p: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def load_news_items(limit: int) -> list:
+    """Новости из ekb_news.txt (по кругу, если их меньше limit)"""
+    with open(NEWS_FILE, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    items = []
+    for section in content.split("=" * 80):
+        for item in section.split("&" * 40):
+            lines = [line.strip() for line in item.strip().split('\n')
+                     if line.strip() and not line.startswith(("ССЫЛКА:", "ВРЕМЯ ПАРСИНГА:", "ОБНОВЛЕНО:", "-" * 40))]
+            text = " ".join(lines)
+            if len(text) > 50:
+                items.append(text)
+
+    if not items:
+        raise RuntimeError(f"В {NEWS_FILE} нет новостей для бенчмарка")
+    return [items[i % len(items)] for i in range(limit)]
+
+
+def wait_for_port(host: str, port: int, timeout: float = 15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with contextlib.suppress(OSError):
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Mock-сервер не поднялся на {host}:{port}")
+
+
+def spawn_mock(args) -> subprocess.Popen:
+    command = [sys.executable, os.path.join(SCRIPTS_DIR, 'mock_gigachat_server.py'),
+               '--port', str(args.port), '--latency', args.latency,
+               '--error-rate', str(args.error_rate), '--rate-limit-rate', str(args.rate_limit_rate)]
+    process = subprocess.Popen(command)
+    wait_for_port('127.0.0.1', args.port)
+    return process
+
+
+def configure_environment(mock_url: str):
+    """Направляем клиент gigachat и интеграционный слой на mock-сервер"""
+    os.environ['GIGACHAT_BASE_URL'] = f"{mock_url}/api/v1"
+    os.environ['GIGACHAT_AUTH_URL'] = f"{mock_url}/api/v2/oauth"
+    os.environ['AUTH_KEY'] = 'mock-credentials'
+    os.environ['BACKEND_URL'] = mock_url
+    # Меряем именно LLM-этап - локальная модель не должна отвечать вместо него
+    os.environ['USE_LOCAL_MODEL'] = '0'
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ConcurrencyTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.current -= 1
+
+
+def summarize(name: str, latencies: list, errors: int, elapsed: float, peak_client: int, server_stats: dict) -> dict:
+    done = len(latencies)
+    return {
+        "stage": name,
+        "items": done + errors,
+        "ok": done,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "items_per_s": round(done / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1) if latencies else 0.0
+        },
+        "peak_concurrency": {"client": peak_client, "server": server_stats.get("peak_in_flight")},
+        "server": server_stats
+    }
+
+
+def bench_analyze(neural_module, items: list, concurrency: int, mock_url: str) -> dict:
+    requests.post(f"{mock_url}/mock/reset", timeout=5)
+    tracker = ConcurrencyTracker()
+    latencies, errors = [], []
+
+    def run_one(text):
+        with tracker:
+            started = time.perf_counter()
+            try:
+                neural_module.analyze_news_article(text, "https://t.me/bench", "bench", "2025-12-12 12:00:00")
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(str(e))
+
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(run_one, items))
+    elapsed = time.perf_counter() - started
+
+    server_stats = requests.get(f"{mock_url}/mock/stats", timeout=5).json()
+    return summarize("analyze_news_article", latencies, len(errors), elapsed, tracker.peak, server_stats)
+
+
+def bench_pipeline(items: list, mock_url: str) -> dict:
+    requests.post(f"{mock_url}/mock/reset", timeout=5)
+    integration = load_module("integration_layer", os.path.join(PROJECT_ROOT, 'back', 'integration_layer.py'))
+
+    # Меряем каждый вызов LLM внутри пайплайна, не меняя его логику
+    tracker = ConcurrencyTracker()
+    latencies = []
+    analyze = integration.analyze_news_article
+
+    def timed_analyze(*args, **kwargs):
+        with tracker:
+            started = time.perf_counter()
+            try:
+                return analyze(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - started)
+
+    integration.analyze_news_article = timed_analyze
+
+    # Файл в формате парсера: одна секция на новость
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+        for text in items:
+            f.write("=" * 80 + "\n")
+            f.write("ССЫЛКА: https://t.me/bench\nВРЕМЯ ПАРСИНГА: 2025-12-12 12:00:00\n")
+            f.write("-" * 40 + "\n" + text + "\n")
+        news_file = f.name
+
+    try:
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            integration.process_and_save_news(news_file)
+        elapsed = time.perf_counter() - started
+    finally:
+        os.unlink(news_file)
+
+    server_stats = requests.get(f"{mock_url}/mock/stats", timeout=5).json()
+    errors = max(0, len(items) - len(latencies))
+    return summarize("process_and_save_news", latencies, errors, elapsed, tracker.peak, server_stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк LLM-этапа против mock GigaChat")
+    parser.add_argument('--mode', choices=['analyze', 'pipeline', 'both'], default='analyze')
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mock-url', default=None, help="Адрес уже запущенного mock-сервера")
+    parser.add_argument('--spawn-mock', action='store_true', help="Поднять mock-сервер на время бенчмарка")
+    parser.add_argument('--port', type=int, default=9090)
+    parser.add_argument('--latency', default='lognormal:800:0.5')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--output', help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    mock_url = args.mock_url or f"http://127.0.0.1:{args.port}"
+    mock_process = spawn_mock(args) if args.spawn_mock else None
+
+    try:
+        configure_environment(mock_url)
+        items = load_news_items(args.items)
+        reports = []
+
+        if args.mode in ('analyze', 'both'):
+            neural = load_module("neural_network", os.path.join(PROJECT_ROOT, 'neural_network', 'neural_network.py'))
+            reports.append(bench_analyze(neural, items, args.concurrency, mock_url))
+
+        if args.mode in ('pipeline', 'both'):
+            reports.append(bench_pipeline(items, mock_url))
+
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(reports, f, ensure_ascii=False, indent=2)
+            print(f"📄 Отчёт сохранён: {args.output}")
+
+    finally:
+        if mock_process:
+            mock_process.terminate()
+            mock_process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Проверка планов запросов к таблице problems на большой БД.
+
+Создает временную БД по схеме бэкенда (init_database + миграции), заполняет
+её синтетическими проблемами (по умолчанию 1 000 000 строк), собирает SQL:
+    - реальные запросы эндпоинтов бэкенда (трассировка sqlite3 при вызове API);
+    - запросы интеграционного слоя (кластеры, отчет);
+    - все самостоятельные SELECT-литералы из исходников обоих модулей,
+и для каждого выполняет EXPLAIN QUERY PLAN.
+
+Запросы бэкенда считаются горячими, для них ошибка (код возврата 1):
+    - полный проход по таблице problems (SCAN problems);
+    - проход по всему индексу с чтением строк таблицы, если запрос не
+      останавливается по LIMIT (SCAN ... USING INDEX без LIMIT или с GROUP BY);
+    - сортировка во временном B-дереве, кроме разрешенных в ALLOWED_TEMP_BTREE.
+Агрегаты по всему покрывающему индексу (SCAN ... USING COVERING INDEX)
+печатаются как предупреждение. Запросы интеграционного слоя выполняются
+раз в отчет и только печатаются.
+
+Примеры:
+    python check_query_plans.py
+    python check_query_plans.py --rows 200000 --db /tmp/plans.db --keep
+"""
+import os
+import re
+import ast
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+BACK_DIR = os.path.join(PROJECT_ROOT, 'back')
+SOURCES = {
+    "backend": os.path.join(BACK_DIR, 'backend_with_websocket.py'),
+    "integration": os.path.join(BACK_DIR, 'integration_layer.py'),
+}
+
+CATEGORIES = ['ЖКХ', 'Дороги', 'Транспорт', 'Экология', 'Благоустройство', 'Безопасность',
+              'Здравоохранение', 'Образование', 'Другое']
+LOCATIONS = ['Екатеринбург'] * 20 + [f'ул. Улица {i}' for i in range(60)]
+
+# Сортировка во временном B-дереве допустима только в перечисленных
+# запросах: окно в них узкое, и сортируются уже сгруппированные строки
+# (единицы и сотни), а не вся выборка. Любой другой запрос с TEMP B-TREE -
+# ошибка, даже если в нем есть GROUP BY
+ALLOWED_TEMP_BTREE = [
+    (r"FROM problems_hourly WHERE bucket >= '[^']+' GROUP BY (category|period)\b",
+     r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY)',
+     "статистика и ряд по часовому агрегату за окно timeframe"),
+    (r"FROM problems_daily WHERE day >= (date\('now', '-\d+ days'\)|'[^']+')( AND [^G]+)? GROUP BY ",
+     r'USE TEMP B-TREE FOR GROUP BY',
+     "тренды и затравка детектора аномалий по дневному агрегату за окно"),
+    (r"FROM problems WHERE unlikely\(created_at > datetime\('now', '-7 days'\)\) GROUP BY category, location\b",
+     r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY)',
+     "кластеры за 7 дней: группы по категории и локации"),
+]
+
+
+# ========== ПОДГОТОВКА БД ==========
+def seed_database(db_path: str, rows: int):
+    """Схема бэкенда + синтетические проблемы за последний год"""
+    conn = sqlite3.connect(db_path)
+    count = conn.execute('SELECT COUNT(*) FROM problems').fetchone()[0]
+    if count >= rows:
+        conn.close()
+        return count
+
+    now = time.time()
+    random.seed(42)
+    data = (
+        (f"Проблема {i}: " + "описание инцидента " * 4,
+         random.choice(CATEGORIES), random.choice(LOCATIONS), 'neutral',
+         random.choices([0, 1, 2, 3, 4], [40, 30, 15, 10, 5])[0], '{}',
+         time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - random.random() * 365 * 86400)))
+        for i in range(rows - count)
+    )
+    conn.executemany('''
+        INSERT INTO problems (text, category, location, sentiment, priority, metadata, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', data)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+    return rows
+
+
+# ========== СБОР ЗАПРОСОВ ==========
+class StatementTrace:
+    """Перехватывает все SQL, выполненные через sqlite3.connect"""
+
+    def __init__(self):
+        self.statements = []
+        self.lock = threading.Lock()
+        self.source = "backend"
+        self._connect = sqlite3.connect
+
+    def install(self):
+        def traced_connect(*args, **kwargs):
+            conn = self._connect(*args, **kwargs)
+            conn.set_trace_callback(self._record)
+            return conn
+        sqlite3.connect = traced_connect
+
+    def _record(self, sql):
+        with self.lock:
+            self.statements.append((self.source, sql))
+
+
+def literal_selects(path: str):
+    """Самостоятельные SELECT из исходника: строковые литералы без параметров"""
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            sql = node.value.strip()
+            if sql.upper().startswith('SELECT') and 'FROM' in sql.upper() and '?' not in sql:
+                yield sql
+
+
+def exercise_backend(db_path: str, trace: StatementTrace):
+    """Прогоняем эндпоинты бэкенда с разными фильтрами"""
+    sys.path.insert(0, BACK_DIR)
+    os.environ['DATABASE_URL'] = db_path
+
+    # Импорт бэкенда запускает парсер в фоне - для проверки он не нужен
+    popen = subprocess.Popen
+    subprocess.Popen = lambda *args, **kwargs: None
+    try:
+        import backend_with_websocket as backend
+    finally:
+        subprocess.Popen = popen
+
+    from fastapi.testclient import TestClient
+    from problems_repository import encode_cursor
+
+    deep_cursor = encode_cursor(1, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - 200 * 86400)), 0)
+    requests_to_run = [
+        '/api/problems',
+        '/api/problems?category=ЖКХ',
+        '/api/problems?priority=3',
+        '/api/problems?last_hours=24',
+        '/api/problems?category=Дороги&priority=2&last_hours=168',
+        '/api/problems?offset=5000',
+        f'/api/problems?cursor={deep_cursor}',
+        f'/api/problems?category=ЖКХ&cursor={deep_cursor}',
+        '/api/stats?timeframe=24h',
+        '/api/stats?timeframe=7d',
+        '/api/stats?timeframe=90d',
+        '/api/stats/timeseries?timeframe=90d&bucket=day',
+        '/api/trends?timeframe=90d&bucket=day',
+        '/api/trends?timeframe=90d&bucket=week&split_by=category_location&min_priority=2',
+        '/api/trends?timeframe=90d&locations=ул. Улица 1,ул. Улица 2&split_by=location',
+        '/api/trends?timeframe=7d&bucket=hour&categories=ЖКХ,Дороги',
+        '/api/clusters',
+        '/api/dashboard',
+    ]
+    with TestClient(backend.app) as client:
+        for url in requests_to_run:
+            response = client.get(url)
+            if response.status_code != 200:
+                print(f"   ⚠️ {url}: HTTP {response.status_code}")
+        with client.websocket_connect('/ws') as ws:
+            ws.send_json({"type": "get_stats"})
+            ws.receive_json()
+
+
+def exercise_integration(db_path: str, trace: StatementTrace):
+    """Кластеры и отчет интеграционного слоя на той же БД"""
+    import integration_layer
+
+    # Интеграционный слой берет путь к БД из backend_dir/data
+    data_root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(data_root, 'data'))
+    os.symlink(db_path, os.path.join(data_root, 'data', 'municipal_monitoring.db'))
+    integration_layer.backend_dir = data_root
+
+    trace.source = "integration"
+    integration_layer.init_database()
+    integration_layer.cluster_similar_problems()
+    integration_layer.create_clusters_from_problems()
+    integration_layer.generate_report()
+
+
+def collect_statements(db_path: str):
+    trace = StatementTrace()
+    trace.install()
+    exercise_backend(db_path, trace)
+    exercise_integration(db_path, trace)
+
+    for source, path in SOURCES.items():
+        for sql in literal_selects(path):
+            trace.statements.append((source, sql))
+
+    # Только чтения по problems; одинаковые запросы - один раз
+    seen = []
+    for source, sql in trace.statements:
+        normalized = re.sub(r'\s+', ' ', sql).strip()
+        if not normalized.upper().startswith('SELECT') or 'problems' not in normalized:
+            continue
+        # Литерал, с которого начинается уже выполненный запрос, - его заготовка
+        if any(other.startswith(normalized) for other in seen):
+            continue
+        seen.append(normalized)
+        yield source, normalized
+
+
+# ========== ПРОВЕРКА ПЛАНОВ ==========
+def check_plan(conn, source: str, sql: str):
+    try:
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()]
+    except sqlite3.Error:
+        # Литерал оказался куском запроса, который дописывается в коде
+        return None
+
+    started = time.perf_counter()
+    conn.execute(sql).fetchall()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    stops_early = ' LIMIT ' in sql.upper() and 'GROUP BY' not in sql.upper()
+    problems, warnings = [], []
+    for detail in plan:
+        if not re.match(r'SCAN problems\b', detail) and 'TEMP B-TREE' not in detail:
+            continue
+        if 'COVERING INDEX' in detail:
+            warnings.append(f"агрегат по всему индексу: {detail}")
+        elif 'USING INDEX' in detail:
+            if not stops_early:
+                problems.append(f"проход по всему индексу с чтением таблицы: {detail}")
+        elif detail.startswith('SCAN'):
+            problems.append(f"полный проход по таблице: {detail}")
+        else:
+            allowed = any(re.search(sql_pattern, sql) and re.search(plan_pattern, detail)
+                          for sql_pattern, plan_pattern, _ in ALLOWED_TEMP_BTREE)
+            if not allowed:
+                problems.append(f"сортировка во временном B-дереве: {detail}")
+
+    return {
+        "source": source,
+        "sql": sql,
+        "plan": plan,
+        "elapsed_ms": round(elapsed_ms, 2),
+        "problems": problems,
+        "warnings": warnings,
+        "failed": bool(problems) and source == "backend"
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN для всех запросов к problems")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Сколько строк в тестовой БД")
+    parser.add_argument('--db', help="Путь к тестовой БД (по умолчанию - временный файл)")
+    parser.add_argument('--keep', action='store_true', help="Не удалять тестовую БД")
+    parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'plans.db')
+    print(f"📁 Тестовая БД: {db_path}")
+
+    # Схема и индексы - ровно как у бэкенда при старте; индексы строим после
+    # заливки, так быстрее
+    sys.path.insert(0, BACK_DIR)
+    from migrations import create_base_schema, apply_migrations
+
+    conn = sqlite3.connect(db_path)
+    create_base_schema(conn)
+    conn.close()
+
+    started = time.time()
+    rows = seed_database(db_path, args.rows)
+    conn = sqlite3.connect(db_path)
+    apply_migrations(conn)
+    conn.execute('ANALYZE')
+    conn.commit()
+    print(f"🌱 Строк в problems: {rows} (подготовка {time.time() - started:.1f} с)")
+
+    results = [check_plan(conn, source, sql) for source, sql in collect_statements(db_path)]
+    results = [result for result in results if result]
+    conn.close()
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        for result in results:
+            mark = "❌" if result["failed"] else ("⚠️" if result["problems"] or result["warnings"] else "✅")
+            print(f"\n{mark} [{result['source']}] {result['elapsed_ms']} мс")
+            print(f"   {result['sql'][:160]}")
+            for detail in result["plan"]:
+                print(f"      {detail}")
+            for problem in result["problems"] + result["warnings"]:
+                print(f"   → {problem}")
+
+    failed = [result for result in results if result["failed"]]
+    print(f"\n📊 Запросов: {len(results)}, горячих с плохим планом: {len(failed)}")
+
+    if not args.keep and not args.db:
+        os.remove(db_path)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
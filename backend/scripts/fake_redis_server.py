@@ -0,0 +1,145 @@
+"""
+Локальная замена Redis для проверки шины воркеров (PUBSUB_URL=redis://...).
+
+Говорит на протоколе RESP2 и понимает ровно то, чем пользуется
+back/pubsub.py, плюс пару команд для отладки:
+    PING, AUTH, SELECT, QUIT
+    PUBLISH канал сообщение, SUBSCRIBE канал [канал ...]
+    SET ключ значение [NX] [EX секунды | PX миллисекунды], GET, DEL
+Данные только в памяти процесса.
+
+Запуск:
+    python fake_redis_server.py --port 6380
+    PUBSUB_URL=redis://127.0.0.1:6380/0 uvicorn backend_with_websocket:app --workers 4
+"""
+import time
+import asyncio
+import argparse
+import logging
+from collections import defaultdict
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# ========== ПРОТОКОЛ ==========
+def encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(encode(item) for item in value)
+    data = value if isinstance(value, bytes) else str(value).encode('utf-8')
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+
+async def read_command(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # Инлайн-команда (например, PING из telnet)
+        return line.decode().split()
+    args = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+# ========== СЕРВЕР ==========
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.subscribers = defaultdict(set)
+        self.stats = defaultdict(int)
+
+    def _alive(self, key) -> bool:
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed = set()
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                args = [arg.decode('utf-8') if isinstance(arg, bytes) else arg for arg in args]
+                command = args[0].upper()
+                self.stats[command] += 1
+
+                if command == "SUBSCRIBE":
+                    for channel in args[1:]:
+                        self.subscribers[channel].add(writer)
+                        subscribed.add(channel)
+                        writer.write(encode(["subscribe", channel, len(subscribed)]))
+                elif command == "QUIT":
+                    writer.write(b"+OK\r\n")
+                    break
+                else:
+                    writer.write(self.execute(command, args[1:]))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self.subscribers[channel].discard(writer)
+            writer.close()
+
+    def execute(self, command: str, args) -> bytes:
+        if command == "PING":
+            return b"+PONG\r\n"
+        if command in ("AUTH", "SELECT"):
+            return b"+OK\r\n"
+        if command == "PUBLISH":
+            channel, message = args[0], args[1]
+            receivers = list(self.subscribers.get(channel, ()))
+            for writer in receivers:
+                writer.write(encode(["message", channel, message]))
+            return encode(len(receivers))
+        if command == "SET":
+            return self._set(args)
+        if command == "GET":
+            return encode(self.data[args[0]] if self._alive(args[0]) else None)
+        if command == "DEL":
+            removed = sum(1 for key in args if self._alive(key) and self.data.pop(key, None) is not None)
+            return encode(removed)
+        return f"-ERR unknown command '{command}'\r\n".encode()
+
+    def _set(self, args) -> bytes:
+        key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+        if "NX" in options and self._alive(key):
+            return encode(None)
+
+        self.data[key] = value
+        self.expires.pop(key, None)
+        for unit, scale in (("EX", 1.0), ("PX", 0.001)):
+            if unit in options:
+                self.expires[key] = time.monotonic() + float(args[2 + options.index(unit) + 1]) * scale
+        return b"+OK\r\n"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Замена Redis для шины воркеров")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6380)
+    args = parser.parse_args()
+
+    redis = FakeRedis()
+    server = await asyncio.start_server(redis.handle, args.host, args.port)
+    logger.info(f"🧪 Fake Redis слушает {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,177 @@
+"""
+Локальная замена Telegram Bot API для проверки доставки оповещений.
+
+Понимает то, чем пользуются back/telegram_notifier.py и бот:
+    POST /bot{token}/getMe, /bot{token}/deleteWebhook
+    POST /bot{token}/sendMessage    - сообщение запоминается и видно в /mock/messages
+
+и ведет себя как настоящий API под нагрузкой: сообщение в чат чаще раза в
+--chat-interval секунд или больше --global-rate сообщений в секунду на бота
+получают 429 с parameters.retry_after; --flood-rate добавляет случайные 429,
+--forbidden-chats отвечают 403 (бот заблокирован), --missing-chats - 400
+"chat not found" (чат удален), текст длиннее 4096 символов - 400.
+
+Служебное: GET /mock/messages, GET /mock/stats, POST /mock/reset.
+
+Запуск:
+    python fake_telegram_server.py --port 9091 --chat-interval 1 --flood-rate 0.1
+    TELEGRAM_TOKEN=123:test TELEGRAM_API_URL=http://127.0.0.1:9091 TELEGRAM_ALERT_CHATS=1001,1002 \\
+        uvicorn backend_with_websocket:app
+"""
+import os
+import math
+import time
+import random
+import argparse
+import logging
+from collections import deque
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+
+
+class MockConfig:
+    def __init__(self, chat_interval: float, global_rate: float, flood_rate: float,
+                 flood_retry_after: int, forbidden_chats, missing_chats=()):
+        self.chat_interval = chat_interval
+        self.global_rate = global_rate
+        self.flood_rate = flood_rate
+        self.flood_retry_after = flood_retry_after
+        self.forbidden_chats = set(forbidden_chats)
+        self.missing_chats = set(missing_chats)
+
+
+class MockState:
+    def __init__(self):
+        self.messages = []
+        self.last_sent = {}
+        self.recent = deque()
+        self.stats = {"requests": 0, "sent": 0, "flood_waits": 0, "forbidden": 0, "bad_requests": 0}
+
+
+def telegram_error(status: int, description: str, retry_after: int = None) -> JSONResponse:
+    content = {"ok": False, "error_code": status, "description": description}
+    if retry_after is not None:
+        content["parameters"] = {"retry_after": retry_after}
+    return JSONResponse(status_code=status, content=content)
+
+
+# ========== ПРИЛОЖЕНИЕ ==========
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Fake Telegram Bot API", version="1.0.0")
+    state = MockState()
+
+    def check_limits(chat_id: int):
+        """retry_after в секундах, если сообщение сейчас отправлять нельзя"""
+        now = time.monotonic()
+        while state.recent and state.recent[0] <= now - 1:
+            state.recent.popleft()
+
+        if config.global_rate and len(state.recent) >= config.global_rate:
+            return max(1, math.ceil(state.recent[0] + 1 - now))
+        last = state.last_sent.get(chat_id)
+        if config.chat_interval and last is not None and now - last < config.chat_interval:
+            return max(1, math.ceil(last + config.chat_interval - now))
+        if random.random() < config.flood_rate:
+            return config.flood_retry_after
+        return None
+
+    @app.post("/bot{token}/{method}")
+    async def bot_method(token: str, method: str, request: Request):
+        # aiogram без файлов шлет application/x-www-form-urlencoded
+        body = (await request.body()).decode()
+        params = {key: values[-1] for key, values in parse_qs(body).items()}
+        if not params and request.headers.get("content-type", "").startswith("application/json"):
+            params = await request.json()
+        state.stats["requests"] += 1
+
+        if method == "getMe":
+            return {"ok": True, "result": {"id": int(token.split(':')[0]) if token.split(':')[0].isdigit() else 1,
+                                           "is_bot": True, "first_name": "Fake Bot", "username": "fake_bot"}}
+        if method in ("deleteWebhook", "close", "logOut"):
+            return {"ok": True, "result": True}
+        if method != "sendMessage":
+            return telegram_error(404, "Not Found: method not found")
+
+        chat_id = int(params.get("chat_id", 0))
+        text = params.get("text", "")
+
+        if chat_id in config.forbidden_chats:
+            state.stats["forbidden"] += 1
+            return telegram_error(403, "Forbidden: bot was blocked by the user")
+        if chat_id in config.missing_chats:
+            state.stats["bad_requests"] += 1
+            return telegram_error(400, "Bad Request: chat not found")
+        if not text or len(text) > MAX_MESSAGE_LENGTH:
+            state.stats["bad_requests"] += 1
+            return telegram_error(400, "Bad Request: message is too long" if text else "Bad Request: message text is empty")
+
+        retry_after = check_limits(chat_id)
+        if retry_after is not None:
+            state.stats["flood_waits"] += 1
+            return telegram_error(429, f"Too Many Requests: retry after {retry_after}", retry_after)
+
+        now = time.monotonic()
+        state.recent.append(now)
+        state.last_sent[chat_id] = now
+        state.stats["sent"] += 1
+
+        message = {
+            "message_id": len(state.messages) + 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+            "text": text
+        }
+        state.messages.append(message)
+        return {"ok": True, "result": message}
+
+    @app.get("/mock/messages")
+    async def mock_messages(chat_id: int = None):
+        messages = [m for m in state.messages if chat_id is None or m["chat"]["id"] == chat_id]
+        return {"messages": messages, "count": len(messages)}
+
+    @app.get("/mock/stats")
+    async def mock_stats():
+        return {**state.stats, "chats": len(state.last_sent)}
+
+    @app.post("/mock/reset")
+    async def mock_reset():
+        nonlocal state
+        state = MockState()
+        return {"status": "reset"}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('FAKE_TELEGRAM_PORT', 9091)))
+    parser.add_argument('--chat-interval', type=float, default=1.0, help="Секунд между сообщениями в один чат")
+    parser.add_argument('--global-rate', type=float, default=30.0, help="Сообщений в секунду на бота")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="Доля случайных ответов 429")
+    parser.add_argument('--flood-retry-after', type=int, default=2, help="retry_after случайных 429, секунд")
+    parser.add_argument('--forbidden-chats', default='', help="chat_id через запятую, которым отвечаем 403")
+    parser.add_argument('--missing-chats', default='', help="chat_id через запятую, которым отвечаем 400 chat not found")
+    args = parser.parse_args()
+
+    forbidden = [int(chat_id) for chat_id in args.forbidden_chats.split(',') if chat_id.strip()]
+    missing = [int(chat_id) for chat_id in args.missing_chats.split(',') if chat_id.strip()]
+    config = MockConfig(args.chat_interval, args.global_rate, args.flood_rate, args.flood_retry_after,
+                        forbidden, missing)
+
+    import uvicorn
+
+    logger.info(f"🧪 Fake Telegram Bot API: http://{args.host}:{args.port} (чат - раз в {args.chat_interval} с, "
+                f"{args.global_rate:g}/с на бота, случайных 429 {args.flood_rate:.0%})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Локальная замена GigaChat API для нагрузочных тестов и бенчмарков.
+
+Сервер говорит на том же протоколе, что и клиент `gigachat`:
+    POST /api/v2/oauth              - выдача access_token
+    GET  /api/v1/models             - список моделей
+    POST /api/v1/chat/completions   - ответ целиком или потоком (stream: true, SSE)
+
+Плюс приёмник-заглушка бэкенда POST /api/system_report[/batch] (чтобы гонять
+integration_layer без настоящей БД) и GET /mock/stats со счётчиками.
+
+Запуск:
+    python mock_gigachat_server.py --port 9090 --latency lognormal:800:0.5 --error-rate 0.02
+
+Клиент направляется на сервер переменными окружения:
+    GIGACHAT_BASE_URL=http://127.0.0.1:9090/api/v1
+    GIGACHAT_AUTH_URL=http://127.0.0.1:9090/api/v2/oauth
+"""
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import logging
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ответы по умолчанию: подбираются по ключевым словам из текста новости
+DEFAULT_ANSWERS = [
+    {
+        "keywords": ["дтп", "авария", "столкнов", "трасс", "екад"],
+        "answer": {"summary": "На дороге произошло ДТП, движение затруднено", "category": "Транспорт",
+                   "criticality": 2, "sentiment": "негативная", "emotion": "тревога/опасность",
+                   "location": "ЕКАД", "time_info": "сегодня", "source_preview": "Инцидент Екатеринбург"}
+    },
+    {
+        "keywords": ["мусор", "отопление", "вода", "прорыв", "лифт", "жкх"],
+        "answer": {"summary": "Жители жалуются на коммунальную проблему", "category": "ЖКХ",
+                   "criticality": 2, "sentiment": "негативная", "emotion": "раздражение",
+                   "location": "Уралмаш", "time_info": "утро", "source_preview": "Телеграм-канал"}
+    },
+    {
+        "keywords": ["мошен", "полиц", "суд", "задерж"],
+        "answer": {"summary": "Полиция предупреждает о новой схеме мошенничества", "category": "Безопасность",
+                   "criticality": 1, "sentiment": "негативная", "emotion": "тревога/опасность",
+                   "location": None, "time_info": "сегодня", "source_preview": "Новости Екб"}
+    },
+    {
+        "keywords": [],
+        "answer": {"summary": "Городская новость без признаков проблемы", "category": "Другое",
+                   "criticality": 0, "sentiment": "нейтральная", "emotion": "нейтрально",
+                   "location": None, "time_info": "сегодня", "source_preview": "Новости Екб"}
+    }
+]
+
+
+# ========== РАСПРЕДЕЛЕНИЕ ЗАДЕРЖЕК ==========
+def parse_latency(spec: str):
+    """
+    Формат: fixed:MS | uniform:MIN:MAX | normal:MEAN:STD | lognormal:MEDIAN:SIGMA
+    Возвращает функцию, отдающую задержку в секундах
+    """
+    kind, *params = spec.split(':')
+    params = [float(p) for p in params]
+
+    if kind == 'fixed':
+        return lambda: params[0] / 1000
+    if kind == 'uniform':
+        return lambda: random.uniform(params[0], params[1]) / 1000
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(params[0], params[1])) / 1000
+    if kind == 'lognormal':
+        median, sigma = params
+        return lambda: median * random.lognormvariate(0, sigma) / 1000
+    raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+
+class MockConfig:
+    def __init__(self, latency="lognormal:800:0.5", error_rate=0.0, rate_limit_rate=0.0,
+                 answers=None, chunk_size=16, chunk_delay_ms=5.0):
+        self.latency_spec = latency
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.answers = answers or DEFAULT_ANSWERS
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay_ms / 1000
+
+
+class MockStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.backend_reports = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~3 символа кириллицы на токен - для статистики заглушки достаточно
+    return max(1, len(text) // 3)
+
+
+def pick_answer(config: MockConfig, user_text: str) -> dict:
+    text_lower = user_text.lower()
+    for entry in config.answers:
+        keywords = entry.get("keywords", [])
+        if not keywords or any(word in text_lower for word in keywords):
+            return entry["answer"]
+    return config.answers[-1]["answer"]
+
+
+# ========== ПРИЛОЖЕНИЕ ==========
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock GigaChat", version="1.0.0")
+    stats = MockStats()
+
+    @app.post("/api/v2/oauth")
+    async def oauth():
+        return {
+            "access_token": f"mock-{uuid.uuid4().hex}",
+            "expires_at": int((time.time() + 1800) * 1000)
+        }
+
+    @app.get("/api/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "GigaChat", "object": "model", "owned_by": "mock"}]}
+
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        messages = payload.get("messages", [])
+        user_text = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        prompt_text = "".join(m.get("content", "") for m in messages)
+
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        try:
+            await asyncio.sleep(config.latency())
+
+            roll = random.random()
+            if roll < config.rate_limit_rate:
+                stats.rate_limited += 1
+                return JSONResponse(status_code=429, content={"status": 429, "message": "Too Many Requests"})
+            if roll < config.rate_limit_rate + config.error_rate:
+                stats.errors += 1
+                return JSONResponse(status_code=500, content={"status": 500, "message": "Internal Server Error"})
+
+            content = json.dumps(pick_answer(config, user_text), ensure_ascii=False, indent=4)
+            usage = {
+                "prompt_tokens": estimate_tokens(prompt_text),
+                "completion_tokens": estimate_tokens(content),
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            stats.prompt_tokens += usage["prompt_tokens"]
+            stats.completion_tokens += usage["completion_tokens"]
+
+            if payload.get("stream"):
+                return StreamingResponse(stream_chunks(content), media_type="text/event-stream")
+
+            return {
+                "choices": [{"message": {"role": "assistant", "content": content}, "index": 0,
+                             "finish_reason": "stop"}],
+                "created": int(time.time()),
+                "model": payload.get("model", "GigaChat"),
+                "usage": usage,
+                "object": "chat.completion"
+            }
+        finally:
+            stats.in_flight -= 1
+
+    async def stream_chunks(content: str):
+        created = int(time.time())
+        for start in range(0, len(content), config.chunk_size):
+            chunk = {
+                "choices": [{"delta": {"content": content[start:start + config.chunk_size]}, "index": 0}],
+                "created": created,
+                "model": "GigaChat",
+                "object": "chat.completion"
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(config.chunk_delay)
+        yield "data: [DONE]\n\n"
+
+    @app.post("/api/system_report")
+    async def system_report_sink(data: dict):
+        """Заглушка бэкенда: принимает данные интеграционного слоя и выбрасывает"""
+        stats.backend_reports += 1
+        return {"status": "success", "message": "mock"}
+
+    @app.post("/api/system_report/batch")
+    async def system_report_batch_sink(payload: dict):
+        problems = payload.get("problems", [])
+        stats.backend_reports += len(problems)
+        return {"status": "success", "saved": len(problems), "rejected": 0}
+
+    @app.get("/mock/stats")
+    async def mock_stats():
+        return {**stats.as_dict(), "latency": config.latency_spec, "error_rate": config.error_rate}
+
+    @app.post("/mock/reset")
+    async def mock_reset():
+        nonlocal stats
+        stats = MockStats()
+        return {"status": "reset"}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена GigaChat API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('MOCK_GIGACHAT_PORT', 9090)))
+    parser.add_argument('--latency', default='lognormal:800:0.5',
+                        help="fixed:MS | uniform:MIN:MAX | normal:MEAN:STD | lognormal:MEDIAN:SIGMA")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument('--answers', help="JSON-файл со списком {keywords: [...], answer: {...}}")
+    parser.add_argument('--chunk-size', type=int, default=16, help="Символов в одном SSE-чанке")
+    parser.add_argument('--chunk-delay-ms', type=float, default=5.0, help="Пауза между SSE-чанками")
+    args = parser.parse_args()
+
+    answers = None
+    if args.answers:
+        with open(args.answers, 'r', encoding='utf-8') as f:
+            answers = json.load(f)
+
+    config = MockConfig(args.latency, args.error_rate, args.rate_limit_rate, answers,
+                        args.chunk_size, args.chunk_delay_ms)
+
+    import uvicorn
+
+    logger.info(f"🧪 Mock GigaChat: http://{args.host}:{args.port} (задержка {args.latency}, "
+                f"ошибки {args.error_rate:.0%}, 429 {args.rate_limit_rate:.0%})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from aiogram.fsm.storage.memory import MemoryStorage  # Добавьте это
 import asyncio
 import os
 import logging  # Добавьте логирование
+import aiohttp
 from dotenv import load_dotenv
 
 # Настройка логирования
@@ -17,6 +18,13 @@ if not TELEGRAM_TOKEN:
     logger.error("❌ TELEGRAM_TOKEN не найден в .env файле!")
     exit(1)
 
+# Бэкенд, в котором бот подписывает чаты на оповещения (/alerts_on, /alerts_off)
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+# Токен для изменения подписок, тот же, что TELEGRAM_API_TOKEN бэкенда
+TELEGRAM_API_TOKEN = os.getenv("TELEGRAM_API_TOKEN", "")
+# Кому можно включать оповещения: user_id через запятую (пусто - никому)
+TELEGRAM_ADMIN_IDS = {int(user_id) for user_id in os.getenv("TELEGRAM_ADMIN_IDS", "").split(",") if user_id.strip()}
+
 # Используйте MemoryStorage для состояний (если они понадобятся в будущем)
 storage = MemoryStorage()
 bot = Bot(token=TELEGRAM_TOKEN)
@@ -54,7 +62,9 @@ async def cmd_help(message: types.Message):
     await message.answer(
         "ℹ️ *Доступные команды:*\n"
         "/start - запустить мини-приложение\n"
-        "/help - показать это сообщение\n\n"
+        "/help - показать это сообщение\n"
+        "/alerts\\_on - присылать в этот чат критические оповещения\n"
+        "/alerts\\_off - отключить оповещения\n\n"
         "*Как использовать:*\n"
         "1. Нажмите /start\n"
         "2. Нажмите кнопку 'Открыть AI-помощник'\n"
@@ -63,6 +73,44 @@ async def cmd_help(message: types.Message):
     )
 
 
+async def set_alerts(message: types.Message, enabled: bool):
+    """Подписка чата на оповещения через API бэкенда"""
+    if message.from_user is None or message.from_user.id not in TELEGRAM_ADMIN_IDS:
+        await message.answer("⛔ Оповещения может включать только администратор")
+        return
+
+    chat = message.chat
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10),
+                                         headers={"X-Api-Token": TELEGRAM_API_TOKEN}) as session:
+            if enabled:
+                title = chat.title or chat.full_name
+                response = await session.post(f"{BACKEND_URL}/api/telegram/subscriptions",
+                                              json={"chat_id": chat.id, "title": title})
+            else:
+                response = await session.delete(f"{BACKEND_URL}/api/telegram/subscriptions/{chat.id}")
+            response.raise_for_status()
+    except Exception as e:
+        logger.error(f"❌ Ошибка запроса к бэкенду: {e}")
+        await message.answer("⚠️ Бэкенд недоступен, попробуйте позже")
+        return
+
+    if enabled:
+        await message.answer("🔔 Критические оповещения будут приходить в этот чат")
+    else:
+        await message.answer("🔕 Оповещения отключены")
+
+
+@dp.message(Command("alerts_on"))
+async def cmd_alerts_on(message: types.Message):
+    await set_alerts(message, True)
+
+
+@dp.message(Command("alerts_off"))
+async def cmd_alerts_off(message: types.Message):
+    await set_alerts(message, False)
+
+
 @dp.message()
 async def handle_other_messages(message: types.Message):
     """Обработка всех остальных сообщений"""
@@ -0,0 +1,426 @@
+"""
+Нагрузочный тест WebSocket: сколько клиентов дашборда держит один процесс бэкенда.
+
+Открывает N соединений /ws; каждый клиент периодически шлет ping и get_stats,
+а тест пачками отправляет проблемы в /api/system_report и ждет, пока каждая
+дойдет до каждого клиента сообщением problem_created.
+
+Примеры:
+    # поднять бэкенд на копии БД и прогнать 2000 клиентов
+    python ws_load_test.py --spawn-server --clients 2000 --bursts 5 --burst-size 20
+
+    # против уже запущенного сервера (память - по pid процесса uvicorn)
+    python ws_load_test.py --url http://127.0.0.1:8000 --server-pid 12345 --clients 500
+
+    # сравнить с прошлым прогоном
+    python ws_load_test.py --spawn-server --clients 2000 --output after.json --baseline before.json
+
+Отчёт: время установки соединения, p50/p95/p99 задержки доставки (от POST
+до problem_created у клиента) и разброс между клиентами, RTT ping и
+get_stats, память сервера на соединение, потерянные сообщения, отключения
+и счетчики рассылки из /health.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import tempfile
+import argparse
+import contextlib
+import subprocess
+from collections import Counter, deque
+
+import aiohttp
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+DB_FILE = os.path.join(PROJECT_ROOT, 'data', 'municipal_monitoring.db')
+
+# По этому префиксу клиенты отличают свои проблемы от реальных
+MARKER = "ws-load-test"
+CATEGORIES = ["ЖКХ", "Дороги", "Транспорт", "Благоустройство", "Экология"]
+
+
+def percentile(values: list, p: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def latency_summary(seconds: list) -> dict:
+    return {
+        "count": len(seconds),
+        "p50": round(percentile(seconds, 50) * 1000, 1),
+        "p95": round(percentile(seconds, 95) * 1000, 1),
+        "p99": round(percentile(seconds, 99) * 1000, 1),
+        "max": round(max(seconds) * 1000, 1) if seconds else 0.0
+    }
+
+
+def raise_fd_limit(needed: int):
+    """Каждое соединение - дескриптор и у клиента, и у сервера"""
+    with contextlib.suppress(ImportError, ValueError, OSError):
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < needed:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(needed, soft)), hard))
+
+
+def rss_mb(pid: int):
+    """Резидентная память процесса (Linux, /proc)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def wait_for_port(host: str, port: int, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with contextlib.suppress(OSError):
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Бэкенд не поднялся на {host}:{port}")
+
+
+def spawn_server(port: int, workdir: str) -> subprocess.Popen:
+    """Бэкенд на копии БД, без парсера - тест не трогает рабочие данные"""
+    db_path = os.path.join(workdir, 'municipal_monitoring.db')
+    shutil.copy(DB_FILE, db_path)
+    env = {**os.environ, 'DATABASE_URL': db_path, 'RUN_PARSER': '0', 'PUBSUB_URL': 'local'}
+    command = [sys.executable, '-m', 'uvicorn', 'backend_with_websocket:app',
+               '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=os.path.join(PROJECT_ROOT, 'back'), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port('127.0.0.1', port)
+    return process
+
+
+# ========== КЛИЕНТ ==========
+class LoadClient:
+    """Одно соединение /ws: фоновый трафик и учет полученных сообщений"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.ws = None
+        self.connect_time = None
+        self.error = None
+        self.close_code = None
+        self.closing = False
+
+        self.received = Counter()
+        self.deliveries = {}
+        # Ответы на ping и get_stats приходят по порядку - хватает очереди времен отправки
+        self.pending = {"pong": deque(), "current_stats": deque()}
+        self.rtt = {"pong": [], "current_stats": []}
+        self.tasks = []
+
+    async def connect(self, session: aiohttp.ClientSession, ws_url: str, compress: int):
+        started = time.perf_counter()
+        try:
+            self.ws = await session.ws_connect(ws_url, compress=compress, max_msg_size=0, heartbeat=None)
+            self.connect_time = time.perf_counter() - started
+        except Exception as e:
+            self.error = type(e).__name__
+
+    def start(self, ping_interval: float, stats_interval: float):
+        self.tasks.append(asyncio.create_task(self._read()))
+        if ping_interval > 0:
+            self.tasks.append(asyncio.create_task(self._every(ping_interval, "ping", "pong")))
+        if stats_interval > 0:
+            self.tasks.append(asyncio.create_task(self._every(stats_interval, "get_stats", "current_stats")))
+
+    async def _every(self, interval: float, request: str, reply: str):
+        # Случайный сдвиг, чтобы тысячи клиентов не слали запросы в одну миллисекунду
+        await asyncio.sleep(random.uniform(0, interval))
+        while not self.ws.closed:
+            self.pending[reply].append(time.perf_counter())
+            try:
+                await self.ws.send_str(json.dumps({"type": request}))
+            except Exception:
+                return
+            await asyncio.sleep(interval)
+
+    async def _read(self):
+        with contextlib.suppress(Exception):
+            await self._receive()
+        # Код закрытия интересен, только если соединение закрыл сервер
+        if not self.closing:
+            self.close_code = self.ws.close_code or -1
+
+    async def _receive(self):
+        async for message in self.ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            now = time.perf_counter()
+            data = json.loads(message.data)
+            message_type = data.get("type")
+            self.received[message_type] += 1
+
+            if message_type == "problem_created":
+                text = (data.get("data") or {}).get("text") or ""
+                if text.startswith(MARKER):
+                    self.deliveries[int(text.split("#", 1)[1].split()[0])] = now
+            elif message_type in self.pending and self.pending[message_type]:
+                self.rtt[message_type].append(now - self.pending[message_type].popleft())
+
+    async def close(self):
+        self.closing = True
+        for task in self.tasks[1:]:
+            task.cancel()
+        if self.ws is not None and not self.ws.closed:
+            await self.ws.close()
+        if self.tasks:
+            with contextlib.suppress(Exception, asyncio.CancelledError):
+                await asyncio.wait_for(self.tasks[0], timeout=5)
+
+
+# ========== СЦЕНАРИЙ ==========
+async def fetch_health(session: aiohttp.ClientSession, base_url: str) -> dict:
+    with contextlib.suppress(Exception):
+        async with session.get(f"{base_url}/health") as response:
+            return await response.json()
+    return {}
+
+
+async def send_burst(session: aiohttp.ClientSession, base_url: str, first_seq: int, size: int, sent_at: dict) -> int:
+    """Пачка проблем параллельными POST; возвращает число неуспешных ответов"""
+    async def post(seq: int) -> bool:
+        problem = {
+            "text": f"{MARKER} #{seq} нагрузочный тест рассылки",
+            "category": CATEGORIES[seq % len(CATEGORIES)],
+            "location": f"ул. Тестовая {seq % 50}",
+            "priority": 1
+        }
+        sent_at[seq] = time.perf_counter()
+        try:
+            async with session.post(f"{base_url}/api/system_report", json=problem) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+    results = await asyncio.gather(*[post(first_seq + i) for i in range(size)])
+    return results.count(False)
+
+
+async def run(args, base_url: str, server_pid) -> dict:
+    ws_url = base_url.replace("http", "ws", 1) + "/ws"
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=args.connect_timeout)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        health_before = await fetch_health(session, base_url)
+        rss_before = rss_mb(server_pid) if server_pid else None
+
+        # 1. Соединения: не больше connect_concurrency одновременных рукопожатий
+        clients = [LoadClient(i) for i in range(args.clients)]
+        semaphore = asyncio.Semaphore(args.connect_concurrency)
+
+        async def connect(client: LoadClient):
+            async with semaphore:
+                await client.connect(session, ws_url, 15 if args.deflate else 0)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[connect(client) for client in clients])
+        connect_elapsed = time.perf_counter() - started
+
+        connected = [client for client in clients if client.ws is not None]
+        for client in connected:
+            client.start(args.ping_interval, args.stats_interval)
+        print(f"🔌 Подключено {len(connected)}/{args.clients} за {connect_elapsed:.1f} с")
+
+        await asyncio.sleep(args.warmup)
+        rss_connected = rss_mb(server_pid) if server_pid else None
+
+        # 2. Пачки проблем через /api/system_report
+        sent_at, post_errors, seq = {}, 0, 0
+        for burst in range(args.bursts):
+            post_errors += await send_burst(session, base_url, seq, args.burst_size, sent_at)
+            seq += args.burst_size
+            print(f"📨 Пачка {burst + 1}/{args.bursts} отправлена")
+            await asyncio.sleep(args.burst_interval)
+
+        # 3. Ждем доставки всем живым клиентам (или settle секунд)
+        deadline = time.perf_counter() + args.settle
+        while time.perf_counter() < deadline:
+            alive = [client for client in connected if not client.ws.closed]
+            if all(len(client.deliveries) >= len(sent_at) for client in alive):
+                break
+            await asyncio.sleep(0.1)
+
+        rss_after = rss_mb(server_pid) if server_pid else None
+        health_after = await fetch_health(session, base_url)
+
+        for client in connected:
+            await client.close()
+
+    return build_report(args, clients, connect_elapsed, sent_at, post_errors,
+                        (rss_before, rss_connected, rss_after), health_before, health_after)
+
+
+# ========== ОТЧЁТ ==========
+def build_report(args, clients: list, connect_elapsed: float, sent_at: dict, post_errors: int,
+                 rss: tuple, health_before: dict, health_after: dict) -> dict:
+    connected = [client for client in clients if client.ws is not None]
+
+    delivery_latency, spread = [], []
+    for seq, sent in sent_at.items():
+        received = [client.deliveries[seq] for client in connected if seq in client.deliveries]
+        delivery_latency.extend(at - sent for at in received)
+        if received:
+            spread.append(max(received) - min(received))
+
+    expected = len(connected) * len(sent_at)
+    delivered = sum(len(client.deliveries) for client in connected)
+    close_codes = Counter(str(client.close_code) for client in connected if client.close_code is not None)
+
+    rss_before, rss_connected, rss_after = rss
+    per_connection_kb = None
+    if rss_before is not None and rss_connected is not None and connected:
+        per_connection_kb = round((rss_connected - rss_before) * 1024 / len(connected), 1)
+
+    fanout_before = health_before.get("websocket_fanout") or {}
+    fanout_after = health_after.get("websocket_fanout") or {}
+    fanout_delta = {key: value - fanout_before.get(key, 0)
+                    for key, value in fanout_after.items()
+                    if key in ("broadcasts", "delivered", "dropped", "slow_disconnects")}
+
+    return {
+        "config": {
+            "clients": args.clients,
+            "connect_concurrency": args.connect_concurrency,
+            "ping_interval_s": args.ping_interval,
+            "stats_interval_s": args.stats_interval,
+            "bursts": args.bursts,
+            "burst_size": args.burst_size,
+            "deflate": args.deflate,
+            "cpu_count": os.cpu_count()
+        },
+        "connect": {
+            "ok": len(connected),
+            "failed": len(clients) - len(connected),
+            "errors": dict(Counter(client.error for client in clients if client.error)),
+            "elapsed_s": round(connect_elapsed, 2),
+            "per_s": round(len(connected) / connect_elapsed, 1) if connect_elapsed else 0.0,
+            "latency_ms": latency_summary([client.connect_time for client in connected])
+        },
+        "delivery": {
+            "problems_sent": len(sent_at),
+            "post_errors": post_errors,
+            "expected": expected,
+            "delivered": delivered,
+            "lost": expected - delivered,
+            "latency_ms": latency_summary(delivery_latency),
+            "spread_ms": latency_summary(spread)
+        },
+        "rtt_ms": {
+            "ping": latency_summary([rtt for client in connected for rtt in client.rtt["pong"]]),
+            "get_stats": latency_summary([rtt for client in connected for rtt in client.rtt["current_stats"]])
+        },
+        "memory": {
+            "rss_before_mb": round(rss_before, 1) if rss_before is not None else None,
+            "rss_connected_mb": round(rss_connected, 1) if rss_connected is not None else None,
+            "rss_after_mb": round(rss_after, 1) if rss_after is not None else None,
+            "per_connection_kb": per_connection_kb
+        },
+        "disconnects": {
+            "closed_by_server": sum(close_codes.values()),
+            "codes": dict(close_codes)
+        },
+        "server": {
+            "fanout": fanout_delta,
+            "max_client_queue": fanout_after.get("max_client_queue"),
+            "write_queue": health_after.get("write_queue")
+        }
+    }
+
+
+# Ключевые метрики для сравнения прогонов: путь в отчёте -> подпись
+COMPARE_METRICS = [
+    (("connect", "latency_ms", "p95"), "подключение p95, мс"),
+    (("delivery", "latency_ms", "p50"), "доставка p50, мс"),
+    (("delivery", "latency_ms", "p99"), "доставка p99, мс"),
+    (("delivery", "lost"), "потеряно сообщений"),
+    (("rtt_ms", "ping", "p95"), "ping p95, мс"),
+    (("rtt_ms", "get_stats", "p95"), "get_stats p95, мс"),
+    (("memory", "per_connection_kb"), "память на соединение, КБ"),
+    (("disconnects", "closed_by_server"), "отключено сервером"),
+]
+
+
+def compare(baseline: dict, report: dict):
+    def pick(data, path):
+        for key in path:
+            data = (data or {}).get(key)
+        return data
+
+    print("\n📊 Сравнение с базовым прогоном:")
+    for path, title in COMPARE_METRICS:
+        before, after = pick(baseline, path), pick(report, path)
+        change = ""
+        if isinstance(before, (int, float)) and isinstance(after, (int, float)) and before:
+            change = f" ({(after - before) / before * 100:+.0f}%)"
+        print(f"   {title}: {before} → {after}{change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест WebSocket-рассылки")
+    parser.add_argument('--url', default=None, help="Адрес уже запущенного бэкенда")
+    parser.add_argument('--spawn-server', action='store_true', help="Поднять бэкенд на копии БД на время теста")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--server-pid', type=int, default=None, help="pid процесса бэкенда для замера памяти")
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--connect-concurrency', type=int, default=100)
+    parser.add_argument('--connect-timeout', type=float, default=30.0)
+    parser.add_argument('--ping-interval', type=float, default=10.0, help="Секунд между ping клиента (0 - не слать)")
+    parser.add_argument('--stats-interval', type=float, default=30.0, help="Секунд между get_stats клиента (0 - не слать)")
+    parser.add_argument('--bursts', type=int, default=5)
+    parser.add_argument('--burst-size', type=int, default=20)
+    parser.add_argument('--burst-interval', type=float, default=2.0)
+    parser.add_argument('--warmup', type=float, default=2.0, help="Пауза после подключения перед замером памяти")
+    parser.add_argument('--settle', type=float, default=30.0, help="Сколько ждать доставки после последней пачки")
+    parser.add_argument('--no-deflate', dest='deflate', action='store_false', help="Без permessage-deflate")
+    parser.add_argument('--output', help="Сохранить отчёт в JSON")
+    parser.add_argument('--baseline', help="Отчёт прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    raise_fd_limit(args.clients * 2 + 256)
+
+    base_url = (args.url or f"http://127.0.0.1:{args.port}").rstrip("/")
+    workdir = tempfile.mkdtemp(prefix="ws_load_") if args.spawn_server else None
+    server = spawn_server(args.port, workdir) if args.spawn_server else None
+    server_pid = server.pid if server else args.server_pid
+
+    try:
+        report = asyncio.run(run(args, base_url, server_pid))
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                compare(json.load(f), report)
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"📄 Отчёт сохранён: {args.output}")
+
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()